@@ -0,0 +1,177 @@
+"""ASGI entry point backed by the async Playwright checker.
+
+Run with:
+    hypercorn src.api.asgi_server:app --bind 0.0.0.0:5000
+"""
+from quart import Quart, request, jsonify
+from quart_cors import cors
+import asyncio
+import os
+import uuid
+import logging
+from .captcha_handler import load_captcha_handler
+from .async_checker import AsyncBrowserPool, AsyncVisaStatusChecker, run_auto_check
+
+app = cors(Quart(__name__))
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+captcha_handler = load_captcha_handler(model_path=os.environ.get('CAPTCHA_MODEL_PATH', 'captcha.onnx'))
+browser_pool = AsyncBrowserPool()
+
+# Sessions waiting for a manual CAPTCHA solution; all touched only from the event loop
+sessions = {}
+
+REQUIRED_FIELDS = ['location', 'application_id', 'passport_number', 'surname']
+
+def missing_fields_response():
+    return jsonify({
+        'success': False,
+        'error': 'Missing required fields: location, application_id, passport_number, surname'
+    }), 400
+
+async def cleanup_expired_sessions():
+    """Close sessions whose CAPTCHA was never submitted"""
+    while True:
+        for session_id, checker in list(sessions.items()):
+            if checker.is_expired():
+                sessions.pop(session_id, None)
+                await checker.close_browser()
+                logger.info(f"Cleaned up expired session: {session_id}")
+        await asyncio.sleep(60)
+
+@app.before_serving
+async def startup():
+    await browser_pool.start()
+    app.add_background_task(cleanup_expired_sessions)
+
+@app.after_serving
+async def shutdown():
+    for checker in list(sessions.values()):
+        await checker.close_browser()
+    sessions.clear()
+    await browser_pool.close()
+
+@app.route('/api/health', methods=['GET'])
+async def health_check():
+    """Health check endpoint"""
+    # A remote solver is pinged over its socket; keep that off the event loop
+    status = await asyncio.to_thread(captcha_handler.health)
+    readiness = await asyncio.to_thread(captcha_handler.readiness)
+    return jsonify({
+        'status': status,
+        'service': 'visa-status-checker',
+        'captcha_solver': readiness,
+        'active_sessions': len(sessions),
+        'browser_pool': browser_pool.stats()
+    })
+
+@app.route('/api/visa-status/check-auto', methods=['POST'])
+async def check_visa_status_auto():
+    """Check visa status with automatic CAPTCHA solving"""
+    try:
+        data = await request.get_json()
+        if not data or not all(data.get(field) for field in REQUIRED_FIELDS):
+            return missing_fields_response()
+
+        if captcha_handler.state == 'loading':
+            return jsonify({
+                'success': False,
+                'error': 'CAPTCHA solver is still loading, retry shortly'
+            }), 503
+
+        # A lazy handler loads here; keep that off the event loop
+        await asyncio.to_thread(captcha_handler.load)
+        if not captcha_handler.supports_auto_solve:
+            return jsonify({
+                'success': False,
+                'error': 'Automatic CAPTCHA solving not available. ONNX model not loaded.'
+            }), 400
+
+        result = await run_auto_check(
+            browser_pool, captcha_handler,
+            data['location'], data['application_id'], data['passport_number'], data['surname'],
+            data.get('max_retries', 3)
+        )
+        return jsonify(result) if result['success'] else (jsonify(result), 400)
+
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/visa-status/start', methods=['POST'])
+async def start_visa_check():
+    """Start the visa status check process and return the CAPTCHA image"""
+    checker = None
+    try:
+        data = await request.get_json()
+        if not data or not all(data.get(field) for field in REQUIRED_FIELDS):
+            return missing_fields_response()
+
+        checker = AsyncVisaStatusChecker(str(uuid.uuid4()), browser_pool)
+        await checker.start_browser()
+        if not await checker.navigate_to_visa_status_page():
+            raise Exception('Failed to navigate to visa status page')
+        if not await checker.fill_form(data['location'], data['application_id'],
+                                       data['passport_number'], data['surname']):
+            raise Exception('Failed to fill form')
+        captcha_image = await checker.get_captcha_image()
+        if not captcha_image:
+            raise Exception('Failed to get CAPTCHA image')
+
+        sessions[checker.session_id] = checker
+        return jsonify({
+            'success': True,
+            'session_id': checker.session_id,
+            'captcha_image': captcha_image,
+            'message': 'Please solve the CAPTCHA and submit using /api/visa-status/submit endpoint with the session_id'
+        })
+
+    except Exception as e:
+        if checker:
+            await checker.close_browser()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/visa-status/submit', methods=['POST'])
+async def submit_visa_check():
+    """Submit the CAPTCHA solution and get visa status"""
+    data = await request.get_json() or {}
+    session_id = data.get('session_id')
+    captcha_solution = data.get('captcha_solution')
+
+    if not session_id:
+        return jsonify({'success': False, 'error': 'Missing session_id'}), 400
+    if not captcha_solution:
+        return jsonify({'success': False, 'error': 'Missing captcha_solution'}), 400
+
+    checker = sessions.pop(session_id, None)
+    if not checker:
+        return jsonify({'success': False, 'error': 'Invalid or expired session'}), 400
+
+    try:
+        if checker.is_expired():
+            return jsonify({'success': False, 'error': 'Session expired'}), 400
+        result = await checker.submit_with_captcha(captcha_solution)
+        return jsonify(result) if result['success'] else (jsonify(result), 400)
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        await checker.close_browser()
+
+@app.route('/api/visa-status/cancel', methods=['POST'])
+async def cancel_visa_check():
+    """Cancel an active session"""
+    data = await request.get_json() or {}
+    session_id = data.get('session_id')
+    if not session_id:
+        return jsonify({'success': False, 'error': 'Missing session_id'}), 400
+
+    checker = sessions.pop(session_id, None)
+    if not checker:
+        return jsonify({'success': False, 'error': 'Session not found'}), 404
+
+    await checker.close_browser()
+    return jsonify({'success': True, 'message': 'Session cancelled successfully'})
+
+if __name__ == '__main__':
+    app.run(host='0.0.0.0', port=5000)
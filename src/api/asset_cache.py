@@ -0,0 +1,243 @@
+"""Static-asset cache shared by every browser context in the process.
+
+New contexts start with an empty HTTP cache, so each check used to download
+CEAC's WebResource.axd/ScriptResource.axd bundles, stylesheets, fonts and
+images again. The cache serves those from memory through context.route. It
+keeps entries by URL together with their ETag/Last-Modified validators and
+revalidates stale ones with a conditional request. A byte budget with LRU
+eviction bounds its size. The form document, XHR postbacks and the CAPTCHA
+image always go upstream.
+
+The cache is on by default for the asyncio backend only, where the event
+loop dispatches route handlers as requests arrive. Sync Playwright runs route
+handlers only while the owning thread is inside a Playwright call, and every
+request costs a round trip through Python, so sync contexts opt in with
+ASSET_CACHE_SYNC=1. With it set, the page pool's warm pages use the cache too,
+but they give up their background navigation: it would stall on the routed
+requests, so the page navigates when it is handed out instead.
+
+Register the cache before the request policy. Playwright runs the most
+recently registered handler first, so blocked requests never reach the cache.
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+import logging
+from .captcha_capture import CAPTCHA_IMAGE_URL_PATTERN
+
+logger = logging.getLogger(__name__)
+
+ASSET_CACHE_ENABLED = os.environ.get('ASSET_CACHE_ENABLED', '1') == '1'
+ASSET_CACHE_SYNC = os.environ.get('ASSET_CACHE_SYNC', '0') == '1'  # Also route sync checker contexts through the cache
+ASSET_CACHE_MAX_BYTES = int(float(os.environ.get('ASSET_CACHE_MAX_MB', 64)) * 1024 * 1024)
+ASSET_CACHE_MAX_ENTRY_BYTES = int(float(os.environ.get('ASSET_CACHE_MAX_ENTRY_MB', 4)) * 1024 * 1024)
+ASSET_CACHE_TTL = int(os.environ.get('ASSET_CACHE_TTL', 3600))  # Seconds before an entry is revalidated
+
+CACHEABLE_RESOURCE_TYPES = frozenset({'script', 'stylesheet', 'font', 'image'})
+# The body is stored decoded, so these no longer describe it
+DROPPED_HEADERS = frozenset({'content-encoding', 'content-length', 'transfer-encoding', 'set-cookie'})
+MAX_AGE_PATTERN = re.compile(r'max-age=(\d+)')
+
+def replayable_headers(headers):
+    return {name: value for name, value in headers.items() if name.lower() not in DROPPED_HEADERS}
+
+class CachedAsset:
+    def __init__(self, status, headers, body, ttl):
+        self.status = status
+        self.headers = replayable_headers(headers)
+        self.body = body
+        self.ttl = ttl
+        self.etag = headers.get('etag')
+        self.last_modified = headers.get('last-modified')
+        self.stored_at = time.monotonic()
+
+    def fresh(self):
+        return time.monotonic() - self.stored_at < self.ttl
+
+    def validators(self):
+        """Conditional request headers for revalidation"""
+        headers = {}
+        if self.etag:
+            headers['if-none-match'] = self.etag
+        if self.last_modified:
+            headers['if-modified-since'] = self.last_modified
+        return headers
+
+class AssetCache:
+    def __init__(self, max_bytes=ASSET_CACHE_MAX_BYTES, max_entry_bytes=ASSET_CACHE_MAX_ENTRY_BYTES,
+                 ttl=ASSET_CACHE_TTL):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'revalidated': 0, 'stored': 0, 'evictions': 0,
+                         'bypassed': 0, 'errors': 0, 'bytes_served': 0}
+
+    def _count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def cacheable_request(self, request):
+        return (request.method == 'GET'
+                and request.resource_type in CACHEABLE_RESOURCE_TYPES
+                and not CAPTCHA_IMAGE_URL_PATTERN.search(request.url))
+
+    def entry_ttl(self, headers):
+        """Seconds the response may be served without revalidation, or None if it must not be stored"""
+        cache_control = headers.get('cache-control', '').lower()
+        if 'no-store' in cache_control or 'private' in cache_control or 'set-cookie' in headers:
+            return None
+        if 'no-cache' in cache_control:
+            return 0
+        match = MAX_AGE_PATTERN.search(cache_control)
+        return min(int(match.group(1)), self.ttl) if match else self.ttl
+
+    def lookup(self, url):
+        with self.lock:
+            entry = self.entries.get(url)
+            if entry is not None:
+                self.entries.move_to_end(url)
+            return entry
+
+    def store(self, url, status, headers, body):
+        ttl = self.entry_ttl(headers)
+        if status != 200 or ttl is None or len(body) > self.max_entry_bytes:
+            return
+        entry = CachedAsset(status, headers, body, ttl)
+        with self.lock:
+            previous = self.entries.pop(url, None)
+            if previous is not None:
+                self.size -= len(previous.body)
+            self.entries[url] = entry
+            self.size += len(body)
+            self.counters['stored'] += 1
+            while self.size > self.max_bytes and self.entries:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted.body)
+                self.counters['evictions'] += 1
+
+    def _serve(self, entry):
+        self._count('hits')
+        self._count('bytes_served', len(entry.body))
+        return {'status': entry.status, 'headers': entry.headers, 'body': entry.body}
+
+    def handle(self, route):
+        """Sync Playwright route handler"""
+        request = route.request
+        if not self.cacheable_request(request):
+            self._count('bypassed')
+            route.fallback()
+            return
+
+        entry = self.lookup(request.url)
+        if entry is not None and entry.fresh():
+            route.fulfill(**self._serve(entry))
+            return
+
+        try:
+            headers = {**request.headers, **(entry.validators() if entry else {})}
+            response = route.fetch(headers=headers)
+            if response.status == 304 and entry is not None:
+                entry.stored_at = time.monotonic()
+                self._count('revalidated')
+                route.fulfill(**self._serve(entry))
+                return
+            body = response.body()
+        except Exception as e:
+            logger.debug(f"Asset cache fetch failed for {request.url}: {e}")
+            self._count('errors')
+            route.fallback()
+            return
+
+        self._count('misses')
+        self.store(request.url, response.status, response.headers, body)
+        route.fulfill(status=response.status, headers=replayable_headers(response.headers), body=body)
+
+    async def handle_async(self, route):
+        """Async Playwright route handler"""
+        request = route.request
+        if not self.cacheable_request(request):
+            self._count('bypassed')
+            await route.fallback()
+            return
+
+        entry = self.lookup(request.url)
+        if entry is not None and entry.fresh():
+            await route.fulfill(**self._serve(entry))
+            return
+
+        try:
+            headers = {**request.headers, **(entry.validators() if entry else {})}
+            response = await route.fetch(headers=headers)
+            if response.status == 304 and entry is not None:
+                entry.stored_at = time.monotonic()
+                self._count('revalidated')
+                await route.fulfill(**self._serve(entry))
+                return
+            body = await response.body()
+        except Exception as e:
+            logger.debug(f"Asset cache fetch failed for {request.url}: {e}")
+            self._count('errors')
+            await route.fallback()
+            return
+
+        self._count('misses')
+        self.store(request.url, response.status, response.headers, body)
+        await route.fulfill(status=response.status, headers=replayable_headers(response.headers), body=body)
+
+    def attach(self, context):
+        """Serve a sync BrowserContext's static assets from the cache"""
+        context.route('**/*', self.handle)
+        return context
+
+    async def attach_async(self, context):
+        """Serve an async BrowserContext's static assets from the cache"""
+        await context.route('**/*', self.handle_async)
+        return context
+
+    def stats(self):
+        with self.lock:
+            lookups = self.counters['hits'] + self.counters['misses']
+            return {
+                'entries': len(self.entries),
+                'bytes': self.size,
+                'max_bytes': self.max_bytes,
+                **self.counters,
+                'hit_rate': self.counters['hits'] / lookups if lookups else 0.0
+            }
+
+# One cache per process so every context and browser shares it
+_asset_cache = None
+_asset_cache_lock = threading.Lock()
+
+def get_asset_cache():
+    """Process-wide asset cache, or None when disabled"""
+    global _asset_cache
+    if not ASSET_CACHE_ENABLED:
+        return None
+    with _asset_cache_lock:
+        if _asset_cache is None:
+            _asset_cache = AssetCache()
+        return _asset_cache
+
+def attach_asset_cache(context):
+    """Attach the shared cache to a sync context if it is enabled for sync contexts"""
+    cache = get_asset_cache() if ASSET_CACHE_SYNC else None
+    if cache:
+        cache.attach(context)
+    return context
+
+async def attach_asset_cache_async(context):
+    """Attach the shared cache to an async context if it is enabled"""
+    cache = get_asset_cache()
+    if cache:
+        await cache.attach_async(context)
+    return context
+
+def asset_cache_stats():
+    cache = get_asset_cache()
+    return cache.stats() if cache else {'enabled': False}
@@ -0,0 +1,507 @@
+"""Asyncio backend for the CEAC visa status check.
+
+AsyncVisaStatusChecker mirrors VisaStatusChecker stage by stage using
+playwright.async_api, so one event loop can multiplex many in-flight checks
+instead of pinning an OS thread to each one.
+"""
+from playwright.async_api import async_playwright
+from datetime import datetime
+import asyncio
+import base64
+import itertools
+import os
+import uuid
+import logging
+from .browser_pool import (BROWSER_LAUNCH_ARGS, BROWSER_POOL_MAX_SIZE, BROWSER_MAX_USES,
+                           CONTEXT_OPTIONS, STEALTH_INIT_SCRIPT)
+from .page_pool import CEAC_NIV_STATUS_URL
+from . import readiness
+from . import result_extractor
+from . import location_index
+from .captcha_handler import is_confident, captcha_key
+from .captcha_capture import CaptchaImageCapture
+from .request_policy import get_request_policy
+from .asset_cache import attach_asset_cache_async
+from .storage_state import seed_context_options, capture_storage_state_async, invalidate_storage_state
+
+logger = logging.getLogger(__name__)
+
+ASYNC_MAX_IN_FLIGHT = int(os.environ.get('ASYNC_MAX_IN_FLIGHT', 32))  # Concurrent checks per process
+ASYNC_PAGES_PER_BROWSER = int(os.environ.get('ASYNC_PAGES_PER_BROWSER', 16))  # Concurrent checks (tabs) per browser
+# Hold new checks while MemAvailable is below this (0 disables the watermark)
+MEMORY_LOW_WATERMARK_MB = int(os.environ.get('MEMORY_LOW_WATERMARK_MB', 512))
+MEMORY_POLL_INTERVAL = 0.5  # Seconds between MemAvailable reads while held
+SESSION_TIMEOUT = 300  # 5 minutes timeout
+CAPTCHA_MAX_REFRESHES = int(os.environ.get('CAPTCHA_MAX_REFRESHES', 3))
+CAPTCHA_CAPTURE_MODE = os.environ.get('CAPTCHA_CAPTURE_MODE', 'network')
+
+CAPTCHA_IMAGE_SELECTOR = readiness.CAPTCHA_IMAGE_SELECTOR
+SUBMIT_BUTTON_SELECTOR = '#ctl00_ContentPlaceHolder1_btnSubmit'
+
+def available_memory_mb():
+    """MemAvailable from /proc/meminfo in MiB, or None where it cannot be read"""
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) // 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+class AsyncBrowserPool:
+    """Browsers shared by every check on the event loop, each check running in its own tab.
+
+    Each tab gets a fresh context, so checks share nothing but the browser
+    process. Tabs cannot share a context: cookies belong to the context, and
+    the ASP.NET session holds the BotDetect code, so tabs in one context would
+    queue behind each other and overwrite each other's CAPTCHA.
+
+    New tabs wait while every browser is at pages_per_browser, or while the
+    host's MemAvailable is below the watermark and other checks are running.
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, size=BROWSER_POOL_MAX_SIZE, max_uses=BROWSER_MAX_USES,
+                 max_in_flight=ASYNC_MAX_IN_FLIGHT, pages_per_browser=ASYNC_PAGES_PER_BROWSER,
+                 memory_watermark_mb=MEMORY_LOW_WATERMARK_MB, headless=True):
+        self.size = max(1, size)
+        self.max_uses = max_uses
+        self.max_in_flight = max_in_flight
+        self.pages_per_browser = max(1, pages_per_browser)
+        self.memory_watermark_mb = memory_watermark_mb
+        self.headless = headless
+        self.playwright = None
+        self.browsers = []
+        self.slots = asyncio.Semaphore(max_in_flight)
+        self.lock = asyncio.Lock()
+        # Signalled whenever a tab closes, for checks waiting on a full browser
+        self.capacity = asyncio.Condition(self.lock)
+        self.in_flight = 0
+        self.leases = 0
+        self.waits = {'browser_full': 0, 'memory': 0}
+
+    async def start(self):
+        async with self.lock:
+            if self.playwright is None:
+                self.playwright = await async_playwright().start()
+            while len(self.browsers) < self.size:
+                await self._launch()
+        return self
+
+    async def _launch(self):
+        browser = await self.playwright.chromium.launch(headless=self.headless, args=BROWSER_LAUNCH_ARGS)
+        entry = {'id': next(self._ids), 'browser': browser, 'uses': 0, 'active': 0}
+        self.browsers.append(entry)
+        logger.info(f"Launched async browser #{entry['id']}")
+        return entry
+
+    def _exhausted(self, entry):
+        return self.max_uses and entry['uses'] >= self.max_uses
+
+    async def _wait_for_memory(self):
+        """Hold a new check while memory is below the watermark, unless nothing else is running to free it"""
+        if not self.memory_watermark_mb:
+            return
+        counted = False
+        while True:
+            available = available_memory_mb()
+            in_flight = sum(e['active'] for e in self.browsers)
+            if available is None or available >= self.memory_watermark_mb or in_flight == 0:
+                return
+            if not counted:
+                counted = True
+                self.waits['memory'] += 1
+                logger.warning(f"MemAvailable {available} MiB below watermark {self.memory_watermark_mb} MiB, "
+                               f"holding new check until one of {in_flight} finishes")
+            await asyncio.sleep(MEMORY_POLL_INTERVAL)
+
+    async def _acquire_browser(self):
+        async with self.capacity:
+            if self.playwright is None:
+                self.playwright = await async_playwright().start()
+            counted = False
+            while True:
+                # Recycle browsers that crashed or served their quota and are idle
+                for entry in list(self.browsers):
+                    if not entry['browser'].is_connected() or (self._exhausted(entry) and entry['active'] == 0):
+                        self.browsers.remove(entry)
+                        try:
+                            await entry['browser'].close()
+                        except Exception:
+                            pass
+                usable = [e for e in self.browsers if e['browser'].is_connected() and not self._exhausted(e)]
+                if len(usable) < self.size:
+                    usable.append(await self._launch())
+                open_browsers = [e for e in usable if e['active'] < self.pages_per_browser]
+                if open_browsers:
+                    break
+                if not counted:
+                    counted = True
+                    self.waits['browser_full'] += 1
+                await self.capacity.wait()
+            entry = min(open_browsers, key=lambda e: e['active'])
+            entry['uses'] += 1
+            entry['active'] += 1
+            self.leases += 1
+            return entry
+
+    async def open_tab(self, **context_options):
+        """Wait for capacity and open a page for one check; close it with close_tab"""
+        await self.slots.acquire()
+        self.in_flight += 1
+        try:
+            await self._wait_for_memory()
+            entry = await self._acquire_browser()
+            context = None
+            try:
+                # Start from the last good cookies so the navigation can skip the challenge
+                storage_state_version, seed_options = seed_context_options()
+                context = await entry['browser'].new_context(**{**CONTEXT_OPTIONS, **seed_options,
+                                                                **context_options})
+                await attach_asset_cache_async(context)
+                await get_request_policy().attach_async(context)
+                page = await context.new_page()
+            except Exception:
+                if context is not None:
+                    try:
+                        await context.close()
+                    except Exception:
+                        pass
+                await self._release_browser(entry)
+                raise
+            return {'entry': entry, 'context': context, 'page': page,
+                    'storage_state_version': storage_state_version}
+        except Exception:
+            self._release_slot()
+            raise
+
+    def _release_slot(self):
+        self.in_flight -= 1
+        self.slots.release()
+
+    async def _release_browser(self, entry):
+        async with self.capacity:
+            entry['active'] = max(0, entry['active'] - 1)
+            self.capacity.notify()
+
+    async def close_tab(self, tab):
+        """Close a check's tab along with its context"""
+        try:
+            await tab['context'].close()
+        except Exception as e:
+            logger.warning(f"Error closing async tab: {str(e)}")
+        await self._release_browser(tab['entry'])
+        self._release_slot()
+
+    async def close(self):
+        for entry in self.browsers:
+            try:
+                await entry['browser'].close()
+            except Exception:
+                pass
+        self.browsers = []
+        if self.playwright:
+            await self.playwright.stop()
+            self.playwright = None
+
+    def stats(self):
+        return {
+            'max_in_flight': self.max_in_flight,
+            'in_flight': self.in_flight,
+            'pages_per_browser': self.pages_per_browser,
+            'memory_watermark_mb': self.memory_watermark_mb,
+            'memory_available_mb': available_memory_mb(),
+            'waits': dict(self.waits),
+            'leases': self.leases,
+            'browsers': [{'id': e['id'], 'uses': e['uses'], 'active': e['active']} for e in self.browsers]
+        }
+
+async def _wait_for_selector(page, selector, deadline, state='attached'):
+    try:
+        return await page.wait_for_selector(selector, state=state, timeout=deadline.remaining_ms())
+    except Exception:
+        return None
+
+async def _wait_for_condition(page, script, deadline):
+    try:
+        await page.wait_for_function(script, timeout=deadline.remaining_ms())
+        return True
+    except Exception:
+        return False
+
+class AsyncVisaStatusChecker:
+    def __init__(self, session_id, browser_pool):
+        self.session_id = session_id
+        self.browser_pool = browser_pool
+        self.tab = None
+        self.context = None
+        self.page = None
+        self.created_at = datetime.now()
+        self.form_values = None
+        self.last_captcha_src = None
+        self.captcha_capture = None
+        self.storage_state_version = None
+
+    async def start_browser(self):
+        """Open a tab in one of the shared browsers"""
+        self.tab = await self.browser_pool.open_tab()
+        self.context = self.tab['context']
+        self.page = self.tab['page']
+        self.storage_state_version = self.tab['storage_state_version']
+        # Keep the CAPTCHA image response so its bytes can go straight to the solver
+        self.captcha_capture = CaptchaImageCapture().attach(self.page)
+        self.page.set_default_timeout(90000)
+        await self.page.add_init_script(STEALTH_INIT_SCRIPT)
+
+    async def close_browser(self):
+        """Close the tab and return its slot to the pool"""
+        if self.tab:
+            await self.browser_pool.close_tab(self.tab)
+            self.tab = None
+            self.context = None
+
+    def is_expired(self):
+        return (datetime.now() - self.created_at).total_seconds() > SESSION_TIMEOUT
+
+    async def navigate_to_visa_status_page(self):
+        """Navigate to the NIV form and wait for its fields"""
+        try:
+            response = await self.page.goto(CEAC_NIV_STATUS_URL, wait_until='domcontentloaded', timeout=60000)
+            if response and response.status != 200:
+                logger.error(f"Got status code: {response.status}")
+                invalidate_storage_state(self.storage_state_version, f"navigation returned {response.status}")
+                return False
+
+            ready = await _wait_for_selector(self.page, readiness.FORM_FIELD_SELECTOR,
+                                             readiness.Deadline(readiness.NAVIGATION_READY_TIMEOUT))
+            if not ready and await self.page.evaluate(readiness.CLOUDFLARE_CHALLENGE_SCRIPT):
+                logger.warning("Detected Cloudflare challenge, waiting for clearance")
+                # The seeded clearance was not accepted
+                invalidate_storage_state(self.storage_state_version, 'Cloudflare challenged a seeded context')
+                ready = await _wait_for_selector(self.page, readiness.FORM_FIELD_SELECTOR,
+                                                 readiness.Deadline(readiness.CLOUDFLARE_CLEARANCE_TIMEOUT))
+            if ready:
+                await capture_storage_state_async(self.context)
+                return True
+            logger.error("Could not find expected NIV form fields")
+            invalidate_storage_state(self.storage_state_version, 'NIV form did not load')
+            return False
+        except Exception as e:
+            logger.error(f"Error navigating to page: {str(e)}")
+            return False
+
+    async def fill_form(self, location, application_id, passport_number, surname):
+        """Fill the visa status check form"""
+        try:
+            deadline = readiness.Deadline(readiness.FORM_READY_TIMEOUT)
+            await _wait_for_condition(self.page, readiness.POSTBACK_IDLE_SCRIPT, deadline)
+            await _wait_for_condition(self.page, readiness.FORM_READY_SCRIPT, deadline)
+
+            dropdown_selector = '#Location_Dropdown'
+            if await self.page.locator(dropdown_selector).count() == 0:
+                dropdown_selector = 'select[id*="Location_Dropdown"]'
+
+            dropdown = self.page.locator(dropdown_selector)
+            location_found = False
+            option_value = None
+            for refresh in (False, True):
+                # Second pass: rebuild from the live dropdown, as a cached index may be out of date
+                index = None if refresh else location_index.get_cached_index()
+                if index is None:
+                    options = await self.page.evaluate(location_index.OPTIONS_SCRIPT, dropdown_selector)
+                    if not options:
+                        logger.error("Could not find location dropdown")
+                        return False
+                    index = location_index.store_index(options)
+                option_value = index.lookup(location)
+                if not option_value:
+                    continue
+                try:
+                    await dropdown.select_option(value=option_value, timeout=5000)
+                    logger.info(f"Selected location: {index.label_for(option_value)} (value: {option_value})")
+                    location_found = True
+                    break
+                except Exception as e:
+                    logger.warning(f"Cached location value {option_value} rejected: {e}")
+                    location_index.invalidate_index()
+
+            if not location_found:
+                try:
+                    await dropdown.select_option(label=location, timeout=5000)
+                    option_value = None
+                except Exception:
+                    logger.error(f"Could not find location '{location}' in dropdown options")
+                    return False
+            self.form_values = {'location': option_value}
+
+            for selector, value in (('#Visa_Case_Number', application_id),
+                                    ('#Passport_Number', passport_number),
+                                    ('#Surname', surname)):
+                field = self.page.locator(selector)
+                if await field.count() == 0:
+                    field = self.page.locator(f'input[id*="{selector[1:]}"]')
+                if await field.count() == 0:
+                    logger.error(f"Could not find field {selector}")
+                    return False
+                await field.fill(value)
+            self.form_values.update({
+                'application_id': application_id,
+                'passport_number': passport_number,
+                'surname': surname
+            })
+            return True
+        except Exception as e:
+            logger.error(f"Error filling form: {str(e)}")
+            return False
+
+    async def get_captcha_bytes(self):
+        """Get the raw CAPTCHA image bytes, from the network response when possible"""
+        try:
+            captcha_element = self.page.locator(CAPTCHA_IMAGE_SELECTOR)
+            await captcha_element.wait_for(state='visible', timeout=10000)
+            self.last_captcha_src = await captcha_element.evaluate('img => img.src')
+            if CAPTCHA_CAPTURE_MODE == 'network' and self.captcha_capture:
+                response = self.captcha_capture.response_for(self.last_captcha_src)
+                if response:
+                    try:
+                        return await response.body()
+                    except Exception as e:
+                        logger.warning(f"Could not read CAPTCHA response body, using screenshot: {e}")
+            return await captcha_element.screenshot()
+        except Exception as e:
+            logger.error(f"Error getting CAPTCHA: {str(e)}")
+            return None
+
+    async def get_captcha_image(self):
+        """Get the CAPTCHA image as base64"""
+        captcha_bytes = await self.get_captcha_bytes()
+        if not captcha_bytes:
+            return None
+        return base64.b64encode(captcha_bytes).decode('utf-8')
+
+    async def refresh_captcha(self):
+        """Load a new CAPTCHA image in place, keeping the filled form"""
+        try:
+            previous = await self.page.evaluate(readiness.CAPTCHA_RELOAD_SCRIPT, CAPTCHA_IMAGE_SELECTOR)
+            if previous is None:
+                return False
+            await self.page.wait_for_function(readiness.CAPTCHA_IMAGE_CHANGED_SCRIPT,
+                                              arg=[CAPTCHA_IMAGE_SELECTOR, previous],
+                                              timeout=readiness.CAPTCHA_RELOAD_TIMEOUT)
+            return True
+        except Exception as e:
+            logger.warning(f"CAPTCHA image did not refresh: {e}")
+            return False
+
+    async def retry_captcha(self, location, application_id, passport_number, surname):
+        """Get a new CAPTCHA after a rejected submission, re-filling only if the form state was lost"""
+        try:
+            state = await self.page.evaluate(readiness.FORM_STATE_SCRIPT, CAPTCHA_IMAGE_SELECTOR)
+        except Exception:
+            state = None
+        if readiness.form_state_matches(state, self.form_values):
+            if state['captcha_src'] and state['captcha_src'] != self.last_captcha_src:
+                return True
+            if await self.refresh_captcha():
+                return True
+
+        logger.info("Form state lost, reloading page and re-filling form")
+        await self.page.reload(wait_until='domcontentloaded')
+        await _wait_for_selector(self.page, readiness.FORM_FIELD_SELECTOR,
+                                 readiness.Deadline(readiness.NAVIGATION_READY_TIMEOUT))
+        return await self.fill_form(location, application_id, passport_number, surname)
+
+    async def submit_with_captcha(self, captcha_text):
+        """Submit form with CAPTCHA text"""
+        try:
+            captcha_field = self.page.locator('#Captcha')
+            if await captcha_field.count() == 0:
+                return {'success': False, 'error': 'Could not find CAPTCHA input field'}
+            await captcha_field.fill(captcha_text)
+
+            submit_button = self.page.locator(SUBMIT_BUTTON_SELECTOR)
+            if await submit_button.count() > 0:
+                await submit_button.click()
+            else:
+                await self.page.evaluate("""
+                    WebForm_DoPostBackWithOptions(new WebForm_PostBackOptions("ctl00$ContentPlaceHolder1$btnSubmit", "", true, "", "", false, true));
+                """)
+
+            deadline = readiness.Deadline(readiness.POSTBACK_TIMEOUT)
+            try:
+                await self.page.wait_for_load_state('domcontentloaded', timeout=deadline.remaining_ms())
+            except Exception:
+                pass
+            if not await _wait_for_selector(self.page, readiness.RESULT_SELECTOR, deadline, state='visible'):
+                logger.warning("Timeout waiting for result elements")
+            return await self.get_status_result()
+        except Exception as e:
+            logger.error(f"Error submitting form: {str(e)}")
+            return {'success': False, 'error': str(e)}
+
+    async def get_status_result(self):
+        """Extract the visa status from a single DOM snapshot"""
+        try:
+            await _wait_for_condition(self.page, readiness.POSTBACK_IDLE_SCRIPT,
+                                      readiness.Deadline(readiness.RESULT_SETTLE_TIMEOUT))
+            snapshot = await self.page.evaluate(result_extractor.SNAPSHOT_SCRIPT, result_extractor.snapshot_options())
+            result = result_extractor.parse_status_snapshot(snapshot)
+            if result:
+                try:
+                    await self.page.evaluate(result_extractor.CLOSE_POPUP_SCRIPT)
+                except Exception as e:
+                    logger.debug(f"Could not close result popup: {e}")
+                return result
+            return {'success': False, 'error': 'Could not find status information on the page'}
+        except Exception as e:
+            logger.error(f"Error getting status result: {str(e)}")
+            return {'success': False, 'error': str(e)}
+
+async def run_auto_check(browser_pool, captcha_handler, location, application_id, passport_number,
+                         surname, max_retries=3):
+    """Async counterpart of server.run_auto_check"""
+    checker = AsyncVisaStatusChecker(str(uuid.uuid4()), browser_pool)
+    try:
+        await checker.start_browser()
+        if not await checker.navigate_to_visa_status_page():
+            raise Exception('Failed to navigate to visa status page')
+        if not await checker.fill_form(location, application_id, passport_number, surname):
+            raise Exception('Failed to fill form')
+
+        result = None
+        attempt = 0
+        refreshes = 0
+        while attempt < max_retries:
+            captcha_bytes = await checker.get_captcha_bytes()
+            if not captcha_bytes:
+                raise Exception('Failed to get CAPTCHA image')
+
+            # Inference is CPU bound; keep it off the event loop
+            candidates = await asyncio.to_thread(captcha_handler.solve_candidates, captcha_bytes)
+            captcha_solution = candidates[0][0]
+
+            # Swap a low-confidence image instead of spending a postback on it
+            if not is_confident(candidates) and refreshes < CAPTCHA_MAX_REFRESHES:
+                refreshes += 1
+                if await checker.refresh_captcha():
+                    continue
+
+            attempt += 1
+            logger.info(f"CAPTCHA solution attempt {attempt}: {captcha_solution}")
+
+            result = await checker.submit_with_captcha(captcha_solution)
+            if result['success']:
+                break
+            if 'captcha' not in result.get('error', '').lower():
+                break
+            # The answer for this image was wrong; don't serve it from the cache again
+            await asyncio.to_thread(captcha_handler.invalidate, captcha_key(captcha_bytes))
+
+            logger.warning(f"CAPTCHA error, retrying... ({attempt}/{max_retries})")
+            await checker.retry_captcha(location, application_id, passport_number, surname)
+
+        return result if result else {'success': False, 'error': 'Failed after all retries'}
+    finally:
+        await checker.close_browser()
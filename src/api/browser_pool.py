@@ -0,0 +1,316 @@
+from playwright.sync_api import sync_playwright
+from datetime import datetime
+import itertools
+import os
+import threading
+from threading import Lock
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Pool sizing (overridable through the environment)
+BROWSER_POOL_MIN_SIZE = int(os.environ.get('BROWSER_POOL_MIN_SIZE', 1))
+BROWSER_POOL_MAX_SIZE = int(os.environ.get('BROWSER_POOL_MAX_SIZE', 2))
+BROWSER_MAX_USES = int(os.environ.get('BROWSER_MAX_USES', 50))  # Recycle a browser after this many leases
+BROWSER_MAX_CONTEXTS = int(os.environ.get('BROWSER_MAX_CONTEXTS', 8))  # Concurrent leases before launching another browser
+
+# Launch arguments shared by every pooled browser
+BROWSER_LAUNCH_ARGS = [
+    '--disable-blink-features=AutomationControlled',
+    '--disable-dev-shm-usage',
+    '--disable-web-security',
+    '--disable-features=IsolateOrigins,site-per-process',
+    '--no-sandbox',
+    '--disable-setuid-sandbox',
+    '--disable-accelerated-2d-canvas',
+    '--disable-gpu',
+    '--window-size=1920,1080',
+    '--start-maximized',
+    '--disable-infobars',
+    '--disable-extensions',
+    '--disable-automation',
+    '--disable-background-timer-throttling',
+    '--disable-backgrounding-occluded-windows',
+    '--disable-renderer-backgrounding'
+]
+
+# Options used for every checker context
+CONTEXT_OPTIONS = {
+    'viewport': {'width': 1920, 'height': 1080},
+    'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'locale': 'en-US',
+    'timezone_id': 'America/New_York',
+    'permissions': ['geolocation'],
+    'ignore_https_errors': True,
+    # Add extra headers to appear more legitimate
+    'extra_http_headers': {
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
+        'Accept-Language': 'en-US,en;q=0.9',
+        'Accept-Encoding': 'gzip, deflate, br',
+        'DNT': '1',
+        'Connection': 'keep-alive',
+        'Upgrade-Insecure-Requests': '1'
+    }
+}
+
+# Stealth mode script added to every checker page
+STEALTH_INIT_SCRIPT = """
+    // Override the navigator.webdriver property
+    Object.defineProperty(navigator, 'webdriver', {
+        get: () => undefined
+    });
+
+    // Override the chrome property
+    window.chrome = {
+        runtime: {},
+    };
+
+    // Override the permissions query
+    const originalQuery = window.navigator.permissions.query;
+    window.navigator.permissions.query = (parameters) => (
+        parameters.name === 'notifications' ?
+            Promise.resolve({ state: Notification.permission }) :
+            originalQuery(parameters)
+    );
+"""
+
+class PooledBrowser:
+    """A launched browser together with its usage bookkeeping"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, browser):
+        self.id = next(self._ids)
+        self.browser = browser
+        self.created_at = datetime.now()
+        self.uses = 0
+        self.active_leases = 0
+        self.crashed = False
+        self.retiring = False
+        browser.on('disconnected', lambda _: self._mark_crashed())
+
+    def _mark_crashed(self):
+        self.crashed = True
+
+    def is_healthy(self):
+        """Check that the browser process is still alive and connected"""
+        if self.crashed or self.retiring:
+            return False
+        try:
+            return self.browser.is_connected()
+        except Exception:
+            return False
+
+class BrowserLease:
+    """A context leased from a pooled browser; release it with BrowserPool.release"""
+
+    def __init__(self, pooled_browser, context):
+        self.pooled_browser = pooled_browser
+        self.context = context
+        self.released = False
+
+    @property
+    def browser(self):
+        return self.pooled_browser.browser
+
+class BrowserPool:
+    """Pool of pre-launched Chromium browsers handing out fresh contexts.
+
+    The sync Playwright API is bound to the thread that started it, so a pool
+    must only be used from the thread that created it; use get_browser_pool()
+    to obtain the pool owned by the calling thread. Health checks happen on
+    every acquire rather than from a background thread for the same reason.
+    """
+
+    def __init__(self, min_size=BROWSER_POOL_MIN_SIZE, max_size=BROWSER_POOL_MAX_SIZE,
+                 max_uses=BROWSER_MAX_USES, max_contexts=BROWSER_MAX_CONTEXTS, headless=True, launch_args=None):
+        self.min_size = max(0, min_size)
+        self.max_size = max(1, max_size, self.min_size)
+        self.max_uses = max_uses
+        self.max_contexts = max(1, max_contexts)
+        self.headless = headless
+        self.launch_args = launch_args or BROWSER_LAUNCH_ARGS
+        self.playwright = None
+        self.browsers = []
+        self.lock = Lock()
+        self.stats_counters = {
+            'launched': 0,
+            'recycled': 0,
+            'crashed': 0,
+            'leases': 0
+        }
+
+    def start(self):
+        """Start Playwright and launch the minimum number of browsers"""
+        if self.playwright is None:
+            self.playwright = sync_playwright().start()
+        while len(self.browsers) < self.min_size:
+            self._launch()
+        return self
+
+    def _launch(self):
+        """Launch a new browser and add it to the pool"""
+        browser = self.playwright.chromium.launch(
+            headless=self.headless,
+            args=self.launch_args
+        )
+        pooled = PooledBrowser(browser)
+        with self.lock:
+            self.browsers.append(pooled)
+            self.stats_counters['launched'] += 1
+        logger.info(f"Launched pooled browser #{pooled.id} ({len(self.browsers)}/{self.max_size})")
+        return pooled
+
+    def _discard(self, pooled):
+        """Remove a browser from the pool and close it"""
+        with self.lock:
+            if pooled in self.browsers:
+                self.browsers.remove(pooled)
+        try:
+            if pooled.browser.is_connected():
+                pooled.browser.close()
+        except Exception as e:
+            logger.warning(f"Error closing pooled browser #{pooled.id}: {str(e)}")
+
+    def _reap(self):
+        """Drop crashed browsers and close retiring ones that have no active leases"""
+        for pooled in list(self.browsers):
+            if pooled.crashed or not self._is_connected(pooled):
+                logger.warning(f"Pooled browser #{pooled.id} crashed, removing from pool")
+                self.stats_counters['crashed'] += 1
+                self._discard(pooled)
+            elif pooled.retiring and pooled.active_leases == 0:
+                logger.info(f"Recycling pooled browser #{pooled.id} after {pooled.uses} uses")
+                self.stats_counters['recycled'] += 1
+                self._discard(pooled)
+
+    def _is_connected(self, pooled):
+        try:
+            return pooled.browser.is_connected()
+        except Exception:
+            return False
+
+    def acquire(self):
+        """Pick the least loaded healthy browser, launching one if needed"""
+        if self.playwright is None:
+            self.start()
+        self._reap()
+
+        healthy = [b for b in self.browsers if b.is_healthy()]
+        available = [b for b in healthy if b.active_leases < self.max_contexts]
+        if available:
+            pooled = min(available, key=lambda b: b.active_leases)
+        elif len(self.browsers) < self.max_size:
+            pooled = self._launch()
+        elif healthy:
+            pooled = min(healthy, key=lambda b: b.active_leases)
+        else:
+            # Every browser is retiring with active leases; go over capacity briefly
+            pooled = self._launch()
+
+        pooled.uses += 1
+        pooled.active_leases += 1
+        if self.max_uses and pooled.uses >= self.max_uses:
+            pooled.retiring = True
+        self.stats_counters['leases'] += 1
+        return pooled
+
+    def new_context(self, **context_options):
+        """Lease a fresh BrowserContext from a pooled browser"""
+        options = dict(CONTEXT_OPTIONS)
+        options.update(context_options)
+
+        pooled = self.acquire()
+        try:
+            context = pooled.browser.new_context(**options)
+        except Exception:
+            # The browser is unusable; drop it and retry once on another one
+            pooled.active_leases -= 1
+            pooled.crashed = True
+            self._reap()
+            pooled = self.acquire()
+            context = pooled.browser.new_context(**options)
+        return BrowserLease(pooled, context)
+
+    def release(self, lease):
+        """Close the leased context and return its browser to the pool"""
+        if lease is None or lease.released:
+            return
+        lease.released = True
+        try:
+            lease.context.close()
+        except Exception as e:
+            logger.warning(f"Error closing leased context: {str(e)}")
+            lease.pooled_browser.crashed = not self._is_connected(lease.pooled_browser)
+        lease.pooled_browser.active_leases = max(0, lease.pooled_browser.active_leases - 1)
+        self._reap()
+
+        # Keep the pool topped up to its minimum size
+        while len([b for b in self.browsers if b.is_healthy()]) < self.min_size:
+            try:
+                self._launch()
+            except Exception as e:
+                logger.error(f"Failed to replenish browser pool: {str(e)}")
+                break
+
+    def close(self):
+        """Close every browser and stop Playwright"""
+        for pooled in list(self.browsers):
+            self._discard(pooled)
+        if self.playwright:
+            try:
+                self.playwright.stop()
+            except Exception as e:
+                logger.error(f"Error stopping playwright: {str(e)}")
+            self.playwright = None
+
+    def stats(self):
+        """Return pool statistics"""
+        with self.lock:
+            browsers = [{
+                'id': b.id,
+                'uses': b.uses,
+                'active_leases': b.active_leases,
+                'retiring': b.retiring,
+                'crashed': b.crashed,
+                'created_at': b.created_at.isoformat()
+            } for b in self.browsers]
+        return {
+            'min_size': self.min_size,
+            'max_size': self.max_size,
+            'max_uses': self.max_uses,
+            'max_contexts': self.max_contexts,
+            'browsers': browsers,
+            **self.stats_counters
+        }
+
+# One pool per thread, since sync Playwright objects are thread-affine
+_thread_pools = threading.local()
+_all_pools = []
+_all_pools_lock = Lock()
+
+def get_browser_pool(headless=True):
+    """Return the browser pool owned by the calling thread, creating it on first use"""
+    pool = getattr(_thread_pools, 'pool', None)
+    if pool is None:
+        pool = BrowserPool(headless=headless)
+        _thread_pools.pool = pool
+        with _all_pools_lock:
+            _all_pools.append(pool)
+    return pool
+
+def close_browser_pool():
+    """Close the browser pool owned by the calling thread, if any"""
+    pool = getattr(_thread_pools, 'pool', None)
+    if pool is None:
+        return
+    pool.close()
+    _thread_pools.pool = None
+    with _all_pools_lock:
+        if pool in _all_pools:
+            _all_pools.remove(pool)
+
+def browser_pool_stats():
+    """Aggregate statistics for every pool in this process"""
+    with _all_pools_lock:
+        return [pool.stats() for pool in _all_pools]
@@ -0,0 +1,39 @@
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+# BotDetect serves the CAPTCHA image from its handler, e.g. BotDetectCaptcha.ashx?get=image&c=...&t=...
+CAPTCHA_IMAGE_URL_PATTERN = re.compile(r'BotDetectCaptcha\.ashx\?.*get=image', re.IGNORECASE)
+
+class CaptchaImageCapture:
+    """Remembers the latest CAPTCHA image response seen by a context or page.
+
+    Handing the response body straight to the solver skips the element
+    screenshot (layout, paint and PNG encode in Chromium). Only the Response
+    object is kept in the event handler; its body is read later by the caller,
+    so this works with both the sync and async Playwright APIs.
+    """
+
+    def __init__(self):
+        self.response = None
+        self.captured = 0
+
+    def attach(self, target):
+        """Listen for responses on a BrowserContext or Page"""
+        target.on('response', self._on_response)
+        return self
+
+    def _on_response(self, response):
+        if CAPTCHA_IMAGE_URL_PATTERN.search(response.url):
+            self.response = response
+            self.captured += 1
+
+    def response_for(self, src):
+        """The captured response for the image currently shown at src, or None if it was not seen"""
+        response = self.response
+        if response is None or (src and response.url != src):
+            return None
+        if not response.ok:
+            return None
+        return response
@@ -4,81 +4,771 @@ import onnxruntime as ort
 import numpy as np
 import string
 from abc import ABC, abstractmethod
+from concurrent.futures import Future
+import hashlib
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Micro-batching settings (overridable through the environment)
+CAPTCHA_BATCH_SIZE = int(os.environ.get('CAPTCHA_BATCH_SIZE', 8))  # Max images per inference; 1 disables batching
+CAPTCHA_BATCH_WAIT_MS = float(os.environ.get('CAPTCHA_BATCH_WAIT_MS', 5))  # Max time to wait for a batch to fill
+
+# Solutions cached per image content; 0 disables the cache
+CAPTCHA_CACHE_SIZE = int(os.environ.get('CAPTCHA_CACHE_SIZE', 1024))
+
+# When the solver is built: 'background' (a loader thread started at startup), 'lazy' (on first use) or 'eager'
+CAPTCHA_LOAD_MODE = os.environ.get('CAPTCHA_LOAD_MODE', 'background')
+CAPTCHA_WARM_UP = os.environ.get('CAPTCHA_WARM_UP', '1') == '1'  # Run a blank inference right after loading the model
+
+# Unix socket of a shared solver daemon (python -m src.api.captcha_service); when set, no model is loaded in-process
+CAPTCHA_SOLVER_SOCKET = os.environ.get('CAPTCHA_SOLVER_SOCKET', '')
+
+# Candidate ranking: guesses whose sequence probability is below the threshold are not submitted
+CAPTCHA_N_BEST = int(os.environ.get('CAPTCHA_N_BEST', 3))
+CAPTCHA_MIN_CONFIDENCE = float(os.environ.get('CAPTCHA_MIN_CONFIDENCE', 0.5))
+
+# ONNX Runtime session settings. Threads of 0 keep ORT's default (one per physical core);
+# lower them on boxes that also run browser workers to avoid oversubscribing the CPU
+CAPTCHA_ORT_OPTIMIZATION_LEVEL = os.environ.get('CAPTCHA_ORT_OPTIMIZATION_LEVEL', 'all')  # disable, basic, extended or all
+CAPTCHA_ORT_INTRA_OP_THREADS = int(os.environ.get('CAPTCHA_ORT_INTRA_OP_THREADS', 0))
+CAPTCHA_ORT_INTER_OP_THREADS = int(os.environ.get('CAPTCHA_ORT_INTER_OP_THREADS', 0))
+CAPTCHA_ORT_EXECUTION_MODE = os.environ.get('CAPTCHA_ORT_EXECUTION_MODE', 'sequential')  # sequential or parallel
+CAPTCHA_ORT_ALLOW_SPINNING = os.environ.get('CAPTCHA_ORT_ALLOW_SPINNING', '1') == '1'  # Busy-wait between ops; 0 yields the CPU
+CAPTCHA_ORT_MEMORY_ARENA = os.environ.get('CAPTCHA_ORT_MEMORY_ARENA', '1') == '1'
+CAPTCHA_ORT_MEMORY_PATTERN = os.environ.get('CAPTCHA_ORT_MEMORY_PATTERN', '1') == '1'
+CAPTCHA_ORT_IO_BINDING = os.environ.get('CAPTCHA_ORT_IO_BINDING', '1') == '1'  # Run through IOBinding into reused output buffers
+# Optimized graph written on first load and loaded directly afterwards; empty disables the cache
+CAPTCHA_ORT_OPTIMIZED_MODEL_PATH = os.environ.get('CAPTCHA_ORT_OPTIMIZED_MODEL_PATH', '')
+
+# Which model file to load: 'float' is the model path as given, 'int8' its quantized
+# sibling <name>.int8.onnx (see tools/quantize_captcha_model.py)
+CAPTCHA_MODEL_VARIANT = os.environ.get('CAPTCHA_MODEL_VARIANT', 'float')
+CAPTCHA_MODEL_VARIANTS = ('float', 'int8')
+
+ORT_OPTIMIZATION_LEVELS = {
+    'disable': ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    'basic': ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    'extended': ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    'all': ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+}
+ORT_EXECUTION_MODES = {
+    'sequential': ort.ExecutionMode.ORT_SEQUENTIAL,
+    'parallel': ort.ExecutionMode.ORT_PARALLEL
+}
+
+# Model input geometry: (N, C, H, W) float32 in [0, 1]
+MODEL_INPUT_CHANNELS = 3
+MODEL_INPUT_HEIGHT = 50
+MODEL_INPUT_WIDTH = 200
+# Images within this relative size difference of the model input are resized bilinearly instead of with Lanczos
+CAPTCHA_RESIZE_TOLERANCE = float(os.environ.get('CAPTCHA_RESIZE_TOLERANCE', 0.1))
+
+# Model output classes; index 0 is the CTC blank
+CTC_CHARACTERS = '-' + string.digits + string.ascii_uppercase
+CTC_BLANK = 0
+
+def preprocess_captcha_image(image: bytes, out: np.ndarray = None) -> np.ndarray:
+    """Decode image bytes into a (C, H, W) float32 array, writing into out when given.
+    
+    Grayscale, paletted and alpha images are converted to RGB (transparent
+    pixels become white). An image already at the model size is not resampled,
+    one close to it is resized bilinearly, and anything else gets Lanczos.
+    """
+    size = (MODEL_INPUT_WIDTH, MODEL_INPUT_HEIGHT)
+    if out is None:
+        out = np.empty((MODEL_INPUT_CHANNELS, MODEL_INPUT_HEIGHT, MODEL_INPUT_WIDTH), dtype=np.float32)
+    
+    img = Image.open(BytesIO(image))
+    if img.mode in ('RGBA', 'LA', 'PA') or 'transparency' in img.info:
+        rgba = img.convert('RGBA')
+        alpha = rgba.getchannel('A')
+        if alpha.getextrema() == (255, 255):
+            img = rgba.convert('RGB')
+        else:
+            img = Image.new('RGB', rgba.size, (255, 255, 255))
+            img.paste(rgba, mask=alpha)
+    elif img.mode != 'RGB':
+        img = img.convert('RGB')
+    
+    if img.size != size:
+        width, height = img.size
+        close = (abs(width / MODEL_INPUT_WIDTH - 1) <= CAPTCHA_RESIZE_TOLERANCE
+                 and abs(height / MODEL_INPUT_HEIGHT - 1) <= CAPTCHA_RESIZE_TOLERANCE)
+        if close:
+            img = img.resize(size, Image.Resampling.BILINEAR)
+        else:
+            img = img.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+    
+    # (H, W, C) uint8 -> (C, H, W) float32, scaled in a single pass into the buffer
+    np.divide(np.asarray(img).transpose(2, 0, 1), 255.0, out=out, dtype=np.float32)
+    return out
+
+def preprocess_captcha_images(images: list, out: np.ndarray = None) -> np.ndarray:
+    """Decode a list of image bytes into an (N, C, H, W) float32 batch, writing into out when given"""
+    if out is None:
+        out = np.empty((len(images), MODEL_INPUT_CHANNELS, MODEL_INPUT_HEIGHT, MODEL_INPUT_WIDTH),
+                       dtype=np.float32)
+    for i, image in enumerate(images):
+        preprocess_captcha_image(image, out[i])
+    return out
+
+def resolve_model_path(model_path: str, variant: str = CAPTCHA_MODEL_VARIANT) -> str:
+    """Path of the requested model variant, e.g. captcha.onnx -> captcha.int8.onnx"""
+    if variant not in CAPTCHA_MODEL_VARIANTS:
+        raise ValueError(f"Unknown CAPTCHA model variant {variant!r}; expected one of {', '.join(CAPTCHA_MODEL_VARIANTS)}")
+    if variant == 'float':
+        return model_path
+    root, ext = os.path.splitext(model_path)
+    return f"{root}.{variant}{ext}"
+
+def create_session_options(optimization_level: str = CAPTCHA_ORT_OPTIMIZATION_LEVEL,
+                           intra_op_threads: int = CAPTCHA_ORT_INTRA_OP_THREADS,
+                           inter_op_threads: int = CAPTCHA_ORT_INTER_OP_THREADS,
+                           execution_mode: str = CAPTCHA_ORT_EXECUTION_MODE,
+                           allow_spinning: bool = CAPTCHA_ORT_ALLOW_SPINNING,
+                           memory_arena: bool = CAPTCHA_ORT_MEMORY_ARENA,
+                           memory_pattern: bool = CAPTCHA_ORT_MEMORY_PATTERN) -> ort.SessionOptions:
+    """Build ONNX Runtime session options for the CAPTCHA model"""
+    if optimization_level not in ORT_OPTIMIZATION_LEVELS:
+        raise ValueError(f"Unknown ORT optimization level {optimization_level!r}; "
+                         f"expected one of {', '.join(ORT_OPTIMIZATION_LEVELS)}")
+    if execution_mode not in ORT_EXECUTION_MODES:
+        raise ValueError(f"Unknown ORT execution mode {execution_mode!r}; "
+                         f"expected one of {', '.join(ORT_EXECUTION_MODES)}")
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ORT_OPTIMIZATION_LEVELS[optimization_level]
+    options.intra_op_num_threads = intra_op_threads
+    options.inter_op_num_threads = inter_op_threads
+    options.execution_mode = ORT_EXECUTION_MODES[execution_mode]
+    options.enable_cpu_mem_arena = memory_arena
+    options.enable_mem_pattern = memory_pattern
+    options.add_session_config_entry('session.intra_op.allow_spinning', '1' if allow_spinning else '0')
+    options.add_session_config_entry('session.inter_op.allow_spinning', '1' if allow_spinning else '0')
+    return options
+
+def optimized_cache_path(optimized_model_path: str, session_options: ort.SessionOptions) -> str:
+    """Cache file for the session's optimization level and the available providers.
+    
+    e.g. captcha.opt.onnx -> captcha.opt.all.cpu.onnx, so changing
+    CAPTCHA_ORT_OPTIMIZATION_LEVEL or the installed providers never reuses a
+    file optimized for other settings.
+    """
+    level = next((name for name, value in ORT_OPTIMIZATION_LEVELS.items()
+                  if value == session_options.graph_optimization_level), 'custom')
+    providers = '-'.join(provider.replace('ExecutionProvider', '').lower()
+                         for provider in ort.get_available_providers())
+    root, ext = os.path.splitext(optimized_model_path)
+    return f"{root}.{level}.{providers}{ext}"
+
+def load_inference_session(model_path: str, session_options: ort.SessionOptions = None,
+                           optimized_model_path: str = CAPTCHA_ORT_OPTIMIZED_MODEL_PATH) -> ort.InferenceSession:
+    """Create an inference session, going through the optimized-model cache when one is configured.
+    
+    The first load optimizes the source model and writes the result next to
+    optimized_model_path, under a name keyed on the optimization level and
+    providers (see optimized_cache_path); later loads read that file with graph
+    optimization turned off. The cache is rebuilt when the source model is
+    newer. Since extended and all levels can emit hardware-specific nodes, keep
+    the cache on the machine that wrote it.
+    """
+    if session_options is None:
+        session_options = create_session_options()
+    if not optimized_model_path:
+        return ort.InferenceSession(model_path, sess_options=session_options)
+    optimized_model_path = optimized_cache_path(optimized_model_path, session_options)
+    
+    if (os.path.exists(optimized_model_path)
+            and os.path.getmtime(optimized_model_path) >= os.path.getmtime(model_path)):
+        level = session_options.graph_optimization_level
+        session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+        try:
+            session = ort.InferenceSession(optimized_model_path, sess_options=session_options)
+            logger.info(f"Loaded optimized CAPTCHA model from {optimized_model_path}")
+            return session
+        except Exception as e:
+            logger.warning(f"Could not load optimized model {optimized_model_path}, rebuilding it: {e}")
+            session_options.graph_optimization_level = level
+    
+    session_options.optimized_model_filepath = optimized_model_path
+    session = ort.InferenceSession(model_path, sess_options=session_options)
+    logger.info(f"Wrote optimized CAPTCHA model to {optimized_model_path}")
+    return session
+
+def captcha_key(image: bytes) -> str:
+    """Content hash identifying a CAPTCHA image"""
+    return hashlib.blake2b(image, digest_size=16).hexdigest()
+
+def softmax(logits: np.ndarray, axis: int = -1) -> np.ndarray:
+    """Numerically stable softmax"""
+    shifted = logits - logits.max(axis=axis, keepdims=True)
+    exp = np.exp(shifted)
+    return exp / exp.sum(axis=axis, keepdims=True)
+
+def ctc_greedy_decode(logits: np.ndarray, characters: str = CTC_CHARACTERS, blank: int = CTC_BLANK) -> list:
+    """Greedy CTC decoding of a whole batch of (N, T, classes) logits at once.
+    
+    Takes the argmax per timestep, collapses runs of the same class and drops
+    blanks using array masks. Returns one (text, confidences) pair per item,
+    where confidences holds the highest probability within each kept run.
+    """
+    probs = softmax(logits.astype(np.float32, copy=False))
+    best = probs.argmax(axis=-1)
+    best_prob = np.take_along_axis(probs, best[..., np.newaxis], axis=-1)[..., 0]
+    n, t = best.shape
+    
+    # A run starts at the first timestep of each item and wherever the class changes
+    run_start = np.ones((n, t), dtype=bool)
+    run_start[:, 1:] = best[:, 1:] != best[:, :-1]
+    starts = np.flatnonzero(run_start.ravel())
+    
+    run_labels = best.ravel()[starts]
+    run_conf = np.maximum.reduceat(best_prob.ravel(), starts)
+    run_rows = starts // t
+    
+    keep = run_labels != blank
+    run_labels, run_conf, run_rows = run_labels[keep], run_conf[keep], run_rows[keep]
+    
+    charset = np.array(list(characters))
+    boundaries = np.searchsorted(run_rows, np.arange(n + 1))
+    results = []
+    for i in range(n):
+        lo, hi = boundaries[i], boundaries[i + 1]
+        results.append((''.join(charset[run_labels[lo:hi]]), run_conf[lo:hi].tolist()))
+    return results
+
+def ctc_beam_search(probs: np.ndarray, beam_width: int = 10, n_best: int = CAPTCHA_N_BEST,
+                    characters: str = CTC_CHARACTERS, blank: int = CTC_BLANK, prune: float = 1e-3) -> list:
+    """CTC prefix beam search over one (T, classes) probability matrix.
+    
+    Returns up to n_best (text, probability) pairs, most likely first, where
+    probability sums over every alignment of the text kept in the beam.
+    Classes below the prune threshold at a timestep are not expanded.
+    """
+    # prefix -> [probability ending in blank, probability ending in non-blank]
+    beams = {(): [1.0, 0.0]}
+    for step in probs:
+        step = step.tolist()
+        expand = [c for c, p in enumerate(step) if p >= prune]
+        next_beams = {}
+        for prefix, (p_blank, p_non_blank) in beams.items():
+            total = p_blank + p_non_blank
+            last = prefix[-1] if prefix else None
+            for c in expand:
+                p = step[c]
+                if c == blank:
+                    next_beams.setdefault(prefix, [0.0, 0.0])[0] += total * p
+                    continue
+                extended = next_beams.setdefault(prefix + (c,), [0.0, 0.0])
+                if c == last:
+                    # A repeat only extends the text after a blank; otherwise it collapses
+                    extended[1] += p_blank * p
+                    next_beams.setdefault(prefix, [0.0, 0.0])[1] += p_non_blank * p
+                else:
+                    extended[1] += total * p
+        ranked = sorted(next_beams.items(), key=lambda item: item[1][0] + item[1][1], reverse=True)
+        beams = dict(ranked[:beam_width])
+    
+    ranked = sorted(beams.items(), key=lambda item: item[1][0] + item[1][1], reverse=True)[:n_best]
+    return [(''.join(characters[c] for c in prefix), p_blank + p_non_blank)
+            for prefix, (p_blank, p_non_blank) in ranked]
+
+def is_confident(candidates: list, min_confidence: float = CAPTCHA_MIN_CONFIDENCE) -> bool:
+    """Whether the best candidate is worth a submission; unknown probabilities always are"""
+    if not candidates or not candidates[0][0]:
+        return False
+    probability = candidates[0][1]
+    return probability is None or probability >= min_confidence
+
 class CaptchaHandle(ABC):
     """Base class for CAPTCHA handlers"""
     
+    # Whether solve() returns an answer without human input
+    supports_auto_solve = False
+    
     @abstractmethod
     def solve(self, image: bytes) -> str:
         """Solve the CAPTCHA from image bytes"""
         pass
+    
+    def solve_candidates(self, image: bytes, n_best: int = CAPTCHA_N_BEST) -> list:
+        """Return up to n_best (text, probability) candidates, most likely first.
+        
+        The probability is None when the handler cannot estimate it.
+        """
+        return [(self.solve(image), None)]
+    
+    def invalidate(self, key: str) -> None:
+        """Forget any stored answer for the image with this captcha_key, e.g. after the site rejected it"""
+        pass
+    
+    def stats(self) -> dict:
+        """Solver metrics"""
+        return {'handler': type(self).__name__}
+    
+    def available(self) -> bool:
+        """Whether the solver can serve requests right now; in-process solvers always can"""
+        return True
 
 class OnnxCaptchaHandle(CaptchaHandle):
     """ONNX-based CAPTCHA solver for CEAC"""
     
-    def __init__(self, onnx_model_path: str = 'captcha.onnx') -> None:
+    supports_auto_solve = True
+    
+    def __init__(self, onnx_model_path: str = 'captcha.onnx', session_options: ort.SessionOptions = None,
+                 optimized_model_path: str = CAPTCHA_ORT_OPTIMIZED_MODEL_PATH,
+                 use_io_binding: bool = CAPTCHA_ORT_IO_BINDING) -> None:
         super().__init__()
         self.__onnx_model_path = onnx_model_path
+        # Input/output buffers and the IO binding are reused between runs, one set per calling thread
+        self.__buffers = threading.local()
         try:
-            # Test loading the model
-            self.__ort_sess = ort.InferenceSession(self.__onnx_model_path)
-            logger.info(f"ONNX model loaded successfully from {onnx_model_path}")
+            started = time.monotonic()
+            self.__ort_sess = load_inference_session(onnx_model_path, session_options, optimized_model_path)
+            self.__load_ms = (time.monotonic() - started) * 1000
+            self.__session_options = self.__ort_sess.get_session_options()
+            logger.info(f"ONNX model loaded successfully from {onnx_model_path} in {self.__load_ms:.0f} ms")
         except Exception as e:
             logger.error(f"Failed to load ONNX model: {e}")
             raise
+        
+        self.__input_name = self.__ort_sess.get_inputs()[0].name
+        output = self.__ort_sess.get_outputs()[0]
+        self.__output_name = output.name
+        # Output is (T, N, classes); binding needs T and classes fixed to size the buffers up front
+        steps, classes = output.shape[0], output.shape[2]
+        self.__output_dims = (steps, classes)
+        self.__use_io_binding = use_io_binding and isinstance(steps, int) and isinstance(classes, int)
+        if use_io_binding and not self.__use_io_binding:
+            logger.warning(f"CAPTCHA model output shape {output.shape} is not fixed; not using IO binding")
+
+    @property
+    def supports_batch_inference(self) -> bool:
+        """Whether the model accepts more than one image per run (its batch dimension is not fixed to 1)"""
+        return self.__ort_sess.get_inputs()[0].shape[0] != 1
+
+    def __input_buffer(self, n: int) -> np.ndarray:
+        """A reusable (n, C, H, W) input buffer for the calling thread"""
+        buffer = getattr(self.__buffers, 'input', None)
+        if buffer is None or len(buffer) < n:
+            buffer = np.empty((n, MODEL_INPUT_CHANNELS, MODEL_INPUT_HEIGHT, MODEL_INPUT_WIDTH), dtype=np.float32)
+            self.__buffers.input = buffer
+        return buffer[:n]
+
+    def __preprocess(self, images: list) -> np.ndarray:
+        """Decode image bytes into this thread's (N, C, H, W) float32 input buffer"""
+        return preprocess_captcha_images(images, out=self.__input_buffer(len(images)))
+
+    def __output_buffer(self, shape: tuple) -> np.ndarray:
+        """A reusable float32 output buffer of the given shape for the calling thread"""
+        outputs = getattr(self.__buffers, 'outputs', None)
+        if outputs is None:
+            outputs = self.__buffers.outputs = {}
+        buffer = outputs.get(shape)
+        if buffer is None:
+            buffer = outputs[shape] = np.empty(shape, dtype=np.float32)
+        return buffer
+
+    def __run_bound(self, batch: np.ndarray, output: np.ndarray) -> None:
+        """Run the model with the input and output bound in place, so ORT allocates neither"""
+        binding = getattr(self.__buffers, 'binding', None)
+        if binding is None:
+            binding = self.__buffers.binding = self.__ort_sess.io_binding()
+        binding.bind_cpu_input(self.__input_name, batch)
+        binding.bind_output(self.__output_name, 'cpu', 0, np.float32, list(output.shape), output.ctypes.data)
+        self.__ort_sess.run_with_iobinding(binding)
+
+    def __infer(self, batch: np.ndarray) -> np.ndarray:
+        """Run the model on an (N, C, H, W) batch and return (T, N, classes) logits.
+        
+        With IO binding the logits are a view of this thread's output buffer and
+        are only valid until the thread's next run.
+        """
+        n = len(batch)
+        if not self.__use_io_binding:
+            if n == 1 or self.supports_batch_inference:
+                return self.__ort_sess.run(None, {self.__input_name: batch})[0]
+            # The bundled model has its batch dimension fixed to 1; run the images one by one
+            outputs = [self.__ort_sess.run(None, {self.__input_name: batch[i:i + 1]})[0] for i in range(n)]
+            return np.concatenate(outputs, axis=1)
+        
+        steps, classes = self.__output_dims
+        if n == 1 or self.supports_batch_inference:
+            output = self.__output_buffer((steps, n, classes))
+            self.__run_bound(batch, output)
+            return output
+        # One image per run, each writing its own contiguous (T, 1, classes) slot
+        output = self.__output_buffer((n, steps, 1, classes))
+        for i in range(n):
+            self.__run_bound(batch[i:i + 1], output[i])
+        return output[:, :, 0, :].transpose(1, 0, 2)
 
-    def __decode(self, sequence):
-        """Decode the sequence to text"""
-        characters = '-' + string.digits + string.ascii_uppercase
-        a = ''.join([characters[x] for x in sequence])
-        s = ''.join([x for j, x in enumerate(a[:-1]) if x != characters[0] and x != a[j+1]])
-        if len(s) == 0:
-            return ''
-        if a[-1] != characters[0] and s[-1] != a[-1]:
-            s += a[-1]
-        return s
+    def warm_up(self) -> None:
+        """Run a blank image through the model so the first real CAPTCHA does not pay ORT's first-run setup"""
+        started = time.monotonic()
+        self.__infer(np.zeros((1, MODEL_INPUT_CHANNELS, MODEL_INPUT_HEIGHT, MODEL_INPUT_WIDTH), dtype=np.float32))
+        logger.info(f"CAPTCHA model warmed up in {(time.monotonic() - started) * 1000:.0f} ms")
+
+    def logits_batch(self, images: list) -> np.ndarray:
+        """Return (N, T, classes) logits for the images, using one inference call when the model allows it"""
+        batch = self.__preprocess(images)
+        # Model output is (T, N, classes); copy out of the thread's buffer since callers may hand it to other threads
+        return np.transpose(self.__infer(batch), (1, 0, 2)).copy()
+
+    def predict_batch(self, images: list) -> list:
+        """Return (text, per-character confidences) for each image"""
+        return ctc_greedy_decode(self.logits_batch(images))
+
+    def solve_candidates(self, image: bytes, n_best: int = CAPTCHA_N_BEST) -> list:
+        """Return the n-best (text, sequence probability) candidates from a CTC beam search"""
+        candidates = ctc_beam_search(softmax(self.logits_batch([image])[0]), n_best=n_best)
+        logger.info(f"CAPTCHA candidates: {[(text, round(p, 3)) for text, p in candidates]}")
+        return candidates
+
+    def solve_batch(self, images: list) -> list:
+        """Solve several CAPTCHAs with one inference call when the model allows it"""
+        return [text for text, _ in self.predict_batch(images)]
+
+    def stats(self) -> dict:
+        options = self.__session_options
+        return {
+            'handler': type(self).__name__,
+            'model_path': self.__onnx_model_path,
+            'load_ms': round(self.__load_ms, 1),
+            'io_binding': self.__use_io_binding,
+            'session': {
+                'graph_optimization_level': str(options.graph_optimization_level),
+                'intra_op_threads': options.intra_op_num_threads,
+                'inter_op_threads': options.inter_op_num_threads,
+                'execution_mode': str(options.execution_mode),
+                'memory_arena': options.enable_cpu_mem_arena,
+                'memory_pattern': options.enable_mem_pattern
+            }
+        }
 
     def solve(self, image: bytes) -> str:
         """Solve the CAPTCHA from image bytes"""
         try:
-            # Convert bytes to PIL Image
-            img = Image.open(BytesIO(image))
-            
-            # Resize image to expected dimensions (200x50 based on the error)
-            # The model expects width=200, and typical CAPTCHA height is 50
-            img = img.resize((200, 50), Image.Resampling.LANCZOS)
-            
-            # Convert to numpy array and normalize
-            img_array = np.asarray(img, dtype=np.float32) / 255.0
-            
-            # Transpose to match expected input shape (C, H, W) and add batch dimension
-            img_array = np.expand_dims(np.transpose(img_array, (2, 0, 1)), axis=0)
-            
-            # Log the shape for debugging
-            logger.info(f"Input shape to model: {img_array.shape}")
+            img_array = self.__preprocess([image])
+            logger.debug(f"Input shape to model: {img_array.shape}")
             
             # Run inference
-            outputs = self.__ort_sess.run(None, {'input': img_array})
-            x = outputs[0]
+            x = self.__infer(img_array)
             
             # Decode the output
-            t = np.argmax(np.transpose(x, (1, 0, 2)), -1)
-            pred = self.__decode(t[0])
+            pred, confidences = ctc_greedy_decode(np.transpose(x, (1, 0, 2)))[0]
             
-            logger.info(f"CAPTCHA solved: {pred}")
+            logger.info(f"CAPTCHA solved: {pred} (min confidence {min(confidences, default=0):.2f})")
             return pred
             
         except Exception as e:
             logger.error(f"Error solving CAPTCHA: {e}")
             raise
 
+class BatchingCaptchaHandle(CaptchaHandle):
+    """Micro-batching front end for an OnnxCaptchaHandle.
+    
+    Callers block in solve() while a dispatcher thread collects up to
+    max_batch_size images, or waits at most max_wait_ms for more to arrive,
+    runs one batched inference and resolves each caller's future with its
+    logits; decoding happens back in the caller's thread.
+    """
+    
+    supports_auto_solve = True
+    
+    def __init__(self, handle: OnnxCaptchaHandle, max_batch_size: int = CAPTCHA_BATCH_SIZE,
+                 max_wait_ms: float = CAPTCHA_BATCH_WAIT_MS) -> None:
+        super().__init__()
+        self.handle = handle
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_ms = max(0.0, max_wait_ms)
+        self.__queue = queue.Queue()
+        self.__lock = threading.Lock()
+        self.__metrics = {
+            'requests': 0,
+            'batches': 0,
+            'errors': 0,
+            'max_batch_seen': 0,
+            'queue_wait_ms_total': 0.0,
+            'inference_ms_total': 0.0
+        }
+        self.__batch_sizes = {}
+        if not handle.supports_batch_inference:
+            logger.warning("CAPTCHA model has a fixed batch size of 1; batches will be run image by image")
+        self.__dispatcher = threading.Thread(target=self.__dispatch, name='captcha-batcher', daemon=True)
+        self.__dispatcher.start()
+
+    def __logits(self, image: bytes) -> np.ndarray:
+        """Queue the image for the next batch and wait for its (T, classes) logits"""
+        future = Future()
+        self.__queue.put((image, future, time.monotonic()))
+        return future.result()
+
+    def solve(self, image: bytes) -> str:
+        text, _ = ctc_greedy_decode(self.__logits(image)[np.newaxis])[0]
+        return text
+
+    def solve_candidates(self, image: bytes, n_best: int = CAPTCHA_N_BEST) -> list:
+        return ctc_beam_search(softmax(self.__logits(image)), n_best=n_best)
+
+    def solve_batch(self, images: list) -> list:
+        return self.handle.solve_batch(images)
+
+    def __collect(self):
+        """Block for the first image, then gather more until the batch is full or the wait expires"""
+        batch = [self.__queue.get()]
+        deadline = time.monotonic() + self.max_wait_ms / 1000.0
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.__queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def __dispatch(self):
+        while True:
+            batch = self.__collect()
+            started = time.monotonic()
+            try:
+                logits = self.handle.logits_batch([image for image, _, _ in batch])
+                for (_, future, _), item_logits in zip(batch, logits):
+                    future.set_result(item_logits)
+            except Exception as e:
+                logger.error(f"Error solving CAPTCHA batch: {e}")
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                with self.__lock:
+                    self.__metrics['errors'] += 1
+            finished = time.monotonic()
+            
+            with self.__lock:
+                self.__metrics['requests'] += len(batch)
+                self.__metrics['batches'] += 1
+                self.__metrics['max_batch_seen'] = max(self.__metrics['max_batch_seen'], len(batch))
+                self.__metrics['queue_wait_ms_total'] += sum((started - queued) * 1000 for _, _, queued in batch)
+                self.__metrics['inference_ms_total'] += (finished - started) * 1000
+                self.__batch_sizes[len(batch)] = self.__batch_sizes.get(len(batch), 0) + 1
+            logger.info(f"Solved CAPTCHA batch of {len(batch)} in {(finished - started) * 1000:.1f} ms")
+
+    def stats(self) -> dict:
+        with self.__lock:
+            metrics = dict(self.__metrics)
+            batch_sizes = dict(self.__batch_sizes)
+        batches = metrics['batches'] or 1
+        requests = metrics['requests'] or 1
+        return {
+            'handler': type(self).__name__,
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait_ms,
+            'model_batch_inference': self.handle.supports_batch_inference,
+            'model': self.handle.stats(),
+            'queue_depth': self.__queue.qsize(),
+            **metrics,
+            'avg_batch_size': metrics['requests'] / batches,
+            'avg_queue_wait_ms': metrics['queue_wait_ms_total'] / requests,
+            'avg_inference_ms': metrics['inference_ms_total'] / batches,
+            'batch_size_histogram': batch_sizes
+        }
+
+class CachingCaptchaHandle(CaptchaHandle):
+    """LRU cache of answers in front of another handler, keyed by the image content hash.
+    
+    Retries that re-render the same challenge, replays and debug captures are
+    answered without inference. Entries rejected by the site are dropped
+    through invalidate().
+    """
+    
+    def __init__(self, handle: CaptchaHandle, max_size: int = CAPTCHA_CACHE_SIZE) -> None:
+        super().__init__()
+        self.handle = handle
+        self.supports_auto_solve = handle.supports_auto_solve
+        self.max_size = max(1, max_size)
+        # key -> {('solve',): text, ('candidates', n_best): [(text, probability), ...]}
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__metrics = {'hits': 0, 'misses': 0, 'invalidations': 0, 'evictions': 0}
+
+    def __cached(self, key: str, kind: tuple, compute):
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None and kind in entry:
+                self.__entries.move_to_end(key)
+                self.__metrics['hits'] += 1
+                return entry[kind]
+            self.__metrics['misses'] += 1
+        
+        value = compute()
+        with self.__lock:
+            self.__entries.setdefault(key, {})[kind] = value
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.max_size:
+                self.__entries.popitem(last=False)
+                self.__metrics['evictions'] += 1
+        return value
+
+    def solve(self, image: bytes) -> str:
+        return self.__cached(captcha_key(image), ('solve',), lambda: self.handle.solve(image))
+
+    def solve_candidates(self, image: bytes, n_best: int = CAPTCHA_N_BEST) -> list:
+        return self.__cached(captcha_key(image), ('candidates', n_best),
+                             lambda: self.handle.solve_candidates(image, n_best))
+
+    def invalidate(self, key: str) -> None:
+        with self.__lock:
+            if self.__entries.pop(key, None) is not None:
+                self.__metrics['invalidations'] += 1
+                logger.info(f"Dropped cached CAPTCHA answer for {key}")
+        self.handle.invalidate(key)
+
+    def stats(self) -> dict:
+        with self.__lock:
+            metrics = dict(self.__metrics)
+            size = len(self.__entries)
+        lookups = metrics['hits'] + metrics['misses']
+        return {
+            'handler': type(self).__name__,
+            'max_size': self.max_size,
+            'size': size,
+            **metrics,
+            'hit_rate': metrics['hits'] / lookups if lookups else 0.0,
+            'solver': self.handle.stats()
+        }
+
+class DeferredCaptchaHandle(CaptchaHandle):
+    """Builds the real handler off the import path, in a background thread or on first use.
+    
+    state is 'pending' (lazy, not requested yet), 'loading' or 'ready'. Solving
+    before the handler is ready blocks until it is; callers that must not block
+    check state first. A pending handler is healthy: it loads on first use.
+    """
+    
+    def __init__(self, factory, mode: str = CAPTCHA_LOAD_MODE) -> None:
+        super().__init__()
+        if mode not in ('background', 'lazy', 'eager'):
+            raise ValueError(f"Unknown CAPTCHA load mode {mode!r}; expected background, lazy or eager")
+        self.mode = mode
+        self.state = 'pending'
+        self.__factory = factory
+        self.__handle = None
+        self.__load_ms = None
+        self.__lock = threading.Lock()
+        if mode == 'eager':
+            self.load()
+        elif mode == 'background':
+            self.state = 'loading'
+            threading.Thread(target=self.load, name='captcha-loader', daemon=True).start()
+
+    def load(self) -> CaptchaHandle:
+        """Build the handler if it is not built yet and return it"""
+        with self.__lock:
+            if self.__handle is None:
+                self.state = 'loading'
+                started = time.monotonic()
+                self.__handle = self.__factory()
+                self.__load_ms = (time.monotonic() - started) * 1000
+                self.state = 'ready'
+                logger.info(f"CAPTCHA solver ready in {self.__load_ms:.0f} ms ({type(self.__handle).__name__})")
+            return self.__handle
+
+    @property
+    def ready(self) -> bool:
+        return self.state == 'ready'
+
+    def health(self) -> str:
+        """'starting' while loading, 'degraded' when the loaded solver is unreachable, else 'healthy'"""
+        if self.state == 'loading':
+            return 'starting'
+        if self.ready and not self.__handle.available():
+            return 'degraded'
+        return 'healthy'
+
+    @property
+    def supports_auto_solve(self) -> bool:
+        return self.load().supports_auto_solve
+
+    def solve(self, image: bytes) -> str:
+        return self.load().solve(image)
+
+    def solve_candidates(self, image: bytes, n_best: int = CAPTCHA_N_BEST) -> list:
+        return self.load().solve_candidates(image, n_best)
+
+    def invalidate(self, key: str) -> None:
+        if self.ready:
+            self.__handle.invalidate(key)
+
+    def readiness(self) -> dict:
+        """Load state for health checks; never triggers a load"""
+        return {
+            'state': self.state,
+            'mode': self.mode,
+            'load_ms': round(self.__load_ms, 1) if self.__load_ms is not None else None,
+            'auto_solve': self.__handle.supports_auto_solve if self.ready else None
+        }
+
+    def stats(self) -> dict:
+        if not self.ready:
+            return {'handler': type(self).__name__, **self.readiness()}
+        return {**self.__handle.stats(), 'load': self.readiness()}
+
 class ManualCaptchaHandle(CaptchaHandle):
     """Manual CAPTCHA handler that returns None, requiring user input"""
     
     def solve(self, image: bytes) -> str:
         """Returns None to indicate manual solving is needed"""
         logger.info("Manual CAPTCHA solving required")
-        return None 
\ No newline at end of file
+        return None 
+
+def create_captcha_handler(use_onnx=True, model_path='captcha.onnx', batch_size=CAPTCHA_BATCH_SIZE,
+                           batch_wait_ms=CAPTCHA_BATCH_WAIT_MS, variant=CAPTCHA_MODEL_VARIANT,
+                           cache_size=CAPTCHA_CACHE_SIZE, solver_socket=CAPTCHA_SOLVER_SOCKET) -> CaptchaHandle:
+    """Build the CAPTCHA handler, falling back to manual solving if the model cannot be loaded"""
+    if use_onnx and solver_socket:
+        from .captcha_service import RemoteCaptchaHandle
+        logger.info(f"Using shared CAPTCHA solver at {solver_socket}")
+        return RemoteCaptchaHandle(solver_socket)
+    if use_onnx:
+        try:
+            variant_path = resolve_model_path(model_path, variant)
+            if variant_path != model_path and os.path.exists(variant_path):
+                model_path = variant_path
+            elif variant_path != model_path:
+                logger.warning(f"{variant} CAPTCHA model not found at {variant_path}, using {model_path}")
+                variant = 'float'
+            # Check if model file exists
+            if not os.path.exists(model_path):
+                logger.warning(f"ONNX model not found at {model_path}, falling back to manual CAPTCHA")
+                return ManualCaptchaHandle()
+            # Keep one optimized-model cache per variant
+            optimized_model_path = CAPTCHA_ORT_OPTIMIZED_MODEL_PATH
+            if optimized_model_path:
+                optimized_model_path = resolve_model_path(optimized_model_path, variant)
+            handler = OnnxCaptchaHandle(model_path, optimized_model_path=optimized_model_path)
+            if CAPTCHA_WARM_UP:
+                handler.warm_up()
+            logger.info(f"Using ONNX CAPTCHA solver ({variant} model)")
+            if batch_size > 1 and handler.supports_batch_inference:
+                handler = BatchingCaptchaHandle(handler, max_batch_size=batch_size, max_wait_ms=batch_wait_ms)
+                logger.info(f"Batching CAPTCHA inference (batch size {batch_size}, wait {batch_wait_ms} ms)")
+            elif batch_size > 1:
+                # Batching a fixed-batch model only adds queueing; convert it with tools/make_dynamic_batch_model.py
+                logger.info("CAPTCHA model has a fixed batch size of 1, solving without batching")
+            if cache_size > 0:
+                handler = CachingCaptchaHandle(handler, max_size=cache_size)
+            return handler
+        except Exception as e:
+            logger.error(f"Failed to initialize ONNX CAPTCHA handler: {e}")
+            return ManualCaptchaHandle()
+    logger.info("Using manual CAPTCHA solver")
+    return ManualCaptchaHandle()
+
+def load_captcha_handler(mode=CAPTCHA_LOAD_MODE, **options) -> DeferredCaptchaHandle:
+    """create_captcha_handler(**options), built according to the load mode"""
+    return DeferredCaptchaHandle(lambda: create_captcha_handler(**options), mode=mode)
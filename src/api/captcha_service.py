@@ -0,0 +1,224 @@
+"""Out-of-process CAPTCHA solver shared by every server worker on the host.
+
+The daemon owns the only copy of the ONNX model and serves solve requests over
+a Unix socket. Server processes use RemoteCaptchaHandle when
+CAPTCHA_SOLVER_SOCKET is set, so adding worker processes does not add model
+copies. With a dynamic-batch model (tools/make_dynamic_batch_model.py),
+requests from all connected processes feed one micro-batching queue. The
+bundled model has its batch size fixed to 1, so the daemon solves its requests
+one at a time.
+
+Run with:
+    python -m src.api.captcha_service --socket /run/captcha-solver.sock --model captcha.onnx
+
+Every message in either direction is an 8-byte header (JSON length and payload
+length, network order), then the JSON, then the raw payload (the image for
+solve requests).
+"""
+import argparse
+import json
+import logging
+import os
+import socket
+import socketserver
+import struct
+import threading
+
+from .captcha_handler import CaptchaHandle, BatchingCaptchaHandle, CAPTCHA_N_BEST, create_captcha_handler
+
+logger = logging.getLogger(__name__)
+
+CAPTCHA_SOLVER_TIMEOUT = float(os.environ.get('CAPTCHA_SOLVER_TIMEOUT', 30))  # Seconds per request, client side
+
+FRAME_HEADER = struct.Struct('!II')
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 65536))
+        if not chunk:
+            raise ConnectionError('CAPTCHA solver connection closed')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+def send_message(sock, message: dict, payload: bytes = b'') -> None:
+    body = json.dumps(message).encode('utf-8')
+    sock.sendall(FRAME_HEADER.pack(len(body), len(payload)) + body + payload)
+
+def recv_message(sock) -> tuple:
+    """Return (message, payload)"""
+    body_size, payload_size = FRAME_HEADER.unpack(_recv_exactly(sock, FRAME_HEADER.size))
+    message = json.loads(_recv_exactly(sock, body_size))
+    return message, _recv_exactly(sock, payload_size) if payload_size else b''
+
+class RemoteCaptchaHandle(CaptchaHandle):
+    """Client for the solver daemon; each calling thread keeps its own connection"""
+
+    supports_auto_solve = True
+
+    def __init__(self, socket_path: str, timeout: float = CAPTCHA_SOLVER_TIMEOUT) -> None:
+        super().__init__()
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.__local = threading.local()
+        self.__lock = threading.Lock()
+        self.__metrics = {'requests': 0, 'errors': 0, 'reconnects': 0}
+
+    def __connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.__local.sock = sock
+        return sock
+
+    def __disconnect(self):
+        sock = getattr(self.__local, 'sock', None)
+        self.__local.sock = None
+        if sock:
+            try:
+                sock.close()
+            except Exception:
+                pass
+
+    def __request(self, message: dict, payload: bytes = b''):
+        with self.__lock:
+            self.__metrics['requests'] += 1
+        # A connection left over from a restarted daemon fails on first use; retry once on a fresh one.
+        # A timeout is not retried: the daemon is busy, and sending again would solve the image twice.
+        for attempt in range(2):
+            sock = getattr(self.__local, 'sock', None)
+            try:
+                if sock is None:
+                    sock = self.__connect()
+                    if attempt:
+                        with self.__lock:
+                            self.__metrics['reconnects'] += 1
+                send_message(sock, message, payload)
+                response, _ = recv_message(sock)
+                break
+            except socket.timeout as e:
+                # The late response would arrive on this connection, so drop it
+                self.__disconnect()
+                with self.__lock:
+                    self.__metrics['errors'] += 1
+                logger.error(f"CAPTCHA solver at {self.socket_path} timed out after {self.timeout}s: {e}")
+                raise
+            except (OSError, ConnectionError, ValueError) as e:
+                self.__disconnect()
+                if attempt:
+                    with self.__lock:
+                        self.__metrics['errors'] += 1
+                    logger.error(f"CAPTCHA solver at {self.socket_path} unavailable: {e}")
+                    raise
+        if not response.get('ok'):
+            with self.__lock:
+                self.__metrics['errors'] += 1
+            raise RuntimeError(f"CAPTCHA solver error: {response.get('error')}")
+        return response.get('result')
+
+    def solve(self, image: bytes) -> str:
+        return self.__request({'op': 'solve'}, image)
+
+    def solve_candidates(self, image: bytes, n_best: int = CAPTCHA_N_BEST) -> list:
+        return [tuple(candidate) for candidate in self.__request({'op': 'candidates', 'n_best': n_best}, image)]
+
+    def available(self) -> bool:
+        """Whether the daemon answers on the socket"""
+        try:
+            return self.__request({'op': 'ping'}) is True
+        except Exception:
+            return False
+
+    def invalidate(self, key: str) -> None:
+        try:
+            self.__request({'op': 'invalidate', 'key': key})
+        except Exception as e:
+            logger.warning(f"Could not invalidate cached CAPTCHA answer: {e}")
+
+    def stats(self) -> dict:
+        with self.__lock:
+            metrics = dict(self.__metrics)
+        try:
+            solver = self.__request({'op': 'stats'})
+        except Exception as e:
+            solver = {'error': str(e)}
+        return {
+            'handler': type(self).__name__,
+            'socket': self.socket_path,
+            **metrics,
+            'solver': solver
+        }
+
+class _SolverRequestHandler(socketserver.BaseRequestHandler):
+    """Serves requests from one client connection until it closes"""
+
+    def handle(self):
+        handler = self.server.captcha_handler
+        while True:
+            try:
+                message, payload = recv_message(self.request)
+            except (OSError, ConnectionError, ValueError):
+                return
+            try:
+                op = message.get('op')
+                if op == 'solve':
+                    result = handler.solve(payload)
+                elif op == 'candidates':
+                    result = handler.solve_candidates(payload, int(message.get('n_best', CAPTCHA_N_BEST)))
+                elif op == 'invalidate':
+                    result = handler.invalidate(message['key'])
+                elif op == 'stats':
+                    result = handler.stats()
+                elif op == 'ping':
+                    result = True
+                else:
+                    raise ValueError(f"Unknown operation {op!r}")
+                response = {'ok': True, 'result': result}
+            except Exception as e:
+                logger.error(f"CAPTCHA solver request failed: {e}")
+                response = {'ok': False, 'error': str(e)}
+            try:
+                send_message(self.request, response)
+            except OSError:
+                return
+
+class CaptchaSolverServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    # Every server worker thread may connect at once
+    request_queue_size = 128
+
+    def __init__(self, socket_path, captcha_handler):
+        self.captcha_handler = captcha_handler
+        # A socket file left by a previous run would make bind fail
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        super().__init__(socket_path, _SolverRequestHandler)
+        os.chmod(socket_path, 0o660)
+
+def main():
+    parser = argparse.ArgumentParser(description='Shared CAPTCHA solver daemon')
+    parser.add_argument('--socket', default=os.environ.get('CAPTCHA_SOLVER_SOCKET', '/tmp/captcha-solver.sock'))
+    parser.add_argument('--model', default=os.environ.get('CAPTCHA_MODEL_PATH', 'captcha.onnx'))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    captcha_handler = create_captcha_handler(model_path=args.model, solver_socket=None)
+    if not captcha_handler.supports_auto_solve:
+        raise SystemExit(f"Could not load the CAPTCHA model from {args.model}")
+    if not isinstance(getattr(captcha_handler, 'handle', captcha_handler), BatchingCaptchaHandle):
+        logger.warning("CAPTCHA inference is not batched, so requests are solved one at a time; batching "
+                       "needs a dynamic-batch model (tools/make_dynamic_batch_model.py) and CAPTCHA_BATCH_SIZE > 1")
+
+    server = CaptchaSolverServer(args.socket, captcha_handler)
+    logger.info(f"CAPTCHA solver listening on {args.socket}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(args.socket)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,396 @@
+"""Browserless engine for the NIV status check.
+
+status.aspx is a classic ASP.NET WebForms page: the browser only carries
+__VIEWSTATE/__EVENTVALIDATION, fills four fields, loads the BotDetect image
+and posts the form back. HttpVisaStatusChecker does the same over plain HTTP:
+it GETs the form, parses its fields, downloads the CAPTCHA image, posts the
+form and parses the result HTML into the snapshot that
+result_extractor.parse_status_snapshot already understands.
+
+It exposes the same methods as VisaStatusChecker so run_auto_check can drive
+either engine. Anything that looks like bot protection or an unexpected page
+raises HttpEngineBlocked, and the caller falls back to the browser engine.
+"""
+import base64
+import os
+import re
+import time
+from datetime import datetime
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+import logging
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .browser_pool import CONTEXT_OPTIONS
+from .page_pool import CEAC_NIV_STATUS_URL
+from .captcha_handler import captcha_key
+from . import location_index
+from . import result_extractor
+
+logger = logging.getLogger(__name__)
+
+HTTP_ENGINE_TIMEOUT = float(os.environ.get('HTTP_ENGINE_TIMEOUT', 30))  # Seconds per request
+HTTP_ENGINE_POOL_SIZE = int(os.environ.get('HTTP_ENGINE_POOL_SIZE', 16))  # Kept-alive connections per host
+SESSION_TIMEOUT = 300  # 5 minutes timeout
+
+HTTP_HEADERS = {
+    **CONTEXT_OPTIONS['extra_http_headers'],
+    'User-Agent': CONTEXT_OPTIONS['user_agent'],
+    # requests only decodes brotli when the optional brotli package is installed
+    'Accept-Encoding': 'gzip, deflate'
+}
+
+# Markers of a Cloudflare challenge or block page instead of the form
+CHALLENGE_MARKERS = ('cf-browser-verification', 'challenge-platform', '<title>Just a moment', 'cf-error-details')
+BLOCKED_STATUS_CODES = (403, 429, 503)
+
+# Form controls, matched on their id the same way VisaStatusChecker's selectors match
+LOCATION_FIELD = 'Location_Dropdown'
+CASE_NUMBER_FIELD = 'Visa_Case_Number'
+PASSPORT_FIELD = 'Passport_Number'
+SURNAME_FIELD = 'Surname'
+CAPTCHA_FIELD = 'Captcha'
+SUBMIT_BUTTON_ID = 'ctl00_ContentPlaceHolder1_btnSubmit'
+SUBMIT_EVENT_TARGET = 'ctl00$ContentPlaceHolder1$btnSubmit'
+CAPTCHA_IMAGE_ID_SUFFIX = '_CaptchaImage'
+
+VOID_TAGS = frozenset({'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'track', 'wbr'})
+LINE_BREAK_TAGS = frozenset({'br', 'div', 'p', 'tr', 'li', 'table', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6'})
+HIDDEN_STYLE = re.compile(r'display\s*:\s*none|visibility\s*:\s*hidden', re.IGNORECASE)
+
+# Raw-HTML counterparts of result_extractor.POPUP_SELECTORS and ERROR_SELECTORS, in the same order
+POPUP_MATCHERS = [
+    lambda el: el['tag'] == 'div' and el['role'] == 'dialog',
+    lambda el: el['tag'] == 'div' and 'modal' in el['classes'],
+    lambda el: el['tag'] == 'div' and 'popup' in el['classes'],
+    lambda el: el['tag'] == 'div' and 'popup' in el['id'],
+    lambda el: el['tag'] == 'div' and 'modal' in el['id'],
+    lambda el: el['tag'] == 'div' and 'dialog' in el['id']
+]
+ERROR_MATCHERS = [
+    lambda el: 'error-message' in el['classes'],
+    lambda el: 'validation-summary-errors' in el['classes'],
+    lambda el: el['tag'] == 'span' and 'lblError' in el['id'],
+    lambda el: el['id'] == 'ctl00_ContentPlaceHolder1_lblError',
+    lambda el: 'alert-danger' in el['classes'],
+    lambda el: el['tag'] == 'div' and any('error' in cls for cls in el['classes'])
+]
+
+class HttpEngineBlocked(Exception):
+    """The plain-HTTP path was refused or got an unexpected page; use the browser engine instead"""
+
+class FormPage(HTMLParser):
+    """Fields, CAPTCHA image and result text of one status.aspx response"""
+
+    def __init__(self, html, url):
+        super().__init__(convert_charrefs=True)
+        self.url = url
+        self.form_action = None
+        self.inputs = []  # attribute dicts of the form's <input>s, in document order
+        self.selects = {}  # id -> {'name', 'options': [{'value', 'text', 'selected'}]}
+        self.captcha_src = None
+        self.labels = {}
+        self.popups = []  # (matcher index, text)
+        self.errors = []  # (matcher index, text)
+        self._stack = []
+        self._select = None
+        self._option = None
+        self._skip_text = 0
+        self.feed(html)
+        self.close()
+        self._stack.clear()
+
+    def _element(self, tag, attrs):
+        parent_hidden = self._stack[-1]['hidden'] if self._stack else False
+        el = {
+            'tag': tag,
+            'id': attrs.get('id') or '',
+            'classes': (attrs.get('class') or '').split(),
+            'role': attrs.get('role'),
+            'hidden': parent_hidden or bool(HIDDEN_STYLE.search(attrs.get('style') or '')),
+            'text': []
+        }
+        el['popup'] = next((i for i, match in enumerate(POPUP_MATCHERS) if match(el)), None)
+        el['error'] = next((i for i, match in enumerate(ERROR_MATCHERS) if match(el)), None)
+        el['label'] = 'lbl' in el['id']
+        el['capture'] = el['label'] or el['popup'] is not None or el['error'] is not None
+        return el
+
+    def _append_text(self, text):
+        for el in self._stack:
+            if el['capture']:
+                el['text'].append(text)
+
+    def handle_starttag(self, tag, attrs):
+        attrs = {name: value if value is not None else '' for name, value in attrs}
+        if tag in ('script', 'style'):
+            self._skip_text += 1
+        if tag in LINE_BREAK_TAGS:
+            self._append_text('\n')
+        if tag == 'form' and self.form_action is None:
+            self.form_action = attrs.get('action') or ''
+        elif tag == 'input':
+            self.inputs.append(attrs)
+        elif tag == 'img' and (attrs.get('id') or '').endswith(CAPTCHA_IMAGE_ID_SUFFIX):
+            self.captcha_src = attrs.get('src')
+        elif tag == 'select':
+            self._select = {'name': attrs.get('name') or '', 'options': []}
+            self.selects[attrs.get('id') or attrs.get('name') or ''] = self._select
+        elif tag == 'option' and self._select is not None:
+            self._option = {'value': attrs.get('value'), 'text': '', 'selected': 'selected' in attrs}
+            self._select['options'].append(self._option)
+        if tag not in VOID_TAGS:
+            self._stack.append(self._element(tag, attrs))
+
+    def handle_endtag(self, tag):
+        if tag in ('script', 'style') and self._skip_text:
+            self._skip_text -= 1
+        if tag == 'select':
+            self._select = None
+        if tag in ('option', 'select'):
+            self._option = None
+        if tag in LINE_BREAK_TAGS:
+            self._append_text('\n')
+        # Tolerate unclosed children by popping up to the matching element
+        if not any(el['tag'] == tag for el in self._stack):
+            return
+        while self._stack:
+            el = self._stack.pop()
+            self._close(el)
+            if el['tag'] == tag:
+                break
+
+    def _close(self, el):
+        text = ''.join(el['text']).strip()
+        text = re.sub(r'[ \t\r\f\v]+', ' ', text)
+        text = re.sub(r'\s*\n\s*', '\n', text)
+        if not text:
+            return
+        if el['label']:
+            self.labels.setdefault(el['id'], text)
+        if el['hidden']:
+            return
+        if el['popup'] is not None:
+            self.popups.append((el['popup'], text))
+        if el['error'] is not None:
+            self.errors.append((el['error'], text))
+
+    def handle_data(self, data):
+        if self._skip_text:
+            return
+        if self._option is not None:
+            self._option['text'] += data
+        self._append_text(data)
+
+    def find_input(self, fragment):
+        """The first input whose id is, or contains, the fragment"""
+        exact = next((attrs for attrs in self.inputs if attrs.get('id') == fragment), None)
+        return exact or next((attrs for attrs in self.inputs if fragment in (attrs.get('id') or '')), None)
+
+    def find_select(self, fragment):
+        if fragment in self.selects:
+            return self.selects[fragment]
+        return next((select for id_, select in self.selects.items() if fragment in id_), None)
+
+    def form_data(self):
+        """Current values of the form's controls, as the browser would post them"""
+        data = {}
+        for attrs in self.inputs:
+            name = attrs.get('name')
+            input_type = (attrs.get('type') or 'text').lower()
+            if not name or input_type in ('submit', 'button', 'image', 'reset', 'file'):
+                continue
+            if input_type in ('checkbox', 'radio') and 'checked' not in attrs:
+                continue
+            data[name] = attrs.get('value', '')
+        for select in self.selects.values():
+            if not select['name'] or not select['options']:
+                continue
+            chosen = next((o for o in select['options'] if o['selected']), select['options'][0])
+            data[select['name']] = chosen['value'] if chosen['value'] is not None else chosen['text'].strip()
+        return data
+
+    def snapshot(self):
+        """Same shape as result_extractor.SNAPSHOT_SCRIPT's result"""
+        popup = min(self.popups, key=lambda item: item[0], default=None)
+        errors = []
+        if self.errors:
+            first = min(index for index, _ in self.errors)
+            errors = [text for index, text in self.errors if index == first]
+        return {
+            'popup': {'selector': result_extractor.POPUP_SELECTORS[popup[0]], 'text': popup[1]} if popup else None,
+            'frames': [],
+            'labels': self.labels,
+            'errors': errors
+        }
+
+# One connection pool shared by every check; cookies stay per check in each Session
+_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_ENGINE_POOL_SIZE)
+
+class HttpVisaStatusChecker:
+    """VisaStatusChecker counterpart that posts the form without a browser"""
+
+    engine = 'http'
+
+    def __init__(self, session_id, auto_solve_captcha=True, captcha_handler=None):
+        self.session_id = session_id
+        self.auto_solve_captcha = auto_solve_captcha
+        # Told about rejected answers so a cached solution is not replayed
+        self.captcha_handler = captcha_handler
+        self.created_at = datetime.now()
+        self.http = None
+        self.page = None
+        self.form_values = None
+        self.last_captcha_src = None
+        self.last_captcha_key = None
+        # No thread affinity: any worker may continue an HTTP session
+        self.worker_id = None
+
+    def start_browser(self, headless=True):
+        """Open the HTTP session (named after VisaStatusChecker.start_browser so the pipeline can drive either)"""
+        self.http = requests.Session()
+        self.http.headers.update(HTTP_HEADERS)
+        self.http.mount('https://', _adapter)
+        self.http.mount('http://', _adapter)
+
+    def close_browser(self):
+        if self.http:
+            # Not Session.close(): that closes the mounted adapter, dropping every check's kept-alive connections
+            self.http.cookies.clear()
+            self.http = None
+
+    def is_expired(self):
+        """Check if session has expired"""
+        return (datetime.now() - self.created_at).total_seconds() > SESSION_TIMEOUT
+
+    def _request(self, method, url, **kwargs):
+        """Send a request, raising HttpEngineBlocked on network errors or bot-protection responses"""
+        try:
+            response = self.http.request(method, url, timeout=HTTP_ENGINE_TIMEOUT, **kwargs)
+        except requests.RequestException as e:
+            raise HttpEngineBlocked(f"{method} {url} failed: {e}")
+        if response.status_code in BLOCKED_STATUS_CODES:
+            raise HttpEngineBlocked(f"{method} {url} returned {response.status_code}")
+        if response.status_code != 200:
+            raise HttpEngineBlocked(f"{method} {url} returned unexpected status {response.status_code}")
+        if 'html' in response.headers.get('content-type', '') and any(
+                marker in response.text for marker in CHALLENGE_MARKERS):
+            raise HttpEngineBlocked(f"{method} {url} returned a bot-protection challenge")
+        return response
+
+    def _load_page(self, response):
+        page = FormPage(response.text, response.url)
+        if not page.find_select(LOCATION_FIELD) or not page.find_input(CASE_NUMBER_FIELD):
+            raise HttpEngineBlocked("Response does not contain the NIV form")
+        self.page = page
+        return page
+
+    def navigate_to_visa_status_page(self):
+        """GET the NIV form and parse its fields"""
+        logger.info("Fetching CEAC visa status page (NIV) over HTTP...")
+        self._load_page(self._request('GET', CEAC_NIV_STATUS_URL))
+        return True
+
+    def select_nonimmigrant_visa(self):
+        """NIV is selected via the URL parameter"""
+        return True
+
+    def fill_form(self, location, application_id, passport_number, surname):
+        """Resolve the location and remember the values to post"""
+        dropdown = self.page.find_select(LOCATION_FIELD)
+        option_value = None
+        index = location_index.get_cached_index()
+        if index:
+            option_value = index.lookup(location)
+        if not option_value or option_value not in [o['value'] for o in dropdown['options']]:
+            # Build (or rebuild) the index from the dropdown we already have
+            options = [{'value': o['value'], 'text': o['text'].strip()} for o in dropdown['options']]
+            option_value = location_index.store_index(options).lookup(location)
+        if not option_value:
+            logger.error(f"Could not find location '{location}' in dropdown options")
+            return False
+
+        self.form_values = {
+            'location': option_value,
+            'application_id': application_id,
+            'passport_number': passport_number,
+            'surname': surname
+        }
+        return True
+
+    def get_captcha_bytes(self):
+        """Download the CAPTCHA image shown on the current form"""
+        if not self.page or not self.page.captcha_src:
+            logger.error("Could not find CAPTCHA image")
+            return None
+        src = urljoin(self.page.url, self.page.captcha_src)
+        response = self._request('GET', src, headers={'Referer': self.page.url, 'Accept': 'image/*,*/*;q=0.8'})
+        if not response.headers.get('content-type', '').startswith('image/'):
+            raise HttpEngineBlocked(f"CAPTCHA URL returned {response.headers.get('content-type')}")
+        self.last_captcha_src = src
+        self.last_captcha_key = captcha_key(response.content)
+        return response.content
+
+    def get_captcha_image(self, save_to_file=False):
+        """Get the CAPTCHA image as base64"""
+        captcha_bytes = self.get_captcha_bytes()
+        if not captcha_bytes:
+            return None
+        return base64.b64encode(captcha_bytes).decode('utf-8')
+
+    def refresh_captcha(self):
+        """Ask BotDetect for a new image for the same form, as its reload icon does"""
+        if not self.page or not self.page.captcha_src:
+            return False
+        self.page.captcha_src = re.sub(r'&d=\d+', '', self.page.captcha_src) + f'&d={int(time.time() * 1000)}'
+        return True
+
+    def retry_captcha(self, location, application_id, passport_number, surname):
+        """The rejected postback already returned a fresh form and CAPTCHA; reload only if it did not"""
+        if self.page and self.page.captcha_src and self.page.find_input(CAPTCHA_FIELD):
+            return True
+        self.navigate_to_visa_status_page()
+        return self.fill_form(location, application_id, passport_number, surname)
+
+    def submit_with_captcha(self, captcha_text):
+        """Post the form with the CAPTCHA answer and parse the result"""
+        page = self.page
+        data = page.form_data()
+        fields = [(LOCATION_FIELD, 'location'), (CASE_NUMBER_FIELD, 'application_id'),
+                  (PASSPORT_FIELD, 'passport_number'), (SURNAME_FIELD, 'surname')]
+        for fragment, key in fields:
+            control = page.find_select(fragment) if fragment == LOCATION_FIELD else page.find_input(fragment)
+            if not control or not control.get('name'):
+                raise HttpEngineBlocked(f"Form field {fragment} not found")
+            data[control['name']] = self.form_values[key]
+
+        captcha_field = page.find_input(CAPTCHA_FIELD)
+        if not captcha_field:
+            return {'success': False, 'error': 'Could not find CAPTCHA input field'}
+        data[captcha_field['name']] = captcha_text
+
+        submit_button = page.find_input(SUBMIT_BUTTON_ID)
+        if submit_button and submit_button.get('name'):
+            data[submit_button['name']] = submit_button.get('value', '')
+        else:
+            data['__EVENTTARGET'] = SUBMIT_EVENT_TARGET
+            data['__EVENTARGUMENT'] = ''
+
+        logger.info(f"Posting NIV form with CAPTCHA: {captcha_text}")
+        action = urljoin(page.url, page.form_action or '')
+        response = self._request('POST', action, data=data, headers={'Referer': page.url})
+        result_page = FormPage(response.text, response.url)
+        # Keep the fresh view state and CAPTCHA for a retry; without a form the old
+        # view state is spent, so retry_captcha fetches the form again
+        self.page = result_page if result_page.find_input(CASE_NUMBER_FIELD) else None
+
+        result = result_extractor.parse_status_snapshot(result_page.snapshot())
+        if result is None:
+            raise HttpEngineBlocked("Postback response holds no status or error")
+        if not result['success'] and 'captcha' in (result.get('error') or '').lower():
+            logger.warning(f"CAPTCHA rejected: {result['error']}")
+            if self.captcha_handler and self.last_captcha_key:
+                self.captcha_handler.invalidate(self.last_captcha_key)
+        return result
@@ -0,0 +1,106 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import os
+import uuid
+from threading import Lock
+import logging
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUE_LIMIT = int(os.environ.get('JOB_QUEUE_LIMIT', 50))  # Queued + running jobs accepted at once
+JOB_RESULT_TTL = int(os.environ.get('JOB_RESULT_TTL', 3600))  # Seconds finished jobs are kept
+
+class JobQueueFull(Exception):
+    """Raised when the job queue is at capacity"""
+    pass
+
+class Job:
+    """A submitted visa check and its outcome"""
+
+    def __init__(self, job_id):
+        self.id = job_id
+        self.status = 'queued'
+        self.created_at = datetime.now()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+
+    def is_finished(self):
+        return self.status in ('succeeded', 'failed')
+
+    def to_dict(self, include_result=False):
+        data = {
+            'job_id': self.id,
+            'status': self.status,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+        if include_result:
+            data['result'] = self.result
+        return data
+
+class JobManager:
+    """Runs visa check pipelines on a bounded worker pool.
+
+    Each worker thread keeps its own browser and page pools (they are
+    thread-local), so workers reuse warm browsers across jobs. Pass an
+    executor (e.g. the server's BrowserWorkerPool, sized by BROWSER_WORKERS)
+    to share its workers; workers only sizes the private pool used without one.
+    """
+
+    def __init__(self, workers=2, queue_limit=JOB_QUEUE_LIMIT, result_ttl=JOB_RESULT_TTL, executor=None):
+        self.workers = len(executor.workers) if executor is not None else workers
+        self.queue_limit = queue_limit
+        self.result_ttl = result_ttl
+        self.executor = executor or ThreadPoolExecutor(max_workers=workers, thread_name_prefix='visa-job')
+        self.jobs = {}
+        self.lock = Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue fn(*args, **kwargs) and return its Job immediately"""
+        self.purge_finished()
+        with self.lock:
+            pending = sum(1 for job in self.jobs.values() if not job.is_finished())
+            if pending >= self.queue_limit:
+                raise JobQueueFull(f"Job queue is full ({pending}/{self.queue_limit})")
+            job = Job(str(uuid.uuid4()))
+            self.jobs[job.id] = job
+        self.executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        job.status = 'running'
+        job.started_at = datetime.now()
+        try:
+            result = fn(*args, **kwargs)
+            status = 'succeeded' if result and result.get('success') else 'failed'
+        except Exception as e:
+            logger.error(f"Job {job.id} failed: {str(e)}")
+            result = {'success': False, 'error': str(e)}
+            status = 'failed'
+        # Publish the terminal status last, so a finished job always has finished_at and result
+        job.result = result
+        job.finished_at = datetime.now()
+        job.status = status
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def purge_finished(self):
+        """Forget finished jobs older than the result TTL"""
+        now = datetime.now()
+        with self.lock:
+            expired = [job_id for job_id, job in self.jobs.items()
+                       if job.is_finished() and job.finished_at is not None
+                       and (now - job.finished_at).total_seconds() > self.result_ttl]
+            for job_id in expired:
+                del self.jobs[job_id]
+
+    def stats(self):
+        with self.lock:
+            counts = {'queued': 0, 'running': 0, 'succeeded': 0, 'failed': 0}
+            for job in self.jobs.values():
+                counts[job.status] += 1
+        return {'workers': self.workers, 'queue_limit': self.queue_limit, **counts}
@@ -0,0 +1,152 @@
+"""Index of the CEAC location dropdown.
+
+The consulate list is read once with a single evaluate call, cached in memory
+with a TTL and persisted to disk, so fill_form can resolve a location with a
+dictionary lookup instead of walking every <option>.
+"""
+import json
+import os
+import re
+import tempfile
+import time
+import unicodedata
+from threading import Lock
+import logging
+
+logger = logging.getLogger(__name__)
+
+LOCATION_INDEX_TTL = int(os.environ.get('LOCATION_INDEX_TTL', 24 * 60 * 60))  # 1 day
+LOCATION_INDEX_PATH = os.environ.get(
+    'LOCATION_INDEX_PATH',
+    os.path.join(tempfile.gettempdir(), 'ceac_location_index.json')
+)
+
+# Returns [{value, text}] for every option of the dropdown, or null if it is missing
+OPTIONS_SCRIPT = """(selector) => {
+    const dropdown = document.querySelector(selector);
+    if (!dropdown) return null;
+    return Array.from(dropdown.options).map((option) => ({
+        value: option.value,
+        text: (option.textContent || '').trim()
+    }));
+}"""
+
+def normalize_location(name):
+    """Uppercase, strip accents and punctuation, collapse whitespace"""
+    name = unicodedata.normalize('NFKD', name or '')
+    name = ''.join(c for c in name if not unicodedata.combining(c))
+    name = re.sub(r'[^A-Z0-9]+', ' ', name.upper())
+    return name.strip()
+
+def _aliases(text):
+    """Alternative names embedded in an option label, e.g. 'CHENNAI (MADRAS)' or 'INDIA, MUMBAI'"""
+    parts = re.split(r'[(),/\-]', text)
+    return [normalize_location(part) for part in parts if normalize_location(part)]
+
+class LocationIndex:
+    """Maps normalized location names and aliases to dropdown option values"""
+
+    def __init__(self, options, built_at=None):
+        self.options = [o for o in options if o.get('value')]
+        self.built_at = built_at if built_at is not None else time.time()
+        self.by_name = {}
+        self.by_alias = {}
+        for option in self.options:
+            name = normalize_location(option['text'])
+            self.by_name.setdefault(name, option['value'])
+            self.by_name.setdefault(normalize_location(option['value']), option['value'])
+            for alias in _aliases(option['text']):
+                self.by_alias.setdefault(alias, option['value'])
+
+    def is_stale(self, ttl=LOCATION_INDEX_TTL):
+        return (time.time() - self.built_at) > ttl
+
+    def lookup(self, location):
+        """Return the option value for a location, or None if it is not listed"""
+        key = normalize_location(location)
+        if not key:
+            return None
+        if key in self.by_name:
+            return self.by_name[key]
+        if key in self.by_alias:
+            return self.by_alias[key]
+        # Same containment rule fill_form always used, in dropdown order
+        for option in self.options:
+            if key in normalize_location(option['text']):
+                return option['value']
+        return None
+
+    def label_for(self, value):
+        for option in self.options:
+            if option['value'] == value:
+                return option['text']
+        return None
+
+    def save(self, path=LOCATION_INDEX_PATH):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'built_at': self.built_at, 'options': self.options}, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=LOCATION_INDEX_PATH):
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data['options'], built_at=data['built_at'])
+
+# Process-wide cache; the index is plain data, so all worker threads can share it
+_index = None
+_index_lock = Lock()
+
+def get_cached_index(ttl=LOCATION_INDEX_TTL, path=LOCATION_INDEX_PATH):
+    """Return a fresh index from memory or disk without touching the page"""
+    global _index
+    with _index_lock:
+        if _index is not None and not _index.is_stale(ttl):
+            return _index
+        if path and os.path.exists(path):
+            try:
+                index = LocationIndex.load(path)
+                if not index.is_stale(ttl) and index.options:
+                    _index = index
+                    logger.info(f"Loaded location index with {len(index.options)} options from {path}")
+                    return _index
+            except Exception as e:
+                logger.warning(f"Could not load location index from {path}: {e}")
+    return None
+
+def store_index(options, path=LOCATION_INDEX_PATH):
+    """Build an index from raw dropdown options, cache it and persist it"""
+    global _index
+    index = LocationIndex(options)
+    with _index_lock:
+        _index = index
+    if path:
+        try:
+            index.save(path)
+        except Exception as e:
+            logger.warning(f"Could not persist location index to {path}: {e}")
+    logger.info(f"Built location index with {len(index.options)} options")
+    return index
+
+def invalidate_index(path=LOCATION_INDEX_PATH):
+    """Drop the cached index, e.g. when its values no longer match the dropdown"""
+    global _index
+    with _index_lock:
+        _index = None
+    if path and os.path.exists(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def get_location_index(page, selector, refresh=False):
+    """Return the cached index, building it from the page's dropdown in one evaluate call if needed"""
+    if not refresh:
+        index = get_cached_index()
+        if index:
+            return index
+    options = page.evaluate(OPTIONS_SCRIPT, selector)
+    if not options:
+        return None
+    return store_index(options)
@@ -0,0 +1,196 @@
+from datetime import datetime
+import os
+import threading
+from threading import Lock
+import logging
+from .browser_pool import get_browser_pool, STEALTH_INIT_SCRIPT
+from .captcha_capture import CaptchaImageCapture
+from .asset_cache import ASSET_CACHE_SYNC, attach_asset_cache, get_asset_cache
+from .request_policy import get_request_policy
+from .storage_state import seed_context_options, capture_storage_state, invalidate_storage_state
+
+logger = logging.getLogger(__name__)
+
+CEAC_NIV_STATUS_URL = 'https://ceac.state.gov/ceacstattracker/status.aspx?App=NIV'
+
+# Pool sizing (overridable through the environment)
+PAGE_POOL_SIZE = int(os.environ.get('PAGE_POOL_SIZE', 1))
+PAGE_POOL_TTL = int(os.environ.get('PAGE_POOL_TTL', 240))  # Seconds before a warm page is refreshed
+PAGE_POOL_VERIFY_TIMEOUT = int(os.environ.get('PAGE_POOL_VERIFY_TIMEOUT', 30000))  # ms
+
+# Element proving the NIV form is rendered and usable
+FORM_READY_SELECTOR = '#Visa_Case_Number'
+
+class WarmPage:
+    """A leased context whose page has been sent to the NIV status form"""
+
+    def __init__(self, lease, page, captcha_capture=None, storage_state_version=None, navigated=True):
+        self.lease = lease
+        self.page = page
+        # False when the navigation was left for acquire because the context routes its requests
+        self.navigated = navigated
+        self.captcha_capture = captcha_capture
+        # Snapshot the context was seeded from, if any
+        self.storage_state_version = storage_state_version
+        self.loaded_at = datetime.now()
+
+    @property
+    def context(self):
+        return self.lease.context
+
+    def age(self):
+        return (datetime.now() - self.loaded_at).total_seconds()
+
+class WarmPagePool:
+    """Keeps pages already sitting on the CEAC NIV form, ready to be filled.
+
+    Refilling starts the navigation without waiting for it: Chromium loads the
+    form in the background while the owning thread serves the current check,
+    and the form is only verified when the page is handed out. Like the
+    browser pool, a page pool belongs to the thread that created it.
+
+    Sync route handlers only run while the owning thread is inside a
+    Playwright call, so a background navigation through them would stall.
+    When the request policy or the sync asset cache is on, refill only
+    prepares the context and page with them attached, and the navigation runs
+    with goto on acquire.
+    """
+
+    def __init__(self, browser_pool, size=PAGE_POOL_SIZE, ttl=PAGE_POOL_TTL,
+                 verify_timeout=PAGE_POOL_VERIFY_TIMEOUT, url=CEAC_NIV_STATUS_URL):
+        self.browser_pool = browser_pool
+        self.size = max(0, size)
+        self.ttl = ttl
+        self.verify_timeout = verify_timeout
+        self.url = url
+        self.pages = []
+        self.stats_counters = {
+            'hits': 0,
+            'misses': 0,
+            'refreshed': 0,
+            'deferred': 0,
+            'discarded': 0
+        }
+
+    def refill(self):
+        """Top the pool up to its target size, starting navigations asynchronously"""
+        while len(self.pages) < self.size:
+            try:
+                # Start from the last good cookies so the navigation can skip the challenge
+                storage_state_version, seed_options = seed_context_options()
+                lease = self.browser_pool.new_context(**seed_options)
+                # Listen before navigating so the form's CAPTCHA image response is captured
+                captcha_capture = CaptchaImageCapture().attach(lease.context)
+                # Cache first so the policy, registered last, runs before it
+                attach_asset_cache(lease.context)
+                policy = get_request_policy()
+                policy.attach(lease.context)
+                routed = policy.enabled or (ASSET_CACHE_SYNC and get_asset_cache() is not None)
+                page = lease.context.new_page()
+                page.set_default_timeout(90000)
+                page.add_init_script(STEALTH_INIT_SCRIPT)
+                if not routed:
+                    # Kick off the navigation without waiting for the response
+                    page.evaluate("url => { window.location.href = url; }", self.url)
+                self.pages.append(WarmPage(lease, page, captcha_capture, storage_state_version, navigated=not routed))
+            except Exception as e:
+                logger.error(f"Failed to pre-warm NIV form page: {str(e)}")
+                break
+
+    def _verify(self, warm):
+        """Make sure the warm page shows the NIV form, navigating it if deferred and refreshing it if stale"""
+        if not warm.navigated:
+            # This thread is now inside Playwright calls, so the route handlers get to run
+            warm.page.goto(self.url, wait_until='domcontentloaded', timeout=60000)
+            warm.navigated = True
+            warm.loaded_at = datetime.now()
+            self.stats_counters['deferred'] += 1
+        elif warm.age() > self.ttl:
+            logger.info(f"Warm page is {warm.age():.0f}s old, refreshing before use")
+            warm.page.goto(self.url, wait_until='domcontentloaded', timeout=60000)
+            warm.loaded_at = datetime.now()
+            self.stats_counters['refreshed'] += 1
+        warm.page.wait_for_selector(FORM_READY_SELECTOR, state='attached', timeout=self.verify_timeout)
+        capture_storage_state(warm.context)
+
+    def _discard(self, warm):
+        self.stats_counters['discarded'] += 1
+        try:
+            warm.page.close()
+        except Exception:
+            pass
+        self.browser_pool.release(warm.lease)
+
+    def acquire(self):
+        """Hand out a verified warm page, or None if none could be prepared"""
+        warm = None
+        while self.pages:
+            # The oldest page has had the most time to finish loading
+            candidate = self.pages.pop(0)
+            try:
+                self._verify(candidate)
+                warm = candidate
+                break
+            except Exception as e:
+                logger.warning(f"Discarding warm page that failed verification: {str(e)}")
+                invalidate_storage_state(candidate.storage_state_version, 'warm page never showed the NIV form')
+                self._discard(candidate)
+
+        if warm:
+            self.stats_counters['hits'] += 1
+        else:
+            self.stats_counters['misses'] += 1
+
+        self.refill()
+        return warm
+
+    def close(self):
+        """Release every warm page"""
+        while self.pages:
+            warm = self.pages.pop()
+            try:
+                warm.page.close()
+            except Exception:
+                pass
+            self.browser_pool.release(warm.lease)
+
+    def stats(self):
+        """Return pool statistics"""
+        return {
+            'size': self.size,
+            'ttl': self.ttl,
+            'ready': len(self.pages),
+            **self.stats_counters
+        }
+
+# One page pool per thread, alongside that thread's browser pool
+_thread_pools = threading.local()
+_all_pools = []
+_all_pools_lock = Lock()
+
+def get_page_pool(headless=True):
+    """Return the warm page pool owned by the calling thread, creating and filling it on first use"""
+    pool = getattr(_thread_pools, 'pool', None)
+    if pool is None:
+        pool = WarmPagePool(get_browser_pool(headless=headless))
+        _thread_pools.pool = pool
+        with _all_pools_lock:
+            _all_pools.append(pool)
+        pool.refill()
+    return pool
+
+def close_page_pool():
+    """Release the warm pages owned by the calling thread, if any"""
+    pool = getattr(_thread_pools, 'pool', None)
+    if pool is None:
+        return
+    pool.close()
+    _thread_pools.pool = None
+    with _all_pools_lock:
+        if pool in _all_pools:
+            _all_pools.remove(pool)
+
+def page_pool_stats():
+    """Aggregate statistics for every page pool in this process"""
+    with _all_pools_lock:
+        return [pool.stats() for pool in _all_pools]
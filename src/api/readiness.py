@@ -0,0 +1,191 @@
+"""Event-driven readiness conditions for the CEAC status page.
+
+These replace fixed sleeps: every wait returns as soon as its condition holds
+and gives up when the step's deadline runs out.
+"""
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Per-step deadlines in milliseconds
+NAVIGATION_READY_TIMEOUT = 15000
+CLOUDFLARE_CLEARANCE_TIMEOUT = 30000
+FORM_READY_TIMEOUT = 10000
+POSTBACK_TIMEOUT = 60000
+RESULT_SETTLE_TIMEOUT = 5000
+
+# Any of these proves the NIV form has rendered
+FORM_FIELD_SELECTOR = '#Location_Dropdown, select[id*="Location_Dropdown"], select[id*="ddlLocation"], #Visa_Case_Number'
+
+# Elements shown after a postback: the result popup or an error label
+RESULT_SELECTOR = 'div[role="dialog"], div.modal, div.popup, div[id*="popup"], div[id*="modal"], text=/Application Received/i, span[id*="lblError"], #ctl00_ContentPlaceHolder1_lblError'
+
+# True once the document is loaded and no ASP.NET AJAX postback is in flight
+POSTBACK_IDLE_SCRIPT = """() => {
+    if (document.readyState !== 'complete') return false;
+    try {
+        if (window.Sys && Sys.WebForms && Sys.WebForms.PageRequestManager) {
+            const prm = Sys.WebForms.PageRequestManager.getInstance();
+            if (prm && prm.get_isInAsyncPostBack()) return false;
+        }
+    } catch (e) {}
+    return true;
+}"""
+
+# True once the location dropdown is populated and the form fields are present
+FORM_READY_SCRIPT = """() => {
+    const dropdown = document.querySelector('#Location_Dropdown, select[id*="Location_Dropdown"], select[id*="ddlLocation"]');
+    const caseField = document.querySelector('#Visa_Case_Number, input[id*="Visa_Case_Number"]');
+    return !!(dropdown && dropdown.options.length > 1 && caseField);
+}"""
+
+# True while a Cloudflare challenge page is being shown
+CLOUDFLARE_CHALLENGE_SCRIPT = """() => {
+    const html = document.documentElement ? document.documentElement.innerHTML : '';
+    return html.includes('cf-browser-verification') || html.includes('challenge-platform') ||
+        document.title.includes('Just a moment');
+}"""
+
+# BotDetect CAPTCHA image on the NIV form
+CAPTCHA_IMAGE_SELECTOR = '#c_status_ctl00_contentplaceholder1_defaultcaptcha_CaptchaImage'
+CAPTCHA_RELOAD_TIMEOUT = 10000
+
+# Asks BotDetect for a new image (its reload icon, or a cache-busted image URL) and returns the old src
+CAPTCHA_RELOAD_SCRIPT = """(selector) => {
+    const img = document.querySelector(selector);
+    if (!img) return null;
+    const previous = img.src;
+    const reload = document.querySelector('[id$="_ReloadIcon"], [id$="_ReloadLink"]');
+    if (reload) {
+        reload.click();
+    } else {
+        img.src = previous.replace(/&d=\\d+/, '') + '&d=' + Date.now();
+    }
+    return previous;
+}"""
+
+# True once the CAPTCHA image shows a different, fully loaded src
+CAPTCHA_IMAGE_CHANGED_SCRIPT = """([selector, previous]) => {
+    const img = document.querySelector(selector);
+    return !!(img && img.src !== previous && img.complete && img.naturalWidth > 0);
+}"""
+
+# Current values of the NIV form fields and the CAPTCHA image src
+FORM_STATE_SCRIPT = """(captchaSelector) => {
+    const value = (selector) => {
+        const el = document.querySelector(selector);
+        return el ? el.value : null;
+    };
+    const img = document.querySelector(captchaSelector);
+    return {
+        location: value('#Location_Dropdown, select[id*="Location_Dropdown"]'),
+        application_id: value('#Visa_Case_Number, input[id*="Visa_Case_Number"]'),
+        passport_number: value('#Passport_Number, input[id*="Passport_Number"]'),
+        surname: value('#Surname, input[id*="Surname"]'),
+        captcha_src: img ? img.src : null
+    };
+}"""
+
+def form_state_matches(state, expected):
+    """Whether the form still holds the values filled in; a None expectation only requires a value"""
+    if not state or not expected:
+        return False
+    for key, value in expected.items():
+        current = (state.get(key) or '').strip().upper()
+        if not current:
+            return False
+        if value is not None and current != value.strip().upper():
+            return False
+    return True
+
+class Deadline:
+    """Tracks the time left for one step"""
+
+    def __init__(self, timeout_ms):
+        self.timeout_ms = timeout_ms
+        self.expires_at = time.monotonic() + timeout_ms / 1000.0
+
+    def remaining_ms(self, minimum=1):
+        """Milliseconds left, never below minimum so Playwright does not treat it as 'no timeout'"""
+        return max(minimum, int((self.expires_at - time.monotonic()) * 1000))
+
+    def expired(self):
+        return time.monotonic() >= self.expires_at
+
+def wait_for_selector(page, selector, deadline, state='attached'):
+    """Wait for a selector within the deadline, returning the element or None"""
+    try:
+        return page.wait_for_selector(selector, state=state, timeout=deadline.remaining_ms())
+    except Exception as e:
+        logger.debug(f"Selector {selector!r} not ready: {e}")
+        return None
+
+def wait_for_condition(page, script, deadline, arg=None):
+    """Wait for a JavaScript predicate to hold within the deadline"""
+    try:
+        page.wait_for_function(script, arg=arg, timeout=deadline.remaining_ms())
+        return True
+    except Exception as e:
+        logger.debug(f"Condition not met before deadline: {e}")
+        return False
+
+def wait_for_network_idle(page, deadline):
+    """Wait for the network to go quiet within the deadline"""
+    try:
+        page.wait_for_load_state('networkidle', timeout=deadline.remaining_ms())
+        return True
+    except Exception:
+        return False
+
+def wait_for_form_ready(page, timeout_ms=FORM_READY_TIMEOUT):
+    """Wait until the NIV form is rendered and its location dropdown is populated"""
+    deadline = Deadline(timeout_ms)
+    return (wait_for_condition(page, POSTBACK_IDLE_SCRIPT, deadline)
+            and wait_for_condition(page, FORM_READY_SCRIPT, deadline))
+
+def wait_for_navigation_ready(page, timeout_ms=NAVIGATION_READY_TIMEOUT,
+                              challenge_timeout_ms=CLOUDFLARE_CLEARANCE_TIMEOUT, on_challenge=None):
+    """Wait for the NIV form after a navigation, allowing extra time for a Cloudflare challenge.
+    
+    on_challenge, if given, is called once when a challenge page is detected.
+    """
+    if wait_for_selector(page, FORM_FIELD_SELECTOR, Deadline(timeout_ms)):
+        return True
+
+    try:
+        challenged = page.evaluate(CLOUDFLARE_CHALLENGE_SCRIPT)
+    except Exception:
+        challenged = False
+    if not challenged:
+        return False
+
+    logger.warning("Detected Cloudflare challenge, waiting for clearance")
+    if on_challenge:
+        on_challenge()
+    return wait_for_selector(page, FORM_FIELD_SELECTOR, Deadline(challenge_timeout_ms)) is not None
+
+def wait_for_postback(page, timeout_ms=POSTBACK_TIMEOUT):
+    """Wait for a form postback to finish and its result or error to be rendered"""
+    deadline = Deadline(timeout_ms)
+    try:
+        page.wait_for_load_state('domcontentloaded', timeout=deadline.remaining_ms())
+    except Exception:
+        pass
+    element = wait_for_selector(page, RESULT_SELECTOR, deadline, state='visible')
+    # Let scripts that populate the popup finish, bounded by a short settle deadline
+    settle = Deadline(min(RESULT_SETTLE_TIMEOUT, deadline.remaining_ms()))
+    wait_for_condition(page, POSTBACK_IDLE_SCRIPT, settle)
+    return element is not None
+
+def reload_captcha_image(page, timeout_ms=CAPTCHA_RELOAD_TIMEOUT):
+    """Swap in a new CAPTCHA image without reloading the page; False if it did not change"""
+    try:
+        previous = page.evaluate(CAPTCHA_RELOAD_SCRIPT, CAPTCHA_IMAGE_SELECTOR)
+    except Exception as e:
+        logger.warning(f"Could not trigger CAPTCHA reload: {e}")
+        return False
+    if previous is None:
+        return False
+    return wait_for_condition(page, CAPTCHA_IMAGE_CHANGED_SCRIPT, Deadline(timeout_ms),
+                              arg=[CAPTCHA_IMAGE_SELECTOR, previous])
@@ -0,0 +1,163 @@
+"""Request interception policy for CEAC browser contexts.
+
+status.aspx loads fonts, stylesheets, images and analytics that play no part
+in the ASP.NET postback. The policy routes every request of a context through
+an ordered rule list; the first matching rule decides whether it goes out.
+
+Modes (REQUEST_POLICY_MODE):
+    off      no routing at all (the default)
+    report   rules are matched and counted but nothing is blocked, to see what
+             a profile would drop before turning it on
+    enforce  requests matched by a block rule are aborted
+
+Sync Playwright dispatches route handlers only while the owning thread is
+inside a Playwright call. The page pool therefore attaches the policy to its
+warm pages but leaves their navigation for acquire instead of running it in
+the background.
+
+Validate a profile against the live form with tools/validate_request_policy.py.
+"""
+import os
+import re
+import threading
+import logging
+from .captcha_capture import CAPTCHA_IMAGE_URL_PATTERN
+
+logger = logging.getLogger(__name__)
+
+REQUEST_POLICY_MODE = os.environ.get('REQUEST_POLICY_MODE', 'off')
+# Comma-separated block rules to turn into allow rules, e.g. "stylesheets,images"
+REQUEST_POLICY_ALLOW = [name.strip() for name in os.environ.get('REQUEST_POLICY_ALLOW', '').split(',') if name.strip()]
+
+REQUEST_POLICY_MODES = ('off', 'report', 'enforce')
+SAMPLE_URLS_PER_RULE = 5
+
+class RequestRule:
+    """Matches requests by resource type and/or URL pattern; no criteria matches everything"""
+
+    def __init__(self, name, action, resource_types=None, url_pattern=None):
+        self.name = name
+        self.action = action
+        self.resource_types = frozenset(resource_types or ())
+        self.url_pattern = re.compile(url_pattern, re.IGNORECASE) if isinstance(url_pattern, str) else url_pattern
+
+    def matches(self, resource_type, url):
+        if self.resource_types and resource_type not in self.resource_types:
+            return False
+        if self.url_pattern and not self.url_pattern.search(url):
+            return False
+        return True
+
+# Everything the ASP.NET postback needs is allowed (the document, WebResource/ScriptResource
+# scripts, partial-postback XHRs, the BotDetect image and Cloudflare's challenge); the rest is blocked
+DEFAULT_RULES = [
+    RequestRule('captcha-image', 'allow', url_pattern=CAPTCHA_IMAGE_URL_PATTERN),
+    RequestRule('cloudflare', 'allow', url_pattern=r'challenges\.cloudflare\.com|/cdn-cgi/'),
+    RequestRule('analytics', 'block',
+                url_pattern=r'google-analytics\.com|googletagmanager\.com|doubleclick\.net|dap\.digitalgov\.gov'),
+    RequestRule('page', 'allow', resource_types={'document', 'script', 'xhr', 'fetch'}),
+    RequestRule('fonts', 'block', resource_types={'font'}),
+    RequestRule('stylesheets', 'block', resource_types={'stylesheet'}),
+    RequestRule('images', 'block', resource_types={'image'}),
+    RequestRule('media', 'block', resource_types={'media'}),
+    RequestRule('other', 'block'),
+]
+
+class RequestPolicy:
+    """Ordered rules plus per-rule counters, shared by every context it is attached to"""
+
+    def __init__(self, rules=None, mode=REQUEST_POLICY_MODE, allow=REQUEST_POLICY_ALLOW):
+        if mode not in REQUEST_POLICY_MODES:
+            raise ValueError(f"Unknown request policy mode {mode!r}; expected one of {', '.join(REQUEST_POLICY_MODES)}")
+        self.mode = mode
+        self.rules = [RequestRule(rule.name, 'allow' if rule.name in allow else rule.action,
+                                  rule.resource_types, rule.url_pattern)
+                      for rule in (rules or DEFAULT_RULES)]
+        self.lock = threading.Lock()
+        self.counters = {rule.name: {'action': rule.action, 'hits': 0, 'samples': []} for rule in self.rules}
+        self.totals = {'allowed': 0, 'blocked': 0, 'would_block': 0, 'unmatched': 0}
+
+    @property
+    def enabled(self):
+        return self.mode != 'off'
+
+    def decide(self, resource_type, url):
+        """Return (rule, block) for a request and record the hit"""
+        rule = next((rule for rule in self.rules if rule.matches(resource_type, url)), None)
+        block = rule is not None and rule.action == 'block' and self.mode == 'enforce'
+        with self.lock:
+            if rule is None:
+                self.totals['unmatched'] += 1
+            else:
+                counter = self.counters[rule.name]
+                counter['hits'] += 1
+                if rule.action == 'block' and len(counter['samples']) < SAMPLE_URLS_PER_RULE:
+                    counter['samples'].append(url)
+            if block:
+                self.totals['blocked'] += 1
+            else:
+                self.totals['allowed'] += 1
+                if rule is not None and rule.action == 'block':
+                    self.totals['would_block'] += 1
+        return rule, block
+
+    def handle(self, route):
+        """Sync Playwright route handler"""
+        _, block = self.decide(route.request.resource_type, route.request.url)
+        if block:
+            route.abort('blockedbyclient')
+        else:
+            # Let later-registered handlers (or the network) serve it
+            route.fallback()
+
+    async def handle_async(self, route):
+        """Async Playwright route handler"""
+        _, block = self.decide(route.request.resource_type, route.request.url)
+        if block:
+            await route.abort('blockedbyclient')
+        else:
+            await route.fallback()
+
+    def attach(self, context):
+        """Route a sync BrowserContext through the policy; no-op when the policy is off"""
+        if self.enabled:
+            context.route('**/*', self.handle)
+        return context
+
+    async def attach_async(self, context):
+        """Route an async BrowserContext through the policy; no-op when the policy is off"""
+        if self.enabled:
+            await context.route('**/*', self.handle_async)
+        return context
+
+    def stats(self):
+        with self.lock:
+            return {
+                'mode': self.mode,
+                **self.totals,
+                'rules': {name: {**counter, 'samples': list(counter['samples'])}
+                          for name, counter in self.counters.items()}
+            }
+
+# Shared by every context in the process so the counters add up
+_request_policy = None
+_request_policy_lock = threading.Lock()
+
+def get_request_policy():
+    """Process-wide request policy"""
+    global _request_policy
+    with _request_policy_lock:
+        if _request_policy is None:
+            _request_policy = RequestPolicy()
+            if _request_policy.enabled:
+                logger.info(f"Request policy in {_request_policy.mode} mode")
+        return _request_policy
+
+def set_request_policy(policy):
+    """Replace the process-wide policy; contexts created afterwards use the new one"""
+    global _request_policy
+    with _request_policy_lock:
+        _request_policy = policy
+
+def request_policy_stats():
+    return get_request_policy().stats()
@@ -0,0 +1,229 @@
+"""Single-roundtrip extraction of the CEAC status result.
+
+SNAPSHOT_SCRIPT collects everything the parser needs from the page (popup
+text, same-origin iframe text, result labels and error messages) in one
+evaluate call; parse_status_snapshot turns that snapshot into the API result
+in Python. The popup is left open until the snapshot has parsed, so the
+selector fallback still sees it; CLOSE_POPUP_SCRIPT dismisses it afterwards.
+"""
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+POPUP_SELECTORS = [
+    'div[role="dialog"]',
+    'div.modal',
+    'div.popup',
+    'div[id*="popup"]',
+    'div[id*="modal"]',
+    'div[id*="dialog"]'
+]
+
+ERROR_SELECTORS = [
+    '.error-message',
+    '.validation-summary-errors',
+    'span[id*="lblError"]',
+    '#ctl00_ContentPlaceHolder1_lblError',
+    '.alert-danger',
+    'div[class*="error"]'
+]
+
+# Status values CEAC shows as the popup heading
+KNOWN_STATUSES = [
+    'Application Received',
+    'Administrative Processing',
+    'Ready',
+    'Issued',
+    'Refused',
+    'In Transit',
+    'At NVC',
+    'Transfer In Progress',
+    'Return to Applicant',
+    'Expired',
+    'No Status'
+]
+
+# Whole-word matches, so 'Ready' does not match 'already' nor 'Issued' 'reissued'
+STATUS_PATTERNS = [(status, re.compile(r'\b' + re.escape(status) + r'\b', re.IGNORECASE))
+                   for status in KNOWN_STATUSES]
+
+# Result label id fragments mapped to result fields
+LABEL_FIELDS = [
+    ('lblStatusDate', 'case_last_updated'),
+    ('lblSubmitDate', 'case_created'),
+    ('lblStatus', 'status'),
+    ('lblCaseNo', 'case_number'),
+    ('lblMessage', 'description')
+]
+
+# Text labels mapped to result fields, most specific first
+TEXT_FIELDS = [
+    ('Application ID or Case Number:', 'case_number'),
+    ('Case Number:', 'case_number'),
+    ('Case Created:', 'case_created'),
+    ('Case Last Updated:', 'case_last_updated'),
+    ('Created:', 'case_created'),
+    ('Updated:', 'case_last_updated')
+]
+
+SNAPSHOT_SCRIPT = """(options) => {
+    const visible = (el) => {
+        if (!el) return false;
+        const style = window.getComputedStyle(el);
+        return style.visibility !== 'hidden' && style.display !== 'none' &&
+            !!(el.offsetWidth || el.offsetHeight || el.getClientRects().length);
+    };
+    const text = (el) => ((el && (el.innerText || el.textContent)) || '').trim();
+    const collectLabels = (doc, labels) => {
+        doc.querySelectorAll('[id*="lbl"]').forEach((el) => {
+            const value = text(el);
+            if (value) labels[el.id] = value;
+        });
+    };
+
+    const snapshot = {popup: null, frames: [], labels: {}, errors: []};
+
+    for (const selector of options.popupSelectors) {
+        const el = Array.from(document.querySelectorAll(selector)).find(visible);
+        if (el) {
+            snapshot.popup = {selector: selector, text: text(el)};
+            break;
+        }
+    }
+
+    collectLabels(document, snapshot.labels);
+
+    document.querySelectorAll('iframe').forEach((frame) => {
+        try {
+            const doc = frame.contentDocument;
+            if (doc && doc.body) {
+                snapshot.frames.push(text(doc.body));
+                collectLabels(doc, snapshot.labels);
+            }
+        } catch (e) {
+            // Cross-origin frame, left to the fallback path
+        }
+    });
+
+    for (const selector of options.errorSelectors) {
+        const errors = Array.from(document.querySelectorAll(selector)).map(text).filter(Boolean);
+        if (errors.length) {
+            snapshot.errors = errors;
+            break;
+        }
+    }
+
+    return snapshot;
+}"""
+
+# Clicks the result popup's Close control; returns whether one was found
+CLOSE_POPUP_SCRIPT = """() => {
+    const visible = (el) => {
+        const style = window.getComputedStyle(el);
+        return style.visibility !== 'hidden' && style.display !== 'none' &&
+            !!(el.offsetWidth || el.offsetHeight || el.getClientRects().length);
+    };
+    const close = Array.from(document.querySelectorAll('button, a, [role="button"]')).find((el) =>
+        visible(el) && ((el.innerText || el.textContent || '').trim() === 'Close' ||
+            el.classList.contains('close') || el.getAttribute('aria-label') === 'Close'));
+    if (!close) return false;
+    close.click();
+    return true;
+}"""
+
+def snapshot_options():
+    """Arguments passed to SNAPSHOT_SCRIPT"""
+    return {
+        'popupSelectors': POPUP_SELECTORS,
+        'errorSelectors': ERROR_SELECTORS
+    }
+
+def mentions_status(text):
+    """Whether the text names a known status as a whole word"""
+    return any(pattern.search(text) for _, pattern in STATUS_PATTERNS)
+
+def _first_line(value):
+    """Trim a captured value to its first non-empty line"""
+    for line in value.split('\n'):
+        line = line.strip()
+        if line:
+            return line
+    return ''
+
+def _parse_labels(labels, status_info):
+    """Read fields from the result labels (e.g. ucApplicationStatusView_lblStatus)"""
+    for label_id, value in labels.items():
+        for fragment, key in LABEL_FIELDS:
+            if label_id.endswith(fragment) and key not in status_info:
+                status_info[key] = value.strip() if key == 'description' else _first_line(value)
+                break
+
+def _parse_text(text, status_info):
+    """Read fields from the visible popup text"""
+    lines = [line.strip() for line in text.split('\n') if line.strip()]
+
+    if 'status' not in status_info:
+        known = {status.upper(): status for status in KNOWN_STATUSES}
+        for line in lines:
+            if line.upper() in known:
+                status_info['status'] = known[line.upper()]
+                break
+        else:
+            # Older popups embed the status in a sentence
+            for status, pattern in STATUS_PATTERNS:
+                if pattern.search(text):
+                    status_info['status'] = status
+                    break
+
+    for label, key in TEXT_FIELDS:
+        if key in status_info:
+            continue
+        match = re.search(re.escape(label) + r'[ \t]*(.*)', text)
+        if not match:
+            continue
+        value = _first_line(match.group(1))
+        if not value:
+            # The value is rendered on the line after its label
+            following = text[match.end():]
+            value = _first_line(following)
+        if key == 'case_number' and value:
+            value = value.split()[0]
+        if value:
+            status_info[key] = value
+
+    if 'description' not in status_info:
+        for line in lines:
+            if line.startswith('Your case') or (len(line) > 60 and not line.endswith(':')):
+                status_info['description'] = line
+                break
+
+def parse_status_snapshot(snapshot):
+    """Turn a page snapshot into a status result.
+
+    Returns None when the snapshot holds no recognisable result, so the caller
+    can fall back to the selector-by-selector path.
+    """
+    if not snapshot:
+        return None
+
+    status_info = {}
+    _parse_labels(snapshot.get('labels') or {}, status_info)
+
+    sources = []
+    if snapshot.get('popup'):
+        sources.append(snapshot['popup'].get('text') or '')
+    sources.extend(frame for frame in snapshot.get('frames') or [] if mentions_status(frame))
+    for text in sources:
+        _parse_text(text, status_info)
+
+    errors = snapshot.get('errors') or []
+    if errors:
+        logger.error(f"Found errors: {errors}")
+        return {'success': False, 'error': ' '.join(errors)}
+
+    if not status_info.get('status'):
+        return None
+
+    logger.info(f"Successfully extracted status from snapshot: {status_info}")
+    return {'success': True, 'data': status_info}
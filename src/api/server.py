@@ -1,7 +1,8 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, copy_current_request_context
 from flask_cors import CORS
 from playwright.sync_api import sync_playwright
 import base64
+import functools
 import io
 import os
 import re
@@ -12,7 +13,20 @@ import uuid
 import threading
 from threading import Lock
 import logging
-from .captcha_handler import OnnxCaptchaHandle, ManualCaptchaHandle, CaptchaHandle
+from .captcha_handler import is_confident, captcha_key, load_captcha_handler, CAPTCHA_MODEL_VARIANT, CAPTCHA_LOAD_MODE
+from .browser_pool import get_browser_pool, browser_pool_stats, BROWSER_LAUNCH_ARGS, CONTEXT_OPTIONS, STEALTH_INIT_SCRIPT
+from .page_pool import get_page_pool, page_pool_stats, CEAC_NIV_STATUS_URL
+from . import readiness
+from . import result_extractor
+from . import location_index
+from .jobs import JobManager, JobQueueFull
+from .workers import BrowserWorkerPool, current_worker_id
+from .captcha_capture import CaptchaImageCapture
+from .request_policy import get_request_policy, request_policy_stats
+from .asset_cache import attach_asset_cache, asset_cache_stats
+from .http_checker import HttpVisaStatusChecker, HttpEngineBlocked
+from .storage_state import (seed_context_options, capture_storage_state, invalidate_storage_state,
+                            storage_state_stats)
 
 app = Flask(__name__)
 CORS(app)
@@ -25,34 +39,29 @@ logger = logging.getLogger(__name__)
 sessions = {}
 sessions_lock = Lock()
 SESSION_TIMEOUT = 300  # 5 minutes timeout
+CAPTCHA_MAX_REFRESHES = int(os.environ.get('CAPTCHA_MAX_REFRESHES', 3))  # In-place image refreshes per check for low-confidence guesses
+CAPTCHA_CAPTURE_MODE = os.environ.get('CAPTCHA_CAPTURE_MODE', 'network')  # 'network' (image response bytes) or 'screenshot'
+CHECK_ENGINE = os.environ.get('CHECK_ENGINE', 'browser')  # Default engine for automatic checks: 'browser' or 'http'
+CHECK_ENGINES = ('browser', 'http')
 
 # Global CAPTCHA handler
 captcha_handler = None
 
-def initialize_captcha_handler(use_onnx=True, model_path='captcha.onnx'):
-    """Initialize the CAPTCHA handler"""
+def initialize_captcha_handler(use_onnx=True, model_path='captcha.onnx', variant=CAPTCHA_MODEL_VARIANT,
+                               load_mode=CAPTCHA_LOAD_MODE):
+    """Initialize the CAPTCHA handler; variant 'int8' loads the quantized model when it exists.
+    
+    The model is loaded in a background thread by default (load_mode 'lazy'
+    waits for the first CAPTCHA, 'eager' loads before returning).
+    """
     global captcha_handler
-    if use_onnx:
-        try:
-            # Check if model file exists
-            if not os.path.exists(model_path):
-                logger.warning(f"ONNX model not found at {model_path}, falling back to manual CAPTCHA")
-                captcha_handler = ManualCaptchaHandle()
-            else:
-                captcha_handler = OnnxCaptchaHandle(model_path)
-                logger.info("Using ONNX CAPTCHA solver")
-        except Exception as e:
-            logger.error(f"Failed to initialize ONNX CAPTCHA handler: {e}")
-            captcha_handler = ManualCaptchaHandle()
-    else:
-        captcha_handler = ManualCaptchaHandle()
-        logger.info("Using manual CAPTCHA solver")
+    captcha_handler = load_captcha_handler(mode=load_mode, use_onnx=use_onnx, model_path=model_path, variant=variant)
 
-# Initialize on startup
+# Initialize on startup; this only starts the load
 initialize_captcha_handler()
 
 class VisaStatusChecker:
-    def __init__(self, session_id, auto_solve_captcha=True):
+    def __init__(self, session_id, auto_solve_captcha=True, use_browser_pool=True, use_page_pool=True):
         self.session_id = session_id
         self.playwright = None
         self.browser = None
@@ -60,57 +69,68 @@ class VisaStatusChecker:
         self.context = None
         self.created_at = datetime.now()
         self.auto_solve_captcha = auto_solve_captcha
+        self.use_browser_pool = use_browser_pool
+        self.use_page_pool = use_page_pool
+        self.browser_pool = None
+        self.lease = None
+        self.page_prewarmed = False
+        # Values last filled into the form and the CAPTCHA image last read, for in-place retries
+        self.form_values = None
+        self.last_captcha_src = None
+        self.last_captcha_key = None
+        self.captcha_capture = None
+        # Storage-state snapshot this checker's context was seeded from
+        self.storage_state_version = None
+        # Browser worker that owns this checker's Playwright objects
+        self.worker_id = current_worker_id()
         
     def start_browser(self, headless=True):
-        """Initialize playwright and browser with optimizations"""
-        self.playwright = sync_playwright().start()
+        """Lease a context from the warm browser pool, or launch a dedicated browser"""
+        if self.use_browser_pool and self.use_page_pool:
+            # Take a page that is already sitting on the NIV form if one is ready
+            page_pool = get_page_pool(headless=headless)
+            warm = page_pool.acquire()
+            if warm:
+                self.browser_pool = page_pool.browser_pool
+                self.lease = warm.lease
+                self.browser = warm.lease.browser
+                self.context = warm.context
+                self.page = warm.page
+                self.captcha_capture = warm.captcha_capture
+                self.storage_state_version = warm.storage_state_version
+                self.page_prewarmed = True
+                logger.info("Using pre-warmed NIV form page")
+                return
+            
+        # Seed the context with the last good cookies (Cloudflare clearance) when there are any
+        self.storage_state_version, seed_options = seed_context_options()
         
-        # Launch browser with performance optimizations
-        # Using configuration similar to successful implementations
-        self.browser = self.playwright.chromium.launch(
-            headless=headless,
-            args=[
-                '--disable-blink-features=AutomationControlled',
-                '--disable-dev-shm-usage',
-                '--disable-web-security',
-                '--disable-features=IsolateOrigins,site-per-process',
-                '--no-sandbox',
-                '--disable-setuid-sandbox',
-                '--disable-accelerated-2d-canvas',
-                '--disable-gpu',
-                '--window-size=1920,1080',
-                '--start-maximized',
-                '--disable-infobars',
-                '--disable-extensions',
-                '--disable-automation',
-                '--disable-background-timer-throttling',
-                '--disable-backgrounding-occluded-windows',
-                '--disable-renderer-backgrounding'
-            ]
-        )
+        if self.use_browser_pool:
+            # Per-request cost is a context creation instead of a process launch
+            self.browser_pool = get_browser_pool(headless=headless)
+            self.lease = self.browser_pool.new_context(**seed_options)
+            self.browser = self.lease.browser
+            self.context = self.lease.context
+        else:
+            self.playwright = sync_playwright().start()
+            
+            # Launch browser with performance optimizations
+            # Using configuration similar to successful implementations
+            self.browser = self.playwright.chromium.launch(
+                headless=headless,
+                args=BROWSER_LAUNCH_ARGS
+            )
+            
+            # Create context with optimizations
+            self.context = self.browser.new_context(**CONTEXT_OPTIONS, **seed_options)
         
-        # Create context with optimizations
-        self.context = self.browser.new_context(
-            viewport={'width': 1920, 'height': 1080},
-            user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            locale='en-US',
-            timezone_id='America/New_York',
-            permissions=['geolocation'],
-            ignore_https_errors=True,
-            # Add extra headers to appear more legitimate
-            extra_http_headers={
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
-                'Accept-Language': 'en-US,en;q=0.9',
-                'Accept-Encoding': 'gzip, deflate, br',
-                'DNT': '1',
-                'Connection': 'keep-alive',
-                'Upgrade-Insecure-Requests': '1'
-            }
-        )
+        # Keep the CAPTCHA image response so its bytes can go straight to the solver
+        self.captcha_capture = CaptchaImageCapture().attach(self.context)
         
-        # Remove blocking of resources - we need everything to load properly
-        # self.context.route("**/*.{png,jpg,jpeg,gif,svg,ico,woff,woff2,ttf,eot}", lambda route: route.abort())
-        # self.context.route("**/*.css", lambda route: route.abort())
+        # Serve static assets from the node-wide cache (ASSET_CACHE_SYNC=1); registered first so the policy below runs before it
+        attach_asset_cache(self.context)
+        # Drop requests the postback does not need (off unless REQUEST_POLICY_MODE is set)
+        get_request_policy().attach(self.context)
         
         self.page = self.context.new_page()
         
@@ -118,37 +138,27 @@ class VisaStatusChecker:
         self.page.set_default_timeout(90000)  # 90 seconds
         
         # Add stealth mode scripts
-        self.page.add_init_script("""
-            // Override the navigator.webdriver property
-            Object.defineProperty(navigator, 'webdriver', {
-                get: () => undefined
-            });
-            
-            // Override the chrome property
-            window.chrome = {
-                runtime: {},
-            };
-            
-            // Override the permissions query
-            const originalQuery = window.navigator.permissions.query;
-            window.navigator.permissions.query = (parameters) => (
-                parameters.name === 'notifications' ?
-                    Promise.resolve({ state: Notification.permission }) :
-                    originalQuery(parameters)
-            );
-        """)
+        self.page.add_init_script(STEALTH_INIT_SCRIPT)
         
     def close_browser(self):
-        """Close browser and playwright"""
+        """Close the page and context, returning the browser to the pool"""
         try:
             if self.page:
-                self.page.close()
-            if self.context:
-                self.context.close()
-            if self.browser:
-                self.browser.close()
-            if self.playwright:
-                self.playwright.stop()
+                try:
+                    self.page.close()
+                except Exception as e:
+                    logger.warning(f"Error closing page: {str(e)}")
+            if self.lease:
+                # Closes the context and hands the browser back to the pool
+                self.browser_pool.release(self.lease)
+                self.lease = None
+            else:
+                if self.context:
+                    self.context.close()
+                if self.browser:
+                    self.browser.close()
+                if self.playwright:
+                    self.playwright.stop()
         except Exception as e:
             logger.error(f"Error closing browser: {str(e)}")
             
@@ -159,54 +169,43 @@ class VisaStatusChecker:
     def navigate_to_visa_status_page(self):
         """Navigate to the visa status check page"""
         try:
+            if self.page_prewarmed:
+                # The page pool already verified the NIV form is present
+                logger.info("NIV form already loaded on pre-warmed page")
+                return True
+            
             logger.info("Navigating to CEAC visa status page (NIV)...")
             
             # Navigate directly to NIV form
-            response = self.page.goto('https://ceac.state.gov/ceacstattracker/status.aspx?App=NIV', 
+            response = self.page.goto(CEAC_NIV_STATUS_URL, 
                           wait_until='domcontentloaded', 
                           timeout=60000)
             
             if response and response.status != 200:
                 logger.error(f"Got status code: {response.status}")
+                invalidate_storage_state(self.storage_state_version, f"navigation returned {response.status}")
                 return False
             
-            # Wait a bit for any redirects or JavaScript to execute
-            self.page.wait_for_timeout(3000)
-            
-            # Check if we're on the right page by looking for NIV-specific form fields
+            # Wait for the NIV form fields (or a Cloudflare challenge to clear)
             try:
-                # Check for the location dropdown which should be present for NIV
-                location_dropdown = self.page.query_selector('select[id*="ddlLocation"]')
-                if location_dropdown:
-                    logger.info("Found NIV form with location dropdown")
+                # A challenge means the seeded clearance was not accepted
+                challenged = lambda: invalidate_storage_state(self.storage_state_version,
+                                                              'Cloudflare challenged a seeded context')
+                if readiness.wait_for_navigation_ready(self.page, on_challenge=challenged):
+                    logger.info("Found NIV form fields")
+                    # Let later contexts start from this context's cookies
+                    capture_storage_state(self.context)
                     return True
-                else:
-                    # If location dropdown not found, check if at least the case number field is present
-                    case_field = self.page.query_selector('#Visa_Case_Number')
-                    if case_field:
-                        logger.info("Found case number field")
-                        return True
-                    
-                    logger.error("Could not find expected NIV form fields")
-                    # Take a screenshot for debugging
-                    self.page.screenshot(path="debug_navigation.png")
-                    
-                    # Log the page URL and title
-                    logger.info(f"Current URL: {self.page.url}")
-                    logger.info(f"Page title: {self.page.title()}")
-                    
-                    # Check if there's a CloudFlare challenge or other issue
-                    page_content = self.page.content()
-                    if "Cloudflare" in page_content or "cf-browser-verification" in page_content:
-                        logger.error("Detected Cloudflare challenge")
-                        # Wait longer for Cloudflare to pass
-                        self.page.wait_for_timeout(10000)
-                        # Try to find the form fields again
-                        location_dropdown = self.page.query_selector('select[id*="ddlLocation"]')
-                        if location_dropdown:
-                            return True
-                    
-                    return False
+                
+                logger.error("Could not find expected NIV form fields")
+                invalidate_storage_state(self.storage_state_version, 'NIV form did not load')
+                # Take a screenshot for debugging
+                self.page.screenshot(path="debug_navigation.png")
+                
+                # Log the page URL and title
+                logger.info(f"Current URL: {self.page.url}")
+                logger.info(f"Page title: {self.page.title()}")
+                return False
                 
             except Exception as e:
                 logger.error(f"Error checking for form elements: {str(e)}")
@@ -230,36 +229,42 @@ class VisaStatusChecker:
         """Fill the visa status check form"""
         try:
             # Wait for form to be ready
-            self.page.wait_for_timeout(1000)
+            if not readiness.wait_for_form_ready(self.page):
+                logger.warning("Form readiness condition not met before deadline, continuing")
             
             # Fill Location dropdown
-            # First, we need to find the correct value for the location
-            location_dropdown = self.page.locator('#Location_Dropdown')
+            # Resolve the option value through the cached location index
+            dropdown_selector = '#Location_Dropdown'
+            location_dropdown = self.page.locator(dropdown_selector)
             if location_dropdown.count() == 0:
                 # Try alternative selectors
-                location_dropdown = self.page.locator('select[id*="Location_Dropdown"]')
+                dropdown_selector = 'select[id*="Location_Dropdown"]'
+                location_dropdown = self.page.locator(dropdown_selector)
             
             if location_dropdown.count() > 0:
-                # Get all options and find the one that contains our location text
-                options = location_dropdown.locator('option').all()
                 location_found = False
-                
-                for option in options:
-                    option_text = option.text_content()
-                    if location.upper() in option_text.upper():
-                        # Get the value attribute
-                        option_value = option.get_attribute('value')
-                        if option_value:
-                            location_dropdown.select_option(value=option_value)
-                            logger.info(f"Selected location: {option_text} (value: {option_value})")
-                            location_found = True
-                            break
+                option_value = None
+                for refresh in (False, True):
+                    index = location_index.get_location_index(self.page, dropdown_selector, refresh=refresh)
+                    option_value = index.lookup(location) if index else None
+                    if not option_value:
+                        continue
+                    try:
+                        location_dropdown.select_option(value=option_value, timeout=5000)
+                        logger.info(f"Selected location: {index.label_for(option_value)} (value: {option_value})")
+                        location_found = True
+                        break
+                    except Exception as e:
+                        # The cached index no longer matches the dropdown; rebuild it once
+                        logger.warning(f"Cached location value {option_value} rejected: {e}")
+                        location_index.invalidate_index()
                 
                 if not location_found:
                     # Try selecting by label as fallback
                     try:
-                        location_dropdown.select_option(label=location)
+                        location_dropdown.select_option(label=location, timeout=5000)
                         logger.info(f"Selected location by label: {location}")
+                        option_value = None
                     except:
                         logger.error(f"Could not find location '{location}' in dropdown options")
                         return False
@@ -303,17 +308,23 @@ class VisaStatusChecker:
                 logger.error("Could not find surname field")
                 return False
             
+            self.form_values = {
+                'location': option_value,
+                'application_id': application_id,
+                'passport_number': passport_number,
+                'surname': surname
+            }
             return True
             
         except Exception as e:
             logger.error(f"Error filling form: {str(e)}")
             return False
             
-    def get_captcha_image(self, save_to_file=False):
-        """Get the CAPTCHA image as base64 and optionally save to file"""
+    def get_captcha_bytes(self):
+        """Get the raw CAPTCHA image bytes, from the network response when possible"""
         try:
             # The CAPTCHA image ID is c_status_ctl00_contentplaceholder1_defaultcaptcha_CaptchaImage
-            captcha_element = self.page.locator('#c_status_ctl00_contentplaceholder1_defaultcaptcha_CaptchaImage')
+            captcha_element = self.page.locator(readiness.CAPTCHA_IMAGE_SELECTOR)
             
             if captcha_element.count() == 0:
                 logger.error("Could not find CAPTCHA image")
@@ -323,27 +334,82 @@ class VisaStatusChecker:
             
             # Wait for CAPTCHA to load
             captcha_element.wait_for(state='visible', timeout=10000)
+            self.last_captcha_src = captcha_element.evaluate('img => img.src')
             
-            # Take screenshot of CAPTCHA
-            captcha_bytes = captcha_element.screenshot()
-            
-            # Save to file if requested
-            if save_to_file:
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                filename = f"captcha_{self.session_id[:8]}_{timestamp}.png"
-                with open(filename, 'wb') as f:
-                    f.write(captcha_bytes)
-                logger.info(f"CAPTCHA image saved as {filename}")
-            
-            # Convert to base64
-            captcha_base64 = base64.b64encode(captcha_bytes).decode('utf-8')
+            captcha_bytes = None
+            if CAPTCHA_CAPTURE_MODE == 'network' and self.captcha_capture:
+                response = self.captcha_capture.response_for(self.last_captcha_src)
+                if response:
+                    try:
+                        captcha_bytes = response.body()
+                    except Exception as e:
+                        logger.warning(f"Could not read CAPTCHA response body, using screenshot: {e}")
+                else:
+                    logger.info("CAPTCHA image response not captured, using screenshot")
             
-            return captcha_base64
+            if captcha_bytes is None:
+                # Take screenshot of CAPTCHA
+                captcha_bytes = captcha_element.screenshot()
+            self.last_captcha_key = captcha_key(captcha_bytes)
+            return captcha_bytes
             
         except Exception as e:
             logger.error(f"Error getting CAPTCHA: {str(e)}")
             return None
             
+    def get_captcha_image(self, save_to_file=False):
+        """Get the CAPTCHA image as base64 and optionally save to file"""
+        captcha_bytes = self.get_captcha_bytes()
+        if not captcha_bytes:
+            return None
+        
+        # Save to file if requested
+        if save_to_file:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = f"captcha_{self.session_id[:8]}_{timestamp}.png"
+            with open(filename, 'wb') as f:
+                f.write(captcha_bytes)
+            logger.info(f"CAPTCHA image saved as {filename}")
+        
+        # Convert to base64
+        return base64.b64encode(captcha_bytes).decode('utf-8')
+            
+    def refresh_captcha(self):
+        """Load a new CAPTCHA image in place, keeping the filled form"""
+        if readiness.reload_captcha_image(self.page):
+            logger.info("Refreshed CAPTCHA image")
+            return True
+        logger.warning("CAPTCHA image did not refresh")
+        return False
+            
+    def retry_captcha(self, location, application_id, passport_number, surname):
+        """Get the form ready for another CAPTCHA attempt after a rejected submission.
+        
+        The postback keeps the filled fields, so normally only the CAPTCHA image
+        needs to change. The page is reloaded and re-filled only when the form
+        state was lost.
+        """
+        try:
+            state = self.page.evaluate(readiness.FORM_STATE_SCRIPT, readiness.CAPTCHA_IMAGE_SELECTOR)
+        except Exception as e:
+            logger.warning(f"Could not read form state: {e}")
+            state = None
+        
+        if readiness.form_state_matches(state, self.form_values):
+            # The postback usually renders a new image already; only reload it if it did not
+            if state['captcha_src'] and state['captcha_src'] != self.last_captcha_src:
+                logger.info("Form state preserved, new CAPTCHA already rendered")
+                return True
+            if self.refresh_captcha():
+                logger.info("Form state preserved, CAPTCHA refreshed in place")
+                return True
+        
+        logger.info("Form state lost, reloading page and re-filling form")
+        self.page.reload(wait_until='domcontentloaded')
+        readiness.wait_for_navigation_ready(self.page)
+        self.select_nonimmigrant_visa()
+        return self.fill_form(location, application_id, passport_number, surname)
+            
     def submit_with_captcha(self, captcha_text):
         """Submit form with CAPTCHA text"""
         try:
@@ -384,26 +450,22 @@ class VisaStatusChecker:
                     logger.error(f"JavaScript submission failed: {e}")
                     return {'success': False, 'error': 'Could not find or click submit button'}
             
-            # Wait for response with increased timeout
+            # Wait for the postback to complete and a popup or error to render
             logger.info("Waiting for page to load after submission...")
-            try:
-                # Wait for either a popup/modal or an error message
-                self.page.wait_for_selector(
-                    'div[role="dialog"], div.modal, div.popup, div[id*="popup"], div[id*="modal"], text=/Application Received/i, span[id*="lblError"], #ctl00_ContentPlaceHolder1_lblError',
-                    timeout=60000  # 60 seconds timeout
-                )
+            if readiness.wait_for_postback(self.page):
                 logger.info("Found result element (popup or error)")
-            except Exception as e:
-                logger.warning(f"Timeout waiting for result elements: {e}")
+            else:
+                logger.warning("Timeout waiting for result elements")
                 # Take a screenshot to see what's on the page
                 self.page.screenshot(path="timeout_screenshot.png")
                 logger.info("Timeout screenshot saved as timeout_screenshot.png")
             
-            # Additional wait for page to stabilize
-            self.page.wait_for_timeout(3000)
-            
             # Check if there's an error or if we got the status
-            return self.get_status_result()
+            result = self.get_status_result()
+            if self.last_captcha_key and 'captcha' in (result.get('error') or '').lower():
+                # The answer for this image was wrong; don't serve it from the cache again
+                captcha_handler.invalidate(self.last_captcha_key)
+            return result
             
         except Exception as e:
             logger.error(f"Error submitting form: {str(e)}")
@@ -417,10 +479,36 @@ class VisaStatusChecker:
             
     def get_status_result(self):
         """Extract the visa status from the result page"""
+        # Make sure no postback is still rendering the popup
+        readiness.wait_for_condition(
+            self.page, readiness.POSTBACK_IDLE_SCRIPT,
+            readiness.Deadline(readiness.RESULT_SETTLE_TIMEOUT)
+        )
+        
+        # Fast path: one evaluate call returns a snapshot parsed in Python
+        try:
+            snapshot = self.page.evaluate(result_extractor.SNAPSHOT_SCRIPT, result_extractor.snapshot_options())
+            result = result_extractor.parse_status_snapshot(snapshot)
+            if result:
+                # Only now, so the selector fallback below still finds an open popup
+                self.close_result_popup()
+                return result
+            logger.info("Snapshot held no recognisable status, falling back to selector extraction")
+        except Exception as e:
+            logger.warning(f"Snapshot extraction failed, falling back to selector extraction: {e}")
+        
+        return self.get_status_result_by_selectors()
+            
+    def close_result_popup(self):
+        """Dismiss the result popup once its content has been read"""
         try:
-            # First, wait a bit for any popup to appear
-            self.page.wait_for_timeout(2000)
+            self.page.evaluate(result_extractor.CLOSE_POPUP_SCRIPT)
+        except Exception as e:
+            logger.debug(f"Could not close result popup: {e}")
             
+    def get_status_result_by_selectors(self):
+        """Extract the visa status by querying the result page selector by selector"""
+        try:
             # Check if there's a popup/modal dialog
             # The popup seems to be in an iframe or a modal div
             popup_selectors = [
@@ -694,7 +782,8 @@ def cleanup_expired_sessions():
                     checker = sessions.pop(session_id, None)
                 if checker:
                     try:
-                        checker.close_browser()
+                        # Playwright objects must be closed on the worker that created them
+                        get_browser_workers().call(checker.close_browser, worker_id=checker.worker_id, timeout=60)
                     except:
                         pass
                     print(f"Cleaned up expired session: {session_id}")
@@ -704,9 +793,57 @@ def cleanup_expired_sessions():
             
         time.sleep(60)  # Check every minute
 
-# Start cleanup thread
-cleanup_thread = threading.Thread(target=cleanup_expired_sessions, daemon=True)
-cleanup_thread.start()
+# Browser worker threads, each owning its own Playwright instance; started on first use
+# (or by __main__) so importing this module does not launch browsers
+browser_workers = None
+job_manager = None
+browser_workers_lock = Lock()
+
+def get_browser_workers():
+    """Start the browser workers, and the job manager sharing them, if they are not running yet"""
+    global browser_workers, job_manager
+    with browser_workers_lock:
+        if browser_workers is None:
+            browser_workers = BrowserWorkerPool()
+            # Queued visa checks run on the same browser workers
+            job_manager = JobManager(executor=browser_workers)
+        return browser_workers
+
+def get_job_manager():
+    get_browser_workers()
+    return job_manager
+
+# Cleanup thread, started with the first session
+cleanup_thread = None
+cleanup_thread_lock = Lock()
+
+def ensure_cleanup_thread():
+    """Start the session cleanup thread if it is not running yet"""
+    global cleanup_thread
+    with cleanup_thread_lock:
+        if cleanup_thread is None:
+            cleanup_thread = threading.Thread(target=cleanup_expired_sessions, daemon=True)
+            cleanup_thread.start()
+
+def on_browser_worker(session_affinity=False):
+    """Run a view on a browser worker thread instead of the request thread.
+    
+    With session_affinity the request is sent to the worker that owns the
+    session named by the request's session_id.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            worker_id = None
+            if session_affinity:
+                data = request.get_json(silent=True) or {}
+                with sessions_lock:
+                    checker = sessions.get(data.get('session_id'))
+                if checker:
+                    worker_id = checker.worker_id
+            return get_browser_workers().call(copy_current_request_context(view), *args, worker_id=worker_id, **kwargs)
+        return wrapper
+    return decorator
 
 # Remove global instance
 # visa_checker = VisaStatusChecker()
@@ -714,14 +851,37 @@ cleanup_thread.start()
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
+    # A remote solver is pinged over its socket; keep that outside sessions_lock
+    status = captcha_handler.health()
+    readiness = captcha_handler.readiness()
     with sessions_lock:
-        return jsonify({
-            'status': 'healthy', 
-            'service': 'visa-status-checker',
-            'active_sessions': len(sessions)
-        })
+        active_sessions = len(sessions)
+    return jsonify({
+        'status': status,
+        'service': 'visa-status-checker',
+        'captcha_solver': readiness,
+        'active_sessions': active_sessions,
+        'browser_pools': browser_pool_stats(),
+        'page_pools': page_pool_stats(),
+        'jobs': job_manager.stats() if job_manager else None,
+        'browser_workers': browser_workers.stats() if browser_workers else []
+    })
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Solver and pool metrics"""
+    return jsonify({
+        'captcha': captcha_handler.stats(),
+        'request_policy': request_policy_stats(),
+        'asset_cache': asset_cache_stats(),
+        'storage_state': storage_state_stats(),
+        'browser_pools': browser_pool_stats(),
+        'page_pools': page_pool_stats(),
+        'jobs': job_manager.stats() if job_manager else None
+    })
 
 @app.route('/api/visa-status/start', methods=['POST'])
+@on_browser_worker()
 def start_visa_check():
     """Start the visa status check process"""
     try:
@@ -743,6 +903,7 @@ def start_visa_check():
         with sessions_lock:
             visa_checker = VisaStatusChecker(session_id)
             sessions[session_id] = visa_checker
+        ensure_cleanup_thread()
         
         # Start browser
         visa_checker.start_browser(headless=True)
@@ -793,6 +954,7 @@ def start_visa_check():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/visa-status/submit', methods=['POST'])
+@on_browser_worker(session_affinity=True)
 def submit_visa_check():
     """Submit the CAPTCHA solution and get visa status"""
     try:
@@ -841,6 +1003,7 @@ def submit_visa_check():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/visa-status/cancel', methods=['POST'])
+@on_browser_worker(session_affinity=True)
 def cancel_visa_check():
     """Cancel an active session"""
     try:
@@ -883,6 +1046,7 @@ def list_sessions():
     })
 
 @app.route('/api/visa-status/check', methods=['POST'])
+@on_browser_worker()
 def check_visa_status():
     """All-in-one endpoint if CAPTCHA solution is already known"""
     try:
@@ -905,6 +1069,7 @@ def check_visa_status():
         with sessions_lock:
             visa_checker = VisaStatusChecker(session_id)
             sessions[session_id] = visa_checker
+        ensure_cleanup_thread()
         
         try:
             # Start browser
@@ -958,107 +1123,201 @@ def check_visa_status():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/api/visa-status/check-auto', methods=['POST'])
-def check_visa_status_auto():
-    """Check visa status with automatic CAPTCHA solving"""
+def run_auto_check(location, application_id, passport_number, surname, max_retries=3, engine=CHECK_ENGINE):
+    """Run the full automatic check pipeline and return its result.
+    
+    The 'http' engine posts the form without a browser; when CEAC blocks it or
+    answers with an unexpected page the check is run again in the browser.
+    """
+    if engine == 'http':
+        try:
+            return run_check_with(HttpVisaStatusChecker(str(uuid.uuid4()), auto_solve_captcha=True,
+                                                        captcha_handler=captcha_handler),
+                                  location, application_id, passport_number, surname, max_retries)
+        except HttpEngineBlocked as e:
+            logger.warning(f"HTTP engine blocked, falling back to the browser: {e}")
+    
+    return run_check_with(VisaStatusChecker(str(uuid.uuid4()), auto_solve_captcha=True),
+                          location, application_id, passport_number, surname, max_retries)
+
+def run_check_with(visa_checker, location, application_id, passport_number, surname, max_retries):
+    """Drive one checker (browser or HTTP) through the automatic pipeline"""
+    session_id = visa_checker.session_id
+    with sessions_lock:
+        sessions[session_id] = visa_checker
+    ensure_cleanup_thread()
+    
     try:
-        data = request.json
-        location = data.get('location')
-        application_id = data.get('application_id')
-        passport_number = data.get('passport_number')
-        surname = data.get('surname')
-        max_retries = data.get('max_retries', 3)  # Maximum CAPTCHA retries
-        
-        # Validate inputs
-        if not all([location, application_id, passport_number, surname]):
-            return jsonify({
-                'success': False,
-                'error': 'Missing required fields: location, application_id, passport_number, surname'
-            }), 400
-        
-        # Check if ONNX model is available
-        if not isinstance(captcha_handler, OnnxCaptchaHandle):
-            return jsonify({
-                'success': False,
-                'error': 'Automatic CAPTCHA solving not available. ONNX model not loaded.'
-            }), 400
-            
-        # Create new session
-        session_id = str(uuid.uuid4())
-        with sessions_lock:
-            visa_checker = VisaStatusChecker(session_id, auto_solve_captcha=True)
-            sessions[session_id] = visa_checker
+        # Start browser
+        visa_checker.start_browser(headless=True)
         
-        try:
-            # Start browser
-            visa_checker.start_browser(headless=True)
+        # Navigate and fill form
+        if not visa_checker.navigate_to_visa_status_page():
+            raise Exception('Failed to navigate to visa status page')
             
-            # Navigate and fill form
-            if not visa_checker.navigate_to_visa_status_page():
-                raise Exception('Failed to navigate to visa status page')
-                
-            if not visa_checker.select_nonimmigrant_visa():
-                raise Exception('Failed to select visa type')
-                
-            if not visa_checker.fill_form(location, application_id, passport_number, surname):
-                raise Exception('Failed to fill form')
+        if not visa_checker.select_nonimmigrant_visa():
+            raise Exception('Failed to select visa type')
             
-            # Try to solve CAPTCHA automatically
-            retry_count = 0
-            result = None
+        if not visa_checker.fill_form(location, application_id, passport_number, surname):
+            raise Exception('Failed to fill form')
+        
+        # Try to solve CAPTCHA automatically
+        retry_count = 0
+        refresh_count = 0
+        result = None
+        
+        while retry_count < max_retries:
+            # Get CAPTCHA image bytes
+            captcha_bytes = visa_checker.get_captcha_bytes()
+            if not captcha_bytes:
+                raise Exception('Failed to get CAPTCHA image')
+            
+            # Solve CAPTCHA, ranking candidates by sequence probability
+            candidates = captcha_handler.solve_candidates(captcha_bytes)
+            captcha_solution, probability = candidates[0]
+            
+            # A low-confidence guess is likely wrong; swap the image instead of spending a postback
+            if not is_confident(candidates) and refresh_count < CAPTCHA_MAX_REFRESHES:
+                refresh_count += 1
+                logger.info(f"Low-confidence CAPTCHA guess {captcha_solution!r} ({probability}), "
+                            f"refreshing image ({refresh_count}/{CAPTCHA_MAX_REFRESHES})")
+                if visa_checker.refresh_captcha():
+                    continue
             
-            while retry_count < max_retries:
-                # Get CAPTCHA image
-                captcha_image_base64 = visa_checker.get_captcha_image()
-                if not captcha_image_base64:
-                    raise Exception('Failed to get CAPTCHA image')
-                
-                # Decode base64 to bytes
-                captcha_bytes = base64.b64decode(captcha_image_base64)
-                
-                # Solve CAPTCHA
-                captcha_solution = captcha_handler.solve(captcha_bytes)
-                logger.info(f"CAPTCHA solution attempt {retry_count + 1}: {captcha_solution}")
-                
-                # Submit with CAPTCHA
-                result = visa_checker.submit_with_captcha(captcha_solution)
-                
-                if result['success']:
-                    logger.info("Successfully got visa status")
-                    break
-                elif 'error' in result and 'captcha' in result['error'].lower():
-                    logger.warning(f"CAPTCHA error, retrying... ({retry_count + 1}/{max_retries})")
-                    retry_count += 1
-                    # Refresh the page to get a new CAPTCHA
-                    visa_checker.page.reload()
-                    visa_checker.page.wait_for_timeout(2000)
-                    # Re-fill the form
-                    visa_checker.select_nonimmigrant_visa()
-                    visa_checker.fill_form(location, application_id, passport_number, surname)
-                else:
-                    # Non-CAPTCHA error
-                    break
+            logger.info(f"CAPTCHA solution attempt {retry_count + 1}: {captcha_solution}")
             
-            # Close browser and remove session
-            with sessions_lock:
-                sessions.pop(session_id, None)
-            visa_checker.close_browser()
+            # Submit with CAPTCHA
+            result = visa_checker.submit_with_captcha(captcha_solution)
             
-            if result and result['success']:
-                return jsonify(result)
+            if result['success']:
+                logger.info("Successfully got visa status")
+                break
+            elif 'error' in result and 'captcha' in result['error'].lower():
+                logger.warning(f"CAPTCHA error, retrying... ({retry_count + 1}/{max_retries})")
+                retry_count += 1
+                # Get a new CAPTCHA, keeping the filled form when possible
+                visa_checker.retry_captcha(location, application_id, passport_number, surname)
             else:
-                return jsonify(result if result else {'success': False, 'error': 'Failed after all retries'}), 400
-                
-        except Exception as e:
-            # Clean up on error
-            with sessions_lock:
-                sessions.pop(session_id, None)
-            visa_checker.close_browser()
-            raise e
+                # Non-CAPTCHA error
+                break
+        
+        return result if result else {'success': False, 'error': 'Failed after all retries'}
+        
+    finally:
+        # Close browser and remove session
+        with sessions_lock:
+            sessions.pop(session_id, None)
+        visa_checker.close_browser()
+
+def validate_auto_check_request(data):
+    """Validate a check-auto payload, returning an (error response, status) tuple or None"""
+    if not data or not all([data.get('location'), data.get('application_id'),
+                            data.get('passport_number'), data.get('surname')]):
+        return jsonify({
+            'success': False,
+            'error': 'Missing required fields: location, application_id, passport_number, surname'
+        }), 400
+    
+    if data.get('engine', CHECK_ENGINE) not in CHECK_ENGINES:
+        return jsonify({
+            'success': False,
+            'error': f"Unknown engine; expected one of {', '.join(CHECK_ENGINES)}"
+        }), 400
+    
+    if captcha_handler.state == 'loading':
+        return jsonify({
+            'success': False,
+            'error': 'CAPTCHA solver is still loading, retry shortly'
+        }), 503
+    
+    # Check if ONNX model is available
+    if not captcha_handler.supports_auto_solve:
+        return jsonify({
+            'success': False,
+            'error': 'Automatic CAPTCHA solving not available. ONNX model not loaded.'
+        }), 400
+    
+    return None
+
+@app.route('/api/visa-status/check-auto', methods=['POST'])
+@on_browser_worker()
+def check_visa_status_auto():
+    """Check visa status with automatic CAPTCHA solving"""
+    try:
+        data = request.json
+        error_response = validate_auto_check_request(data)
+        if error_response:
+            return error_response
+        
+        result = run_auto_check(
+            data.get('location'),
+            data.get('application_id'),
+            data.get('passport_number'),
+            data.get('surname'),
+            data.get('max_retries', 3),  # Maximum CAPTCHA retries
+            data.get('engine', CHECK_ENGINE)
+        )
+        
+        if result['success']:
+            return jsonify(result)
+        else:
+            return jsonify(result), 400
             
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/visa-status/jobs', methods=['POST'])
+def submit_visa_check_job():
+    """Queue an automatic visa check and return its job id immediately"""
+    try:
+        data = request.json
+        error_response = validate_auto_check_request(data)
+        if error_response:
+            return error_response
+        
+        job = get_job_manager().submit(
+            run_auto_check,
+            data.get('location'),
+            data.get('application_id'),
+            data.get('passport_number'),
+            data.get('surname'),
+            data.get('max_retries', 3),
+            data.get('engine', CHECK_ENGINE)
+        )
+        
+        return jsonify({
+            'success': True,
+            **job.to_dict(),
+            'message': 'Poll /api/visa-status/jobs/<job_id> for status and /api/visa-status/jobs/<job_id>/result for the result'
+        }), 202
+        
+    except JobQueueFull as e:
+        return jsonify({'success': False, 'error': str(e)}), 429
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/visa-status/jobs/<job_id>', methods=['GET'])
+def get_visa_check_job(job_id):
+    """Get the status of a queued visa check"""
+    job = job_manager.get(job_id) if job_manager else None
+    if not job:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    
+    return jsonify({'success': True, **job.to_dict()})
+
+@app.route('/api/visa-status/jobs/<job_id>/result', methods=['GET'])
+def get_visa_check_job_result(job_id):
+    """Get the result of a finished visa check"""
+    job = job_manager.get(job_id) if job_manager else None
+    if not job:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    
+    if not job.is_finished():
+        return jsonify({'success': False, **job.to_dict(), 'error': 'Job not finished yet'}), 202
+    
+    return jsonify({**job.to_dict(), **job.result})
+
 if __name__ == '__main__':
-    # Run the Flask app with threading disabled to avoid Playwright issues
-    app.run(debug=True, host='0.0.0.0', port=5000, threaded=False)
+    # Warm the browser workers before serving; request threads only dispatch to them
+    get_browser_workers()
+    app.run(debug=True, host='0.0.0.0', port=5000, threaded=True, use_reloader=False)
@@ -0,0 +1,175 @@
+"""Storage-state snapshots used to seed new browser contexts.
+
+Every check starts from a fresh context, so without help each one meets the
+Cloudflare challenge and the CEAC session handshake again. After a navigation
+reaches the NIV form, the manager snapshots the context's storage_state
+(cookies and localStorage). New contexts are created from that snapshot.
+
+A snapshot seeds contexts for STORAGE_STATE_TTL seconds. It is dropped early
+when a context seeded from it is refused upstream (non-200 response, challenge
+that does not clear, or no form), so the next check starts clean and takes a
+new snapshot.
+
+The ASP.NET session cookie is left out by default. ASP.NET serializes requests
+that share a session, and BotDetect keeps CAPTCHA codes in session state, so
+concurrent checks sharing one session would queue behind each other. Set
+STORAGE_STATE_SHARE_SESSION=1 to carry it over as well.
+"""
+import itertools
+import os
+import re
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+STORAGE_STATE_ENABLED = os.environ.get('STORAGE_STATE_ENABLED', '1') == '1'
+STORAGE_STATE_TTL = int(os.environ.get('STORAGE_STATE_TTL', 900))  # Seconds a snapshot may seed new contexts
+STORAGE_STATE_REFRESH = int(os.environ.get('STORAGE_STATE_REFRESH', 300))  # Seconds before a successful navigation snapshots again
+STORAGE_STATE_SHARE_SESSION = os.environ.get('STORAGE_STATE_SHARE_SESSION', '0') == '1'
+
+SESSION_COOKIE_PATTERN = re.compile(r'^(ASP\.NET_SessionId|\.ASPXAUTH)$', re.IGNORECASE)
+
+class StorageSnapshot:
+    _versions = itertools.count(1)
+
+    def __init__(self, state):
+        self.version = next(self._versions)
+        self.state = state
+        self.taken_at = time.monotonic()
+
+    def age(self):
+        return time.monotonic() - self.taken_at
+
+class StorageStateManager:
+    """Holds the latest snapshot; the state is plain data, so every thread and event loop can share it"""
+
+    def __init__(self, ttl=STORAGE_STATE_TTL, refresh=STORAGE_STATE_REFRESH, share_session=STORAGE_STATE_SHARE_SESSION):
+        self.ttl = ttl
+        self.refresh = min(refresh, ttl)
+        self.share_session = share_session
+        self.snapshot = None
+        self.lock = threading.Lock()
+        self.counters = {'snapshots': 0, 'seeded': 0, 'unseeded': 0, 'expired': 0, 'invalidated': 0}
+
+    def _filter(self, state):
+        """Drop expired cookies and, unless shared, the ASP.NET session"""
+        now = time.time()
+        cookies = [cookie for cookie in state.get('cookies', [])
+                   if (cookie.get('expires', -1) < 0 or cookie['expires'] > now)
+                   and (self.share_session or not SESSION_COOKIE_PATTERN.match(cookie.get('name', '')))]
+        return {'cookies': cookies, 'origins': state.get('origins', [])}
+
+    def _current(self):
+        """The snapshot if it is still within its TTL; call with the lock held"""
+        if self.snapshot is not None and self.snapshot.age() > self.ttl:
+            logger.info(f"Storage-state snapshot v{self.snapshot.version} expired")
+            self.snapshot = None
+            self.counters['expired'] += 1
+        return self.snapshot
+
+    def seed(self):
+        """Return (version, context options) for a new context; the options are empty without a snapshot"""
+        with self.lock:
+            snapshot = self._current()
+            if snapshot is None:
+                self.counters['unseeded'] += 1
+                return None, {}
+            self.counters['seeded'] += 1
+        return snapshot.version, {'storage_state': self._filter(snapshot.state)}
+
+    def needs_snapshot(self):
+        with self.lock:
+            snapshot = self._current()
+            return snapshot is None or snapshot.age() > self.refresh
+
+    def store(self, state):
+        snapshot = StorageSnapshot(self._filter(state))
+        with self.lock:
+            self.snapshot = snapshot
+            self.counters['snapshots'] += 1
+        logger.info(f"Stored storage-state snapshot v{snapshot.version} with {len(snapshot.state['cookies'])} cookie(s)")
+        return snapshot.version
+
+    def capture(self, context):
+        """Snapshot a sync context that just reached the form, unless the current snapshot is recent"""
+        if not self.needs_snapshot():
+            return None
+        try:
+            return self.store(context.storage_state())
+        except Exception as e:
+            logger.warning(f"Could not snapshot storage state: {e}")
+            return None
+
+    async def capture_async(self, context):
+        """Snapshot an async context that just reached the form, unless the current snapshot is recent"""
+        if not self.needs_snapshot():
+            return None
+        try:
+            return self.store(await context.storage_state())
+        except Exception as e:
+            logger.warning(f"Could not snapshot storage state: {e}")
+            return None
+
+    def invalidate(self, version, reason):
+        """Drop the snapshot a refused context was seeded from; a newer snapshot is kept"""
+        if version is None:
+            return
+        with self.lock:
+            if self.snapshot is None or self.snapshot.version != version:
+                return
+            self.snapshot = None
+            self.counters['invalidated'] += 1
+        logger.warning(f"Dropped storage-state snapshot v{version}: {reason}")
+
+    def stats(self):
+        with self.lock:
+            snapshot = self.snapshot
+            return {
+                'ttl': self.ttl,
+                'refresh': self.refresh,
+                'share_session': self.share_session,
+                'version': snapshot.version if snapshot else None,
+                'age': round(snapshot.age(), 1) if snapshot else None,
+                'cookies': len(snapshot.state['cookies']) if snapshot else 0,
+                **self.counters
+            }
+
+# One manager per process so every browser pool and event loop seeds from the same snapshot
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_storage_state_manager():
+    """Process-wide manager, or None when disabled"""
+    global _manager
+    if not STORAGE_STATE_ENABLED:
+        return None
+    with _manager_lock:
+        if _manager is None:
+            _manager = StorageStateManager()
+        return _manager
+
+def seed_context_options():
+    """Return (snapshot version, extra new_context options) for a new context"""
+    manager = get_storage_state_manager()
+    return manager.seed() if manager else (None, {})
+
+def capture_storage_state(context):
+    manager = get_storage_state_manager()
+    if manager:
+        manager.capture(context)
+
+async def capture_storage_state_async(context):
+    manager = get_storage_state_manager()
+    if manager:
+        await manager.capture_async(context)
+
+def invalidate_storage_state(version, reason):
+    manager = get_storage_state_manager()
+    if manager:
+        manager.invalidate(version, reason)
+
+def storage_state_stats():
+    manager = get_storage_state_manager()
+    return manager.stats() if manager else {'enabled': False}
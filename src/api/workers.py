@@ -0,0 +1,121 @@
+from concurrent.futures import Future
+import os
+import queue
+import threading
+from threading import Lock
+import logging
+from .browser_pool import close_browser_pool
+from .page_pool import get_page_pool, close_page_pool
+
+logger = logging.getLogger(__name__)
+
+BROWSER_WORKERS = int(os.environ.get('BROWSER_WORKERS', 4))  # Concurrent checks per node
+BROWSER_WORKER_WARM_UP = os.environ.get('BROWSER_WORKER_WARM_UP', '1') == '1'
+
+_current = threading.local()
+
+def current_worker_id():
+    """Id of the browser worker running the calling code, or None outside a worker"""
+    return getattr(_current, 'worker_id', None)
+
+class BrowserWorker(threading.Thread):
+    """A thread that owns its own Playwright instance and runs browser tasks in order"""
+
+    def __init__(self, worker_id, warm_up=BROWSER_WORKER_WARM_UP):
+        super().__init__(name=f'browser-worker-{worker_id}', daemon=True)
+        self.worker_id = worker_id
+        self.warm_up = warm_up
+        self.tasks = queue.Queue()
+        self.pending = 0
+        self.completed = 0
+        self.lock = Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        with self.lock:
+            self.pending += 1
+        self.tasks.put((future, fn, args, kwargs))
+        return future
+
+    def stop(self):
+        self.tasks.put(None)
+
+    def run(self):
+        _current.worker_id = self.worker_id
+        if self.warm_up:
+            try:
+                # Launch the browser and pre-navigate pages before the first task
+                get_page_pool()
+            except Exception as e:
+                logger.error(f"Browser worker {self.worker_id} failed to warm up: {str(e)}")
+
+        while True:
+            item = self.tasks.get()
+            if item is None:
+                break
+            future, fn, args, kwargs = item
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(fn(*args, **kwargs))
+                    except BaseException as e:
+                        future.set_exception(e)
+            finally:
+                with self.lock:
+                    self.pending -= 1
+                    self.completed += 1
+
+        close_page_pool()
+        close_browser_pool()
+
+class BrowserWorkerPool:
+    """Dispatches browser work to dedicated threads, each with its own Playwright.
+
+    Sync Playwright objects can only be used from the thread that created
+    them, so a session's follow-up calls must go back to the worker that
+    started it (see VisaStatusChecker.worker_id).
+    """
+
+    def __init__(self, size=BROWSER_WORKERS, warm_up=BROWSER_WORKER_WARM_UP):
+        self.workers = [BrowserWorker(i, warm_up=warm_up) for i in range(max(1, size))]
+        for worker in self.workers:
+            worker.start()
+
+    def pick(self):
+        """Least loaded worker"""
+        return min(self.workers, key=lambda w: w.pending)
+
+    def submit_to(self, worker_id, fn, *args, **kwargs):
+        """Run fn on a specific worker (or the least loaded one if worker_id is None)"""
+        worker = self.pick() if worker_id is None else self.workers[worker_id]
+        # Already on the target worker: run inline instead of deadlocking on our own queue
+        if current_worker_id() == worker.worker_id:
+            future = Future()
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+            return future
+        return worker.submit(fn, *args, **kwargs)
+
+    def submit(self, fn, *args, **kwargs):
+        """Executor-compatible submit on the least loaded worker"""
+        return self.submit_to(None, fn, *args, **kwargs)
+
+    def call(self, fn, *args, worker_id=None, timeout=None, **kwargs):
+        """Run fn on a worker and wait for its result"""
+        return self.submit_to(worker_id, fn, *args, **kwargs).result(timeout=timeout)
+
+    def shutdown(self):
+        for worker in self.workers:
+            worker.stop()
+        for worker in self.workers:
+            worker.join(timeout=30)
+
+    def stats(self):
+        return [{
+            'worker_id': w.worker_id,
+            'pending': w.pending,
+            'completed': w.completed,
+            'alive': w.is_alive()
+        } for w in self.workers]
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from src.api.captcha_handler import (CTC_BLANK, CTC_CHARACTERS, ctc_beam_search, ctc_greedy_decode,
+                                     is_confident, softmax)
+
+def logits_for(path, peak=8.0):
+    """(T, classes) logits whose argmax follows path, a string over CTC_CHARACTERS ('-' is blank)"""
+    logits = np.zeros((len(path), len(CTC_CHARACTERS)), dtype=np.float32)
+    for t, char in enumerate(path):
+        logits[t, CTC_CHARACTERS.index(char)] = peak
+    return logits
+
+def test_greedy_collapses_repeats_and_drops_blanks():
+    [(text, confidences)] = ctc_greedy_decode(logits_for('--AA-B--BB-7')[np.newaxis])
+    assert text == 'ABB7'
+    assert len(confidences) == 4
+    assert all(0.5 < c <= 1.0 for c in confidences)
+
+def test_greedy_blank_only_and_batch_rows_stay_separate():
+    batch = np.stack([logits_for('------'), logits_for('X--Y-Y'), logits_for('111111')])
+    assert [text for text, _ in ctc_greedy_decode(batch)] == ['', 'XYY', '1']
+
+def test_greedy_runs_do_not_merge_across_batch_rows():
+    # Row 0 ends on 'A' and row 1 starts on 'A': still one 'A' each
+    batch = np.stack([logits_for('--A'), logits_for('A--')])
+    assert [text for text, _ in ctc_greedy_decode(batch)] == ['A', 'A']
+
+@pytest.mark.parametrize('path', ['-A-B-C-', 'AA--BB', '9-99-Z', '-------'])
+def test_beam_search_agrees_with_greedy_on_peaked_logits(path):
+    logits = logits_for(path)
+    greedy = ctc_greedy_decode(logits[np.newaxis])[0][0]
+    candidates = ctc_beam_search(softmax(logits))
+    assert candidates[0][0] == greedy
+    assert candidates == sorted(candidates, key=lambda c: c[1], reverse=True)
+
+def test_beam_search_sums_alignments():
+    # Greedy picks the blank path at every step, but 'A' is more likely over all its alignments
+    probs = np.full((2, len(CTC_CHARACTERS)), 1e-6, dtype=np.float64)
+    a = CTC_CHARACTERS.index('A')
+    probs[:, CTC_BLANK] = 0.4
+    probs[:, a] = 0.35
+    probs /= probs.sum(axis=1, keepdims=True)
+    assert ctc_greedy_decode(np.log(probs)[np.newaxis])[0][0] == ''
+    best, probability = ctc_beam_search(probs)[0]
+    assert best == 'A'
+    assert probability == pytest.approx(probs[0, a] * probs[1, a] + 2 * probs[0, CTC_BLANK] * probs[1, a], rel=1e-6)
+
+def test_is_confident():
+    assert is_confident([('ABC12', 0.9)])
+    assert not is_confident([('ABC12', 0.2)])
+    assert is_confident([('ABC12', None)])
+    assert not is_confident([('', 0.99)])
+    assert not is_confident([])
@@ -0,0 +1,115 @@
+import types
+
+import pytest
+
+pytest.importorskip('requests')
+pytest.importorskip('playwright')
+
+from src.api import http_checker
+from src.api.http_checker import FormPage, HttpVisaStatusChecker
+
+URL = 'https://ceac.state.gov/ceacstattracker/status.aspx?App=NIV'
+
+STATUS_FORM = """<html><head><title>CEAC</title>
+<script>var markup = "<div class='modal'>Issued</div>";</script></head><body>
+<form method="post" action="./status.aspx?App=NIV" id="aspnetForm">
+<input type="hidden" name="__EVENTTARGET" id="__EVENTTARGET" value="" />
+<input type="hidden" name="__VIEWSTATE" id="__VIEWSTATE" value="dDwtMTA4&amp;x" />
+<input type="hidden" name="__VIEWSTATEGENERATOR" id="__VIEWSTATEGENERATOR" value="C2EE9ABB">
+<input type="hidden" name="__EVENTVALIDATION" id="__EVENTVALIDATION" value="/wEdAAk=" />
+<input type="checkbox" name="ctl00$remember" value="on">
+<input type="radio" name="ctl00$kind" value="niv" checked>
+<select name="ctl00$ContentPlaceHolder1$Location_Dropdown" id="ctl00_ContentPlaceHolder1_Location_Dropdown">
+  <option value="">- SELECT ONE -</option>
+  <option value="SYD">AUSTRALIA, SYDNEY</option>
+</select>
+<input name="ctl00$ContentPlaceHolder1$Visa_Case_Number" type="text" id="ctl00_ContentPlaceHolder1_Visa_Case_Number">
+<input name="ctl00$ContentPlaceHolder1$Passport_Number" type="text" id="ctl00_ContentPlaceHolder1_Passport_Number">
+<input name="ctl00$ContentPlaceHolder1$Surname" type="text" id="ctl00_ContentPlaceHolder1_Surname">
+<img id="c_status_ctl00_contentplaceholder1_defaultcaptcha_CaptchaImage"
+     src="/ceacstattracker/BotDetectCaptcha.ashx?get=image&amp;c=c_status&amp;t=abc&amp;d=1">
+<input name="ctl00$ContentPlaceHolder1$Captcha" type="text" id="ctl00_ContentPlaceHolder1_Captcha">
+<input type="submit" name="ctl00$ContentPlaceHolder1$btnSubmit" value="Submit" id="ctl00_ContentPlaceHolder1_btnSubmit">
+<div class="modal" style="display: none">Issued</div>
+</form></body></html>"""
+
+RESULT_PAGE = """<html><body><form action="./status.aspx?App=NIV">
+<div id="dialog1" role="dialog"><h3>Administrative Processing</h3>
+<p>Application ID or Case Number:<br>AA00EILA2X</p></div>
+<span id="ctl00_ContentPlaceHolder1_ucApplicationStatusView_lblStatus">Administrative Processing</span>
+</form></body></html>"""
+
+def test_form_data_collects_hidden_and_checked_fields():
+    page = FormPage(STATUS_FORM, URL)
+    data = page.form_data()
+    assert data['__VIEWSTATE'] == 'dDwtMTA4&x'
+    assert data['__VIEWSTATEGENERATOR'] == 'C2EE9ABB'
+    assert data['__EVENTVALIDATION'] == '/wEdAAk='
+    assert data['__EVENTTARGET'] == ''
+    assert data['ctl00$kind'] == 'niv'
+    assert 'ctl00$remember' not in data
+    # Submit buttons are only posted when they are the one clicked
+    assert 'ctl00$ContentPlaceHolder1$btnSubmit' not in data
+    # A select without a selected option posts its first option
+    assert data['ctl00$ContentPlaceHolder1$Location_Dropdown'] == ''
+
+def test_form_controls_and_captcha_image():
+    page = FormPage(STATUS_FORM, URL)
+    assert page.form_action == './status.aspx?App=NIV'
+    assert page.captcha_src == '/ceacstattracker/BotDetectCaptcha.ashx?get=image&c=c_status&t=abc&d=1'
+    assert page.find_input('Captcha')['name'] == 'ctl00$ContentPlaceHolder1$Captcha'
+    options = page.find_select('Location_Dropdown')['options']
+    assert [(o['value'], o['text'].strip()) for o in options] == [('', '- SELECT ONE -'), ('SYD', 'AUSTRALIA, SYDNEY')]
+
+def test_snapshot_ignores_hidden_popups_and_scripts():
+    assert FormPage(STATUS_FORM, URL).snapshot()['popup'] is None
+
+def test_result_snapshot():
+    snapshot = FormPage(RESULT_PAGE, URL).snapshot()
+    assert snapshot['popup']['selector'] == 'div[role="dialog"]'
+    assert snapshot['popup']['text'].splitlines() == [
+        'Administrative Processing', 'Application ID or Case Number:', 'AA00EILA2X']
+    assert snapshot['labels'] == {'ctl00_ContentPlaceHolder1_ucApplicationStatusView_lblStatus': 'Administrative Processing'}
+
+def fake_response(html):
+    return types.SimpleNamespace(text=html, url=URL, headers={'content-type': 'text/html'}, status_code=200)
+
+# A rejected answer comes back on a fresh form with a new CAPTCHA
+REJECTED_FORM = STATUS_FORM.replace('t=abc', 't=def').replace(
+    '</form>', '<span id="ctl00_ContentPlaceHolder1_lblError">The CAPTCHA code you entered is incorrect</span></form>')
+
+def test_retry_reuses_the_form_returned_with_a_rejected_captcha(monkeypatch):
+    checker = HttpVisaStatusChecker('session')
+    checker.start_browser()
+    requests_sent = []
+
+    def fake_request(method, url, **kwargs):
+        requests_sent.append(method)
+        return fake_response(STATUS_FORM if method == 'GET' else REJECTED_FORM)
+
+    monkeypatch.setattr(checker, '_request', fake_request)
+    monkeypatch.setattr(http_checker.location_index, 'get_cached_index', lambda: None)
+    monkeypatch.setattr(http_checker.location_index, 'store_index',
+                        lambda options: http_checker.location_index.LocationIndex(options))
+    checker.navigate_to_visa_status_page()
+    assert checker.fill_form('Sydney', 'AA00EILA2X', 'N1234567', 'DOE')
+
+    result = checker.submit_with_captcha('ABC12')
+    assert result['success'] is False
+    assert 'captcha' in result['error'].lower()
+
+    assert checker.retry_captcha('Sydney', 'AA00EILA2X', 'N1234567', 'DOE')
+    assert requests_sent == ['GET', 'POST']
+    assert 't=def' in checker.page.captcha_src
+    checker.close_browser()
+
+def test_close_keeps_the_shared_connection_pool(monkeypatch):
+    closed = []
+    monkeypatch.setattr(http_checker._adapter, 'close', lambda: closed.append(True))
+    checker = HttpVisaStatusChecker('session')
+    checker.start_browser()
+    checker.http.cookies.set('ASP.NET_SessionId', 'abc')
+    session = checker.http
+    checker.close_browser()
+    assert closed == []
+    assert len(session.cookies) == 0
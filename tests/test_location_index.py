@@ -0,0 +1,54 @@
+import time
+
+from src.api import location_index
+from src.api.location_index import LocationIndex, normalize_location
+
+OPTIONS = [
+    {'value': '', 'text': '- SELECT ONE -'},
+    {'value': 'CHN', 'text': 'INDIA, CHENNAI (MADRAS)'},
+    {'value': 'MBM', 'text': 'INDIA, MUMBAI (BOMBAY)'},
+    {'value': 'SYD', 'text': 'AUSTRALIA, SYDNEY'},
+    {'value': 'SPL', 'text': 'BRAZIL, SÃO PAULO'}
+]
+
+def test_normalize_location():
+    assert normalize_location('  São-Paulo, Brazil ') == 'SAO PAULO BRAZIL'
+    assert normalize_location(None) == ''
+
+def test_lookup_by_label_value_and_alias():
+    index = LocationIndex(OPTIONS)
+    assert index.lookup('India, Chennai (Madras)') == 'CHN'
+    assert index.lookup('chn') == 'CHN'
+    assert index.lookup('Madras') == 'CHN'
+    assert index.lookup('Bombay') == 'MBM'
+    assert index.lookup('Sao Paulo') == 'SPL'
+
+def test_lookup_falls_back_to_containment():
+    assert LocationIndex(OPTIONS).lookup('SYDN') == 'SYD'
+
+def test_lookup_misses_and_placeholder():
+    index = LocationIndex(OPTIONS)
+    assert index.lookup('Atlantis') is None
+    assert index.lookup('') is None
+    assert index.label_for('') is None
+    assert index.label_for('SYD') == 'AUSTRALIA, SYDNEY'
+
+def test_store_reload_and_rebuild(tmp_path, monkeypatch):
+    path = str(tmp_path / 'index.json')
+    monkeypatch.setattr(location_index, '_index', None)
+    location_index.store_index(OPTIONS, path=path)
+
+    # A fresh process finds the persisted index
+    monkeypatch.setattr(location_index, '_index', None)
+    assert location_index.get_cached_index(path=path).lookup('Sydney') == 'SYD'
+
+    # Stale indexes are not served
+    monkeypatch.setattr(location_index, '_index', None)
+    assert location_index.get_cached_index(ttl=-1, path=path) is None
+
+    # Invalidation drops memory and disk, and the next store rebuilds from new options
+    location_index.invalidate_index(path=path)
+    assert location_index.get_cached_index(path=path) is None
+    rebuilt = location_index.store_index(OPTIONS + [{'value': 'PRT', 'text': 'AUSTRALIA, PERTH'}], path=path)
+    assert rebuilt.lookup('Perth') == 'PRT'
+    assert rebuilt.built_at <= time.time()
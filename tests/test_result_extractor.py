@@ -0,0 +1,54 @@
+from src.api.result_extractor import parse_status_snapshot
+
+def snapshot(popup=None, frames=None, labels=None, errors=None):
+    return {
+        'popup': {'selector': 'div[role="dialog"]', 'text': popup} if popup is not None else None,
+        'frames': frames or [],
+        'labels': labels or {},
+        'errors': errors or []
+    }
+
+def test_popup_heading_and_fields():
+    result = parse_status_snapshot(snapshot(popup='\n'.join([
+        'Administrative Processing',
+        'Application ID or Case Number: AA00EILA2X',
+        'Case Created:',
+        '08-Jul-2025',
+        'Case Last Updated: 10-Jul-2025',
+        'Your case is undergoing necessary administrative processing.'
+    ])))
+    assert result == {'success': True, 'data': {
+        'status': 'Administrative Processing',
+        'case_number': 'AA00EILA2X',
+        'case_created': '08-Jul-2025',
+        'case_last_updated': '10-Jul-2025',
+        'description': 'Your case is undergoing necessary administrative processing.'
+    }}
+
+def test_labels_take_precedence_over_popup_text():
+    result = parse_status_snapshot(snapshot(
+        popup='Refused',
+        labels={'ctl00_ContentPlaceHolder1_ucApplicationStatusView_lblStatus': 'Issued\n',
+                'ctl00_ContentPlaceHolder1_ucApplicationStatusView_lblCaseNo': 'AA00EILA2X'}))
+    assert result['data']['status'] == 'Issued'
+    assert result['data']['case_number'] == 'AA00EILA2X'
+
+def test_status_embedded_in_sentence():
+    result = parse_status_snapshot(snapshot(popup='Your visa is Ready for pickup at the embassy'))
+    assert result['data']['status'] == 'Ready'
+
+def test_status_words_inside_other_words_do_not_match():
+    assert parse_status_snapshot(snapshot(popup='Your passport was already reissued last year')) is None
+    assert parse_status_snapshot(snapshot(frames=['You have already submitted this form'])) is None
+
+def test_frame_text_is_used_only_when_it_names_a_status():
+    result = parse_status_snapshot(snapshot(frames=['Navigation help', 'Status\nIn Transit']))
+    assert result['data']['status'] == 'In Transit'
+
+def test_errors_are_reported():
+    result = parse_status_snapshot(snapshot(errors=['The code you entered does not match', 'Try again']))
+    assert result == {'success': False, 'error': 'The code you entered does not match Try again'}
+
+def test_empty_snapshot_falls_back():
+    assert parse_status_snapshot(None) is None
+    assert parse_status_snapshot(snapshot()) is None
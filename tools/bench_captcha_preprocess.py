@@ -0,0 +1,78 @@
+"""Measure per-image CAPTCHA preprocessing cost, before and after the fast path.
+
+"legacy" is the original per-call pipeline (PIL decode, Lanczos resize to
+200x50, float32 conversion, divide, transpose and stack); "fast" is
+preprocess_captcha_images writing into a reused NCHW buffer. Synthetic
+images cover the sizes and modes seen from screenshots and network captures.
+
+Run from the repository root with:
+    python -m tools.bench_captcha_preprocess --iterations 500
+"""
+import argparse
+import time
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from src.api.captcha_handler import (MODEL_INPUT_CHANNELS, MODEL_INPUT_HEIGHT, MODEL_INPUT_WIDTH,
+                                     preprocess_captcha_images)
+
+# name -> (size, mode, format)
+CASES = {
+    'png-200x50-rgb': ((200, 50), 'RGB', 'PNG'),
+    'jpeg-200x50-rgb': ((200, 50), 'RGB', 'JPEG'),
+    'png-205x52-rgba': ((205, 52), 'RGBA', 'PNG'),
+    'png-200x50-gray': ((200, 50), 'L', 'PNG'),
+    'jpeg-250x50-rgb': ((250, 50), 'RGB', 'JPEG'),
+    'png-400x100-rgb': ((400, 100), 'RGB', 'PNG'),
+}
+
+def make_image(size, mode, fmt, seed=0):
+    rng = np.random.default_rng(seed)
+    width, height = size
+    channels = {'L': 1, 'RGB': 3, 'RGBA': 4}[mode]
+    pixels = rng.integers(0, 256, (height, width, channels), dtype=np.uint8)
+    if mode == 'RGBA':
+        pixels[..., 3] = 255
+    buffer = BytesIO()
+    Image.fromarray(pixels[..., 0] if mode == 'L' else pixels, mode).save(buffer, fmt)
+    return buffer.getvalue()
+
+def legacy_preprocess(images):
+    arrays = []
+    for image in images:
+        img = Image.open(BytesIO(image)).convert('RGB')
+        img = img.resize((MODEL_INPUT_WIDTH, MODEL_INPUT_HEIGHT), Image.Resampling.LANCZOS)
+        img_array = np.asarray(img, dtype=np.float32) / 255.0
+        arrays.append(np.transpose(img_array, (2, 0, 1)))
+    return np.stack(arrays)
+
+def per_image_us(fn, images, iterations):
+    fn(images)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn(images)
+    return (time.perf_counter() - start) / (iterations * len(images)) * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--batch-size', type=int, default=8)
+    args = parser.parse_args()
+
+    buffer = np.empty((args.batch_size, MODEL_INPUT_CHANNELS, MODEL_INPUT_HEIGHT, MODEL_INPUT_WIDTH),
+                      dtype=np.float32)
+    fast = lambda images: preprocess_captcha_images(images, out=buffer[:len(images)])
+
+    print(f"{'case':<18} {'batch':>5} {'legacy us':>10} {'fast us':>10} {'speedup':>8} {'max diff':>9}")
+    for name, (size, mode, fmt) in CASES.items():
+        for batch_size in (1, args.batch_size):
+            images = [make_image(size, mode, fmt, seed) for seed in range(batch_size)]
+            legacy = per_image_us(legacy_preprocess, images, args.iterations)
+            new = per_image_us(fast, images, args.iterations)
+            diff = np.abs(legacy_preprocess(images) - fast(images)).max()
+            print(f"{name:<18} {batch_size:>5} {legacy:>10.1f} {new:>10.1f} {legacy / new:>7.2f}x {diff:>9.4f}")
+
+if __name__ == '__main__':
+    main()
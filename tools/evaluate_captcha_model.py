@@ -0,0 +1,94 @@
+"""Compare CAPTCHA model variants on a labeled corpus and gate on accuracy.
+
+Every image in the corpus directory is solved by the reference and the
+candidate model. The report gives exact-match accuracy, character accuracy,
+per-image latency and file size for each model. The exit status is non-zero
+when the candidate's accuracy falls more than --max-accuracy-drop below the
+reference. Labels come from the file name (A1B2C3.png or A1B2C3_017.png) or
+from a labels.csv of "filename,label" rows in the corpus directory.
+
+Run from the repository root with:
+    python -m tools.evaluate_captcha_model corpus/ --candidate captcha.int8.onnx
+"""
+import argparse
+import csv
+import os
+import time
+
+import numpy as np
+
+from src.api.captcha_handler import OnnxCaptchaHandle
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp')
+
+def load_corpus(corpus_dir):
+    """Return a list of (image bytes, label)"""
+    labels_path = os.path.join(corpus_dir, 'labels.csv')
+    if os.path.exists(labels_path):
+        with open(labels_path, newline='') as f:
+            labels = {row[0]: row[1] for row in csv.reader(f) if len(row) >= 2}
+    else:
+        labels = {name: os.path.splitext(name)[0].split('_')[0]
+                  for name in os.listdir(corpus_dir) if name.lower().endswith(IMAGE_EXTENSIONS)}
+
+    corpus = []
+    for name in sorted(labels):
+        with open(os.path.join(corpus_dir, name), 'rb') as f:
+            corpus.append((f.read(), labels[name].strip().upper()))
+    if not corpus:
+        raise SystemExit(f"No labeled images found in {corpus_dir}")
+    return corpus
+
+def character_matches(prediction, label):
+    return sum(p == l for p, l in zip(prediction, label))
+
+def evaluate(model_path, corpus):
+    # Bypass the optimized-model cache: CAPTCHA_ORT_OPTIMIZED_MODEL_PATH names one file, so both models would load it
+    handle = OnnxCaptchaHandle(model_path, optimized_model_path='')
+    handle.solve_batch([corpus[0][0]])  # warm up
+    latencies, predictions = [], []
+    for image, _ in corpus:
+        started = time.perf_counter()
+        predictions.append(handle.solve_batch([image])[0])
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    labels = [label for _, label in corpus]
+    latencies = np.array(latencies)
+    return {
+        'predictions': predictions,
+        'accuracy': np.mean([p == l for p, l in zip(predictions, labels)]),
+        'char_accuracy': sum(character_matches(p, l) for p, l in zip(predictions, labels)) / sum(map(len, labels)),
+        'mean_ms': latencies.mean(),
+        'p95_ms': np.percentile(latencies, 95),
+        'size_mb': os.path.getsize(model_path) / 1e6
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('corpus', help='Directory of labeled CAPTCHA images')
+    parser.add_argument('--reference', default='captcha.onnx', help='Baseline model')
+    parser.add_argument('--candidate', default='captcha.int8.onnx', help='Model under evaluation')
+    parser.add_argument('--max-accuracy-drop', type=float, default=0.005,
+                        help='Largest tolerated exact-match accuracy loss, as a fraction')
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    reference = evaluate(args.reference, corpus)
+    candidate = evaluate(args.candidate, corpus)
+    agreement = np.mean([r == c for r, c in zip(reference['predictions'], candidate['predictions'])])
+
+    print(f"{len(corpus)} images")
+    print(f"{'model':<10} {'accuracy':>9} {'chars':>7} {'mean ms':>8} {'p95 ms':>7} {'MB':>6}")
+    for name, result in (('reference', reference), ('candidate', candidate)):
+        print(f"{name:<10} {result['accuracy']:>9.2%} {result['char_accuracy']:>7.2%} "
+              f"{result['mean_ms']:>8.2f} {result['p95_ms']:>7.2f} {result['size_mb']:>6.1f}")
+    print(f"accuracy delta {candidate['accuracy'] - reference['accuracy']:+.2%}, "
+          f"latency delta {candidate['mean_ms'] - reference['mean_ms']:+.2f} ms, "
+          f"prediction agreement {agreement:.2%}")
+
+    if reference['accuracy'] - candidate['accuracy'] > args.max_accuracy_drop:
+        raise SystemExit("FAIL: candidate accuracy dropped more than the allowed margin")
+    print("PASS")
+
+if __name__ == '__main__':
+    main()
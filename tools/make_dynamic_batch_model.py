@@ -0,0 +1,66 @@
+"""Rewrite the CAPTCHA model so it accepts a batch of images per run.
+
+The bundled captcha.onnx is exported with its batch dimension fixed to 1
+(input [1, 3, 50, 200], and a Reshape to [1, -1, 12] before the LSTMs).
+This makes the batch dimension symbolic and the Reshape copy it from its
+input, so BatchingCaptchaHandle can run a whole batch in one call.
+
+Needs the onnx package from requirements-dev.txt. Run with:
+    python tools/make_dynamic_batch_model.py captcha.onnx captcha_batched.onnx
+"""
+import argparse
+
+import numpy as np
+import onnx
+from onnx import numpy_helper
+
+def make_dynamic_batch(model):
+    model.graph.input[0].type.tensor_type.shape.dim[0].dim_param = 'batch'
+    # Outputs are (timesteps, batch, classes)
+    model.graph.output[0].type.tensor_type.shape.dim[1].dim_param = 'batch'
+
+    initializers = {init.name: init for init in model.graph.initializer}
+    patched = 0
+    for node in model.graph.node:
+        if node.op_type != 'Reshape' or node.input[1] not in initializers:
+            continue
+        shape = numpy_helper.to_array(initializers[node.input[1]])
+        if len(shape) and shape[0] == 1:
+            # 0 means "copy this dimension from the input", i.e. keep the batch size
+            new_shape = np.array([0] + list(shape[1:]), dtype=np.int64)
+            initializers[node.input[1]].CopyFrom(numpy_helper.from_array(new_shape, node.input[1]))
+            patched += 1
+    # Stale shape annotations would pin the batch dimension again
+    del model.graph.value_info[:]
+    return patched
+
+def verify(source_path, target_path, batch_size=4):
+    import onnxruntime as ort
+
+    images = np.random.rand(batch_size, 3, 50, 200).astype(np.float32)
+    batched = ort.InferenceSession(target_path).run(None, {'input': images})[0]
+    single = ort.InferenceSession(source_path)
+    for i in range(batch_size):
+        expected = single.run(None, {'input': images[i:i + 1]})[0]
+        if not np.allclose(expected[:, 0], batched[:, i], atol=1e-4):
+            raise SystemExit(f"Batched output differs from single-image output for image {i}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('source', help='Fixed-batch model, e.g. captcha.onnx')
+    parser.add_argument('target', help='Where to write the dynamic-batch model')
+    parser.add_argument('--skip-verify', action='store_true', help='Do not compare outputs with the source model')
+    args = parser.parse_args()
+
+    model = onnx.load(args.source)
+    patched = make_dynamic_batch(model)
+    onnx.checker.check_model(model)
+    onnx.save(model, args.target)
+    print(f"Wrote {args.target} ({patched} reshape(s) patched)")
+
+    if not args.skip_verify:
+        verify(args.source, args.target)
+        print("Batched outputs match the source model")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Write an INT8 quantized variant of the CAPTCHA model.
+
+Dynamic quantization stores the Conv, MatMul and LSTM weights as INT8 and
+quantizes activations on the fly, so it needs no data; on CPUs without fast
+integer convolution kernels restrict it with --op-types MatMul LSTM. Static
+quantization also fixes activation ranges ahead of time from a directory of
+CAPTCHA images and is usually the faster of the two.
+The server loads the result with CAPTCHA_MODEL_VARIANT=int8 when it sits next
+to the float model as <name>.int8.onnx. Check it with
+tools/evaluate_captcha_model.py before switching.
+
+Needs the onnx package from requirements-dev.txt. Run from the repository root with:
+    python -m tools.quantize_captcha_model captcha.onnx captcha.int8.onnx
+    python -m tools.quantize_captcha_model captcha.onnx captcha.int8.onnx --mode static --calibration-dir corpus/
+"""
+import argparse
+import os
+
+from onnxruntime.quantization import (CalibrationDataReader, QuantFormat, QuantType,
+                                      quantize_dynamic, quantize_static)
+
+from src.api.captcha_handler import preprocess_captcha_images
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp')
+
+class CaptchaCalibrationReader(CalibrationDataReader):
+    """Feeds preprocessed CAPTCHA images to the static quantizer one at a time"""
+
+    def __init__(self, image_dir, limit=None):
+        paths = sorted(os.path.join(image_dir, name) for name in os.listdir(image_dir)
+                       if name.lower().endswith(IMAGE_EXTENSIONS))
+        if not paths:
+            raise SystemExit(f"No calibration images found in {image_dir}")
+        self.paths = iter(paths[:limit] if limit else paths)
+
+    def get_next(self):
+        path = next(self.paths, None)
+        if path is None:
+            return None
+        with open(path, 'rb') as f:
+            return {'input': preprocess_captcha_images([f.read()])}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('source', help='Float model, e.g. captcha.onnx')
+    parser.add_argument('target', help='Where to write the quantized model, e.g. captcha.int8.onnx')
+    parser.add_argument('--mode', choices=('dynamic', 'static'), default='dynamic')
+    parser.add_argument('--calibration-dir', help='CAPTCHA images used to calibrate activations (static mode)')
+    parser.add_argument('--calibration-limit', type=int, default=200, help='Max calibration images')
+    parser.add_argument('--per-channel', action='store_true', help='Quantize weights per output channel')
+    parser.add_argument('--op-types', nargs='+', help='Only quantize these operators, e.g. MatMul LSTM')
+    args = parser.parse_args()
+
+    if args.mode == 'dynamic':
+        quantize_dynamic(args.source, args.target, weight_type=QuantType.QInt8, per_channel=args.per_channel,
+                         op_types_to_quantize=args.op_types)
+    else:
+        if not args.calibration_dir:
+            parser.error('--calibration-dir is required for static quantization')
+        quantize_static(args.source, args.target,
+                        CaptchaCalibrationReader(args.calibration_dir, args.calibration_limit),
+                        quant_format=QuantFormat.QDQ, activation_type=QuantType.QUInt8,
+                        weight_type=QuantType.QInt8, per_channel=args.per_channel,
+                        op_types_to_quantize=args.op_types)
+
+    source_mb = os.path.getsize(args.source) / 1e6
+    target_mb = os.path.getsize(args.target) / 1e6
+    print(f"Wrote {args.target} ({args.mode}): {source_mb:.1f} MB -> {target_mb:.1f} MB")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""Check that the NIV form still submits with the request policy enforced.
+
+Runs the same automatic check against the live site twice: once with routing
+off and once under the profile. It then prints the outcome, the duration and
+the per-rule counters for each run. The profile passes when both runs end the
+same way: the same status, or the same site error for made-up case details.
+A profile that breaks the postback usually fails earlier ("Failed to fill
+form", no CAPTCHA image) or never renders the result.
+
+Run from the repository root with:
+    python -m tools.validate_request_policy --location "SYDNEY" --application-id AA0012345 \\
+        --passport-number N1234567 --surname DOE --allow stylesheets
+"""
+import argparse
+import json
+import os
+import time
+
+# Checks run on this thread (importing the server starts no browser workers), with no
+# pre-warmed pages and the model loaded up front
+os.environ.setdefault('PAGE_POOL_SIZE', '0')
+os.environ.setdefault('CAPTCHA_LOAD_MODE', 'eager')
+
+from src.api import server
+from src.api.request_policy import RequestPolicy, set_request_policy
+
+def run_check(mode, args):
+    policy = RequestPolicy(mode=mode, allow=args.allow)
+    set_request_policy(policy)
+    started = time.monotonic()
+    try:
+        result = server.run_auto_check(args.location, args.application_id, args.passport_number, args.surname)
+    except Exception as e:
+        result = {'success': False, 'error': str(e)}
+    return result, time.monotonic() - started, policy.stats()
+
+def outcome(result):
+    # run_auto_check nests the parsed fields under 'data'
+    return (result.get('success'), (result.get('data') or {}).get('status') or result.get('error'))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--location', required=True)
+    parser.add_argument('--application-id', required=True)
+    parser.add_argument('--passport-number', required=True)
+    parser.add_argument('--surname', required=True)
+    parser.add_argument('--allow', nargs='*', default=[], help='Block rules to allow, e.g. stylesheets images')
+    args = parser.parse_args()
+
+    baseline, baseline_seconds, _ = run_check('off', args)
+    profiled, profiled_seconds, stats = run_check('enforce', args)
+
+    print(f"baseline: {outcome(baseline)} in {baseline_seconds:.1f}s")
+    print(f"profile:  {outcome(profiled)} in {profiled_seconds:.1f}s")
+    print(f"blocked {stats['blocked']} request(s), allowed {stats['allowed']}")
+    print(json.dumps(stats['rules'], indent=2))
+
+    if outcome(baseline) != outcome(profiled):
+        raise SystemExit("FAIL: the form behaves differently under the request policy")
+    print("PASS")
+
+if __name__ == '__main__':
+    main()